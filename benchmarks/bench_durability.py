@@ -0,0 +1,59 @@
+"""
+Benchmark copy throughput for each durability mode.
+
+Copies a tree of small files with FileCopier under durability none, batch
+and per-file, reporting files/s and MB/s. Run it against the target
+filesystem, since sync costs vary widely between devices.
+
+Usage:
+    python -m benchmarks.bench_durability [--files 2000] [--size 16K] [--dir /mnt/target]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from benchmarks.bench_hasher import parse_size
+from src.copier import FileCopier, DURABILITY_MODES
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--files', type=int, default=2000)
+    parser.add_argument('--size', default='16K', help='Size of each file (e.g. 4K, 1M)')
+    parser.add_argument('--dir', default=None, help='Directory on the filesystem to test')
+    args = parser.parse_args()
+    
+    size = parse_size(args.size)
+    
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmpdir:
+        source = Path(tmpdir) / 'source'
+        source.mkdir()
+        payload = os.urandom(size)
+        for i in range(args.files):
+            (source / f"file_{i:06d}.bin").write_bytes(payload)
+        
+        print(f"{'durability':<10} {'files/s':>10} {'MB/s':>10}")
+        for mode in DURABILITY_MODES:
+            dest = Path(tmpdir) / f"dest_{mode}"
+            copier = FileCopier({'sync': {'durability': mode}})
+            
+            start = time.perf_counter()
+            for path in source.iterdir():
+                copier.copy(path, dest / path.name)
+            copier.flush()
+            elapsed = time.perf_counter() - start
+            
+            total_mb = args.files * size / 1024 ** 2
+            print(f"{mode:<10} {args.files / elapsed:>10.1f} {total_mb / elapsed:>10.1f}")
+            shutil.rmtree(dest)
+
+
+if __name__ == '__main__':
+    main()
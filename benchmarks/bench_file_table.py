@@ -0,0 +1,82 @@
+"""
+Benchmark scan memory: list of Paths vs FileTable.
+
+Builds a source and destination tree, then measures peak traced memory
+and time for the previous approach (scan() lists plus relative_to() sets,
+as SyncEngine used to build) and for two FileTables compared by merge.
+
+Usage:
+    python -m benchmarks.bench_file_table [--files 200000] [--per-dir 500] [--dir /tmp]
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.file_scanner import FileScanner
+
+
+def make_tree(root: Path, files: int, per_dir: int) -> None:
+    """Create empty files spread over directories of per_dir files each."""
+    for i in range(files):
+        directory = root / f"dir_{i // per_dir:05d}" / f"sub_{i // per_dir % 7}"
+        if i % per_dir == 0:
+            directory.mkdir(parents=True, exist_ok=True)
+        (directory / f"file_{i:08d}.dat").touch()
+
+
+def path_lists(scanner: FileScanner, source: Path, dest: Path) -> int:
+    """Previous approach: Path lists and hashed relative_to() sets."""
+    source_files = scanner.scan(source)
+    dest_files = scanner.scan(dest)
+    source_relative = {f.relative_to(source) for f in source_files}
+    dest_relative = {f.relative_to(dest) for f in dest_files}
+    return len(dest_relative - source_relative)
+
+
+def file_tables(scanner: FileScanner, source: Path, dest: Path) -> int:
+    """FileTable approach: two sorted tables and one merge pass."""
+    source_table = scanner.scan_table(source)
+    dest_table = scanner.scan_table(dest)
+    return sum(1 for _, i, _ in source_table.merge(dest_table) if i is None)
+
+
+def measure(func, *args) -> tuple:
+    """Return (seconds, peak traced bytes) for one call of func."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--files', type=int, default=200000)
+    parser.add_argument('--per-dir', type=int, default=500)
+    parser.add_argument('--dir', default=None, help='Directory for the test trees')
+    args = parser.parse_args()
+    
+    scanner = FileScanner({'exclude': [], 'include': ['*']})
+    
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmpdir:
+        source, dest = Path(tmpdir) / 'source', Path(tmpdir) / 'dest'
+        make_tree(source, args.files, args.per_dir)
+        make_tree(dest, args.files, args.per_dir)
+        
+        print(f"{args.files} files per tree")
+        print(f"{'approach':<12} {'seconds':>10} {'peak MiB':>10} {'bytes/file':>12}")
+        for name, func in [('path lists', path_lists), ('file table', file_tables)]:
+            elapsed, peak = measure(func, scanner, source, dest)
+            print(f"{name:<12} {elapsed:>10.2f} {peak / 1024 ** 2:>10.1f} {peak / (2 * args.files):>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark CLI startup time.
+
+Runs the CLI in fresh interpreters and reports wall-clock time per
+invocation, then runs it once under `python -X importtime` and lists the
+modules with the largest cumulative import time. Use it to catch changes
+that pull heavy subsystems back into every invocation.
+
+Usage:
+    python -m benchmarks.bench_startup [--runs 20] [--top 15] [--config config.yaml]
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+
+def run_cli(args: list, importtime: bool = False) -> subprocess.CompletedProcess:
+    """Run the CLI in a fresh interpreter from the repository root."""
+    command = [sys.executable]
+    if importtime:
+        command += ['-X', 'importtime']
+    command += ['-m', 'src.cli'] + args
+    return subprocess.run(command, cwd=ROOT, capture_output=True, text=True)
+
+
+def parse_importtime(stderr: str) -> list:
+    """Return (cumulative microseconds, module) pairs from -X importtime output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        rows.append((int(cumulative), module.rstrip()))
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--top', type=int, default=15, help='Slowest imports to list')
+    parser.add_argument('--config', default=None, help='Config file to load on startup')
+    args = parser.parse_args()
+    
+    cli_args = (['--config', args.config] if args.config else []) + ['status', '.']
+    
+    # Warm-up run also populates the parsed config cache
+    run_cli(cli_args)
+    
+    timings = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        run_cli(cli_args)
+        timings.append((time.perf_counter() - start) * 1000)
+    
+    print(f"startup: min {min(timings):.1f} ms, median {statistics.median(timings):.1f} ms "
+          f"over {args.runs} runs")
+    
+    rows = parse_importtime(run_cli(cli_args, importtime=True).stderr)
+    print(f"\n{'cumulative ms':>14}  module")
+    for cumulative, module in sorted(rows, reverse=True)[:args.top]:
+        print(f"{cumulative / 1000:>14.1f}  {module}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,323 @@
+"""
+Sync and backup engines for asyncio services.
+
+SyncEngine and BackupManager block the calling thread until they are done,
+which stalls an event loop. The engines here run the same work with all
+blocking file I/O in an executor, so a service can run many jobs in one
+process and watch them as they go:
+    
+    engine = AsyncSyncEngine(source, destination, config, concurrency=8)
+    async for event in engine.events():
+        print(event.kind, event.path, f"{event.done}/{event.total}")
+
+Each job copies at most `concurrency` files at a time. Jobs can also share
+a limiter (an asyncio.Semaphore) bounding blocking operations across all
+of them: a sync takes it for each file it copies, a backup or restore for
+the whole run.
+
+Cancelling the task running a job, or calling cancel(), stops it between
+files. Copies already in flight are finished and committed first, so the
+destination only ever holds complete files; an interrupted sync leaves the
+rest to the next run, and an interrupted backup is resumed from its journal.
+"""
+
+import asyncio
+import contextlib
+import functools
+import threading
+from concurrent.futures import Executor
+from pathlib import Path
+from typing import AsyncIterator, Callable, NamedTuple, Optional
+from .backup_manager import BackupCancelled, BackupManager
+from .scheduling import priority_band, schedule
+from .sync_engine import SyncEngine
+import logging
+
+
+DEFAULT_CONCURRENCY = 4
+
+_NO_LIMIT = contextlib.nullcontext()
+
+
+class ProgressEvent(NamedTuple):
+    """
+    One step of a job.
+    
+    kind is 'planned' (total is known), 'copied', 'updated', 'skipped',
+    'restored' or 'error' for a file, and finally 'done' or 'cancelled'
+    with the job's statistics. total is None while it is not known.
+    """
+    kind: str
+    path: Optional[str]
+    done: int
+    total: Optional[int]
+    error: Optional[str] = None
+    stats: Optional[dict] = None
+
+
+async def _settle(awaitable):
+    """Await something to the end, even if the caller is cancelled again meanwhile."""
+    future = asyncio.ensure_future(awaitable)
+    while True:
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if future.done():
+                return future.result()
+
+
+async def _events(run: Callable, job) -> AsyncIterator[ProgressEvent]:
+    """Run job.run(emit) in its own task, yielding its events as they come."""
+    queue: asyncio.Queue = asyncio.Queue()
+    task = asyncio.ensure_future(run(queue.put_nowait))
+    job._task = task
+    task.add_done_callback(lambda _: queue.put_nowait(None))
+    try:
+        while True:
+            event = await queue.get()
+            if event is None:
+                break
+            yield event
+        # A cancelled run has already reported itself; raise anything else
+        if not task.cancelled():
+            task.result()
+    finally:
+        # The consumer stopped early: stop the job too
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+
+class AsyncSyncEngine:
+    """Runs a SyncEngine's work on an asyncio event loop."""
+    
+    def __init__(self, source: str, destination: str, config: dict,
+                 concurrency: int = DEFAULT_CONCURRENCY, executor: Optional[Executor] = None,
+                 limiter: Optional[asyncio.Semaphore] = None):
+        """
+        Args:
+            concurrency: Most files this job copies at once
+            executor: Executor for blocking I/O (default: the loop's)
+            limiter: Semaphore shared by jobs, taken for each file copied
+        """
+        self.engine = SyncEngine(source, destination, config)
+        self.config = config
+        self.concurrency = max(1, concurrency)
+        self.executor = executor
+        self.limiter = limiter
+        self.logger = logging.getLogger(__name__)
+        self._task: Optional[asyncio.Future] = None
+    
+    async def sync(self, on_event: Optional[Callable[[ProgressEvent], None]] = None) -> dict:
+        """
+        Synchronize source and destination.
+        
+        Raises asyncio.CancelledError if the sync is cancelled.
+        
+        Returns:
+            dict: Statistics about the sync operation, as SyncEngine.sync()
+        """
+        self._task = asyncio.ensure_future(self._run(on_event or (lambda event: None)))
+        return await self._task
+    
+    def events(self) -> AsyncIterator[ProgressEvent]:
+        """Run the sync, yielding a ProgressEvent for each step."""
+        return _events(self._run, self)
+    
+    def cancel(self) -> None:
+        """Stop the running sync after the copies in flight."""
+        if self._task is not None:
+            self._task.cancel()
+    
+    async def _run(self, emit: Callable[[ProgressEvent], None]) -> dict:
+        """Scan, plan and copy, keeping every blocking call off the loop."""
+        loop = asyncio.get_running_loop()
+        engine = self.engine
+        sync_config = self.config.get('sync', {})
+        
+        def blocking(func, *args):
+            return loop.run_in_executor(self.executor, func, *args)
+        
+        # No apply_priority(): it would renice the whole host process
+        stats = engine.begin()
+        engine.throttle.reset_stats()
+        # Copies handed to the executor and not yet finished
+        in_flight = set()
+        progress = {'done': 0, 'total': None}
+        
+        def report(kind, path=None, error=None, final=None):
+            emit(ProgressEvent(kind, path, progress['done'], progress['total'], error, final))
+        
+        try:
+            source_table = await blocking(engine.scanner.scan_table, engine.source, engine.units)
+            dest_table = await blocking(engine.scanner.scan_table, engine.destination, engine.units)
+            to_copy, dest_only = await blocking(engine.plan, source_table, dest_table, stats)
+            
+            to_copy = schedule(to_copy, engine.order, engine.priority_globs,
+                               lambda item: (item[0], item[1].size, item[1].mtime_ns),
+                               lambda item: engine.source / item[0])
+            globs = engine.priority_globs
+            progress['total'] = len(to_copy)
+            report('planned')
+            
+            # Duplicates wait for their group's leader, as in SyncEngine._copy_files
+            groups = await blocking(engine._find_duplicates, to_copy) if engine.dedup else None
+            deferred = [item for item in to_copy if groups and item[0] in groups.leaders]
+            # Leader relative path -> hash of what was actually copied
+            copied_hashes = {}
+            
+            def copy(relative_path, on_commit):
+                hashed = bool(groups) and groups.is_leader(relative_path)
+                return engine._copy_file(engine.source / relative_path,
+                                         engine.destination / relative_path, hashed, on_commit)
+            
+            def place_duplicate(relative_path, on_commit):
+                if not engine._link_duplicate(groups, relative_path, copied_hashes, on_commit):
+                    engine._copy_file(engine.source / relative_path,
+                                      engine.destination / relative_path, False, on_commit)
+            
+            def copied(relative_path, action, future):
+                # Counted even if the job was cancelled while the copy ran
+                progress['done'] += 1
+                if future.exception() is not None:
+                    self.logger.error(f"Error processing {relative_path}: {future.exception()}")
+                    stats['errors'] += 1
+                    report('error', relative_path, str(future.exception()))
+                    return
+                if future.result() is not None:
+                    copied_hashes[relative_path] = future.result()
+                stats[action] += 1
+                self.logger.info(f"{action.capitalize()}: {relative_path}")
+                report(action, relative_path)
+            
+            async def worker(pending, place):
+                for relative_path, _, action in pending:
+                    async with self.limiter or _NO_LIMIT:
+                        priority = bool(globs) and priority_band(relative_path, globs) < len(globs)
+                        future = blocking(place, relative_path, engine._completion(priority))
+                        in_flight.add(future)
+                        future.add_done_callback(in_flight.discard)
+                        future.add_done_callback(functools.partial(copied, relative_path, action))
+                        # Shielded: cancelling the job must not abandon a copy midway
+                        with contextlib.suppress(Exception):
+                            await asyncio.shield(future)
+            
+            # concurrency workers taking files in schedule order
+            pending = iter([item for item in to_copy if not groups or item[0] not in groups.leaders])
+            await asyncio.gather(*(worker(pending, copy) for _ in range(self.concurrency)))
+            if groups is not None:
+                if deferred:
+                    # The leaders must be in place under their final names to be cloned
+                    await blocking(engine.copier.flush)
+                    pending = iter(deferred)
+                    await asyncio.gather(*(worker(pending, place_duplicate)
+                                           for _ in range(self.concurrency)))
+                stats['dedup_groups'] = len(set(groups.leaders.values()))
+                stats['dedup_bytes_read'] = groups.bytes_read
+            
+            if sync_config.get('mode') == 'bidirectional':
+                stats = await blocking(engine._sync_from_destination, dest_only, stats)
+            if sync_config.get('delete_orphaned'):
+                stats = await blocking(engine._delete_orphaned_files, dest_only, stats)
+            
+            stats = await blocking(engine.finish, stats)
+        except asyncio.CancelledError:
+            # Let the copies in flight land, then commit them
+            await _settle(asyncio.gather(*in_flight, return_exceptions=True))
+            stats = await _settle(blocking(engine.finish, stats))
+            report('cancelled', final=stats)
+            raise
+        
+        report('done', final=stats)
+        return stats
+
+
+class AsyncBackupManager:
+    """Runs BackupManager backups and restores on an asyncio event loop."""
+    
+    def __init__(self, config: dict, executor: Optional[Executor] = None,
+                 limiter: Optional[asyncio.Semaphore] = None):
+        """
+        Args:
+            executor: Executor for blocking I/O (default: the loop's)
+            limiter: Semaphore shared by jobs, held for the whole run
+        """
+        self.manager = BackupManager(config)
+        self.executor = executor
+        self.limiter = limiter
+        self._task: Optional[asyncio.Future] = None
+        self._cancel = threading.Event()
+        self.manager.cancel_event = self._cancel
+    
+    async def create_backup(self, source: Path, backup_dir: Path,
+                            on_event: Optional[Callable[[ProgressEvent], None]] = None) -> dict:
+        """
+        Create a backup, as BackupManager.create_backup().
+        
+        Raises asyncio.CancelledError if the backup is cancelled; it is then
+        left incomplete and the next backup resumes it.
+        """
+        self._task = asyncio.ensure_future(self._run(self.manager.create_backup,
+                                                     (source, backup_dir),
+                                                     on_event or (lambda event: None)))
+        return await self._task
+    
+    async def restore(self, backup_path: Path, destination: Path,
+                      on_event: Optional[Callable[[ProgressEvent], None]] = None) -> dict:
+        """Restore a backup, as BackupManager.restore()."""
+        self._task = asyncio.ensure_future(self._run(self.manager.restore,
+                                                     (backup_path, destination),
+                                                     on_event or (lambda event: None)))
+        return await self._task
+    
+    def backup_events(self, source: Path, backup_dir: Path) -> AsyncIterator[ProgressEvent]:
+        """Create a backup, yielding a ProgressEvent for each file."""
+        return _events(lambda emit: self._run(self.manager.create_backup,
+                                              (source, backup_dir), emit), self)
+    
+    def restore_events(self, backup_path: Path, destination: Path) -> AsyncIterator[ProgressEvent]:
+        """Restore a backup, yielding a ProgressEvent for each file."""
+        return _events(lambda emit: self._run(self.manager.restore,
+                                              (backup_path, destination), emit), self)
+    
+    def cancel(self) -> None:
+        """Stop the running backup or restore before its next file."""
+        if self._task is not None:
+            self._task.cancel()
+    
+    async def _run(self, func: Callable, args: tuple,
+                   emit: Callable[[ProgressEvent], None]) -> dict:
+        """Run a blocking BackupManager call, relaying its progress to the loop."""
+        loop = asyncio.get_running_loop()
+        done = 0
+        
+        def relay(kind, path):
+            nonlocal done
+            done += 1
+            emit(ProgressEvent(kind, path, done, None))
+        
+        def progress(kind, path):
+            # Called on the executor thread
+            loop.call_soon_threadsafe(relay, kind, path)
+        
+        async with self.limiter or _NO_LIMIT:
+            self._cancel.clear()
+            self.manager.on_progress = progress
+            future = loop.run_in_executor(self.executor, func, *args)
+            try:
+                result = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # The manager stops at its next file and commits what it copied
+                self._cancel.set()
+                with contextlib.suppress(BackupCancelled):
+                    await _settle(future)
+                # Let progress relayed from the executor arrive first
+                await asyncio.sleep(0)
+                emit(ProgressEvent('cancelled', None, done, None))
+                raise
+            finally:
+                self.manager.on_progress = None
+        
+        await asyncio.sleep(0)
+        emit(ProgressEvent('done', None, done, done, stats=result))
+        return result
@@ -4,26 +4,80 @@ Backup management module.
 Handles full and incremental backup operations.
 """
 
+import functools
+import hashlib
 import os
 import shutil
 import json
 from pathlib import Path
+import threading
 from datetime import datetime
-from typing import Optional, List
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, NamedTuple, Optional, List, Set, Tuple
+from .copier import FileCopier, fsync_directory
+from .dedup import Candidate, DuplicateFinder, DuplicateGroups
 from .file_scanner import FileScanner
 from .hasher import FileHasher
+from .profiling import profiled
+from .scheduling import in_disk_order, readahead
+from .throttle import Throttle
+from .journal import BackupJournal, is_incomplete, INCOMPLETE_MARKER, JOURNAL_FILE
+from .manifest import (DELTA_FILE, DEFAULT_CHECKPOINT_INTERVAL, checkpoint, delta_parent,
+                       load_manifest, save_manifest)
+from .pack import PackReader, PackWriter, PACK_DIR, DEFAULT_PACK_SIZE
+from .utils import is_temp_file
+from .watchdog import RetryQueue, Stalled, Watchdog
 import logging
 
 
+# Bookkeeping files stored alongside backed-up data
+BACKUP_META_FILES = {'metadata.json', 'hashes.json', DELTA_FILE, INCOMPLETE_MARKER, JOURNAL_FILE}
+
+DEFAULT_CONSOLIDATE_WORKERS = 4
+
+
+class _ManifestStat(NamedTuple):
+    """A manifest entry's size and mtime, where journal lookups expect a stat result."""
+    st_size: Optional[int]
+    st_mtime_ns: Optional[int]
+
+
+class BackupCancelled(Exception):
+    """Raised when a backup or restore is stopped through cancel_event."""
+
+
 class BackupManager:
     """Manages backup and restore operations."""
     
     def __init__(self, config: dict):
         self.config = config
-        self.scanner = FileScanner(config.get('filters', {}))
-        self.hasher = FileHasher()
+        self.scanner = FileScanner(config.get('filters', {}),
+                                   cache_listings=config.get('backup', {}).get('listing_cache', False))
+        self.throttle = Throttle.from_config(config, 'backup')
+        self.hasher = FileHasher.from_config(config, throttle=self.throttle)
+        self.copier = FileCopier(config, self.hasher)
+        # Deadlines for copies and hashes on mounts that may hang
+        self.watchdog = Watchdog.from_config(config)
+        # Files smaller than this go into pack files (0 disables packing)
+        self.pack_threshold = config.get('backup', {}).get('pack_threshold', 0)
+        self.pack_size = config.get('backup', {}).get('pack_size', DEFAULT_PACK_SIZE)
+        # Identical files in a full backup become hardlinks of the first copy
+        use_dedup = config.get('backup', {}).get('dedup', False)
+        self.dedup = DuplicateFinder.from_config(config, self.hasher) if use_dedup else None
+        # 'physical' reads files in the order their data sits on disk
+        self.order = config.get('backup', {}).get('order', 'walk')
+        if self.order not in ('walk', 'physical'):
+            raise ValueError(f"Unknown backup order: {self.order}")
+        # Concurrent copies when consolidating files that can't be linked
+        self.consolidate_workers = max(1, config.get('backup', {}).get('consolidate_workers',
+                                                                       DEFAULT_CONSOLIDATE_WORKERS))
+        # Hooks for embedders (see async_engine): called with (event, path)
+        # after each file, and checked before each file to stop the run
+        self.on_progress: Optional[Callable[[str, str], None]] = None
+        self.cancel_event: Optional[threading.Event] = None
         self.logger = logging.getLogger(__name__)
         
+    @profiled('backup')
     def create_backup(self, source: Path, backup_dir: Path) -> dict:
         """
         Create a backup of source directory.
@@ -36,6 +90,10 @@ class BackupManager:
             Dictionary with backup metadata
         """
         backup_type = self.config.get('backup', {}).get('type', 'full')
+        self.throttle.apply_priority()
+        self.throttle.reset_stats()
+        self.watchdog.reset_stats()
+        self.scanner.reset_stats()
         
         if backup_type == 'full':
             return self._full_backup(source, backup_dir)
@@ -50,26 +108,87 @@ class BackupManager:
         
         Copies all files from source to a timestamped backup directory.
         """
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_path = backup_dir / f"full_{timestamp}"
-        backup_path.mkdir(parents=True, exist_ok=True)
+        backup_path, timestamp, journal = self._start_backup('full', source, backup_dir)
+        self.copier.reset_stats()
         
         files = self.scanner.scan(source)
         copied = 0
         errors = 0
+        manifest = {}
+        packer = self._pack_writer(backup_path)
+        groups = self._find_duplicates(source, backup_dir, files, journal) if self.dedup else None
+        deferred = []
         
-        for file_path in files:
-            try:
-                relative_path = file_path.relative_to(source)
-                dest_path = backup_path / relative_path
-                dest_path.parent.mkdir(parents=True, exist_ok=True)
-                
-                shutil.copy2(file_path, dest_path)
-                copied += 1
-            except Exception as e:
-                # Different logging style than other modules
-                print(f"ERROR: Failed to backup {file_path}: {e}")
-                errors += 1
+        try:
+            # Files that stall come round again after the rest
+            work = self.watchdog.queue(self._in_read_order(files))
+            for file_path in work:
+                self._check_cancelled()
+                try:
+                    relative_path = str(file_path.relative_to(source))
+                    stat_result = file_path.stat()
+                    
+                    # Already stored by an interrupted run
+                    done = journal.lookup(relative_path, stat_result)
+                    if done:
+                        manifest[relative_path] = self._manifest_entry(stat_result, done['hash'])
+                        copied += 1
+                        self._report('copied', relative_path)
+                        continue
+                    
+                    # Linked to the first copy of its contents once that is committed
+                    if groups and relative_path in groups.leaders:
+                        deferred.append((file_path, relative_path))
+                        continue
+                    
+                    file_hash = self._backup_file(file_path, relative_path, stat_result,
+                                                  backup_path, packer, journal)
+                    manifest[relative_path] = self._manifest_entry(stat_result, file_hash)
+                    copied += 1
+                    self._report('copied', relative_path)
+                except Stalled as e:
+                    if not self._retry_stalled(work, file_path, e):
+                        errors += 1
+                        self._report('error', str(file_path))
+                except Exception as e:
+                    # Different logging style than other modules
+                    print(f"ERROR: Failed to backup {file_path}: {e}")
+                    errors += 1
+                    self._report('error', str(file_path))
+            
+            self.copier.flush()
+            
+            work = self.watchdog.queue(deferred)
+            for item in work:
+                file_path, relative_path = item
+                self._check_cancelled()
+                try:
+                    stat_result = file_path.stat()
+                    file_hash = self._link_duplicate(file_path, relative_path, stat_result,
+                                                     backup_path, groups, manifest, journal)
+                    if file_hash is None:
+                        file_hash = self._backup_file(file_path, relative_path, stat_result,
+                                                      backup_path, packer, journal)
+                    manifest[relative_path] = self._manifest_entry(stat_result, file_hash)
+                    copied += 1
+                    self._report('copied', relative_path)
+                except Stalled as e:
+                    if not self._retry_stalled(work, item, e):
+                        errors += 1
+                        self._report('error', str(file_path))
+                except Exception as e:
+                    self.logger.error(f"Failed to backup {file_path}: {e}")
+                    errors += 1
+                    self._report('error', str(file_path))
+            
+            self.copier.flush()
+        finally:
+            if packer:
+                packer.close()
+            journal.close()
+        
+        # Hashes computed during the copies seed the next incremental
+        self._save_hashes(backup_path, manifest)
         
         # Save metadata
         metadata = {
@@ -77,10 +196,19 @@ class BackupManager:
             'timestamp': timestamp,
             'source': str(source),
             'files_copied': copied,
-            'errors': errors
+            'errors': errors,
+            'bytes_logical': self.copier.stats['bytes_logical'],
+            'bytes_physical': self.copier.stats['bytes_physical'],
+            'files_packed': packer.files_packed if packer else 0,
+            'files_deduped': self.copier.stats['deduped'],
+            'bytes_deduped': self.copier.stats['bytes_deduped']
         }
+        metadata.update(self.throttle.stats())
+        metadata.update(self.watchdog.stats())
+        metadata.update(self.scanner.stats())
         
         self._save_metadata(backup_path, metadata)
+        journal.finish()
         
         # Clean old backups
         self._cleanup_old_backups(backup_dir)
@@ -93,12 +221,15 @@ class BackupManager:
         
         Only backs up files that have changed since last backup.
         """
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_path = backup_dir / f"incr_{timestamp}"
-        backup_path.mkdir(parents=True, exist_ok=True)
-        
-        # Find last backup to compare against
+        # Find last backup to compare against (kept stable across resumes)
         last_backup = self._find_last_backup(backup_dir)
+        backup_path, timestamp, journal = self._start_backup(
+            'incremental', source, backup_dir,
+            base_backup=str(last_backup) if last_backup else None
+        )
+        self.copier.reset_stats()
+        base = journal.load_info().get('base_backup')
+        last_backup = Path(base) if base else None
         last_hashes = {}
         
         if last_backup:
@@ -109,31 +240,71 @@ class BackupManager:
         skipped = 0
         errors = 0
         current_hashes = {}
+        packer = self._pack_writer(backup_path)
         
-        for file_path in files:
-            try:
-                relative_path = file_path.relative_to(source)
-                file_hash = self.hasher.hash_file(file_path)
-                current_hashes[str(relative_path)] = file_hash
-                
-                # Check if file changed
-                if str(relative_path) in last_hashes:
-                    if last_hashes[str(relative_path)] == file_hash:
+        try:
+            # Files that stall come round again after the rest
+            work = self.watchdog.queue(self._in_read_order(files))
+            for file_path in work:
+                self._check_cancelled()
+                try:
+                    relative_path = str(file_path.relative_to(source))
+                    stat_result = file_path.stat()
+                    
+                    # Already hashed (and copied if needed) by an interrupted run
+                    done = journal.lookup(relative_path, stat_result)
+                    if done:
+                        current_hashes[relative_path] = self._manifest_entry(stat_result, done['hash'])
+                        if done['copied']:
+                            copied += 1
+                            self._report('copied', relative_path)
+                        else:
+                            skipped += 1
+                            self._report('skipped', relative_path)
+                        continue
+                    
+                    # Unchanged since the last backup: the manifest doubles as a hash cache
+                    last = last_hashes.get(relative_path, {})
+                    file_hash = None
+                    if last.get('size') == stat_result.st_size and \
+                            last.get('mtime_ns') == stat_result.st_mtime_ns:
+                        file_hash = last['hash']
+                    elif last.get('hash') and last.get('size', stat_result.st_size) == stat_result.st_size:
+                        # Same size but touched: hash first, the content may not have changed
+                        file_hash = self.watchdog.call(file_path, stat_result.st_size,
+                                                       self.hasher.hash_file, file_path)
+                    
+                    if file_hash is not None and file_hash == last.get('hash'):
+                        current_hashes[relative_path] = self._manifest_entry(stat_result, file_hash)
+                        journal.record(self._journal_entry(relative_path, stat_result, file_hash, False))
                         skipped += 1
+                        self._report('skipped', relative_path)
                         continue
-                
-                # Copy changed or new file
-                dest_path = backup_path / relative_path
-                dest_path.parent.mkdir(parents=True, exist_ok=True)
-                shutil.copy2(file_path, dest_path)
-                copied += 1
-                
-            except Exception as e:
-                self.logger.error(f"Backup error for {file_path}: {e}")
-                errors += 1
+                    
+                    # Copy changed or new file, hashing it from the same reads
+                    file_hash = self._backup_file(file_path, relative_path, stat_result,
+                                                  backup_path, packer, journal)
+                    current_hashes[relative_path] = self._manifest_entry(stat_result, file_hash)
+                    copied += 1
+                    self._report('copied', relative_path)
+                    
+                except Stalled as e:
+                    if not self._retry_stalled(work, file_path, e):
+                        errors += 1
+                        self._report('error', str(file_path))
+                except Exception as e:
+                    self.logger.error(f"Backup error for {file_path}: {e}")
+                    errors += 1
+                    self._report('error', str(file_path))
+            
+            self.copier.flush()
+        finally:
+            if packer:
+                packer.close()
+            journal.close()
         
-        # Save hashes for next incremental backup
-        self._save_hashes(backup_path, current_hashes)
+        # Save hashes for next incremental backup (as a delta against the base)
+        self._save_hashes(backup_path, current_hashes, last_backup, last_hashes)
         
         metadata = {
             'type': 'incremental',
@@ -142,14 +313,240 @@ class BackupManager:
             'files_copied': copied,
             'files_skipped': skipped,
             'errors': errors,
+            'bytes_logical': self.copier.stats['bytes_logical'],
+            'bytes_physical': self.copier.stats['bytes_physical'],
+            'files_packed': packer.files_packed if packer else 0,
             'base_backup': str(last_backup) if last_backup else None
         }
+        metadata.update(self.throttle.stats())
+        metadata.update(self.watchdog.stats())
+        metadata.update(self.scanner.stats())
         
         self._save_metadata(backup_path, metadata)
+        journal.finish()
         self._cleanup_old_backups(backup_dir)
         
         return metadata
     
+    def _start_backup(self, backup_type: str, source: Path, backup_dir: Path,
+                      base_backup: Optional[str] = None) -> Tuple[Path, str, BackupJournal]:
+        """
+        Open the backup directory for this run.
+        
+        Resumes the newest incomplete backup of the same type and source if
+        there is one, otherwise starts a new timestamped directory.
+        
+        Returns:
+            Tuple of (backup path, timestamp, started journal)
+        """
+        # Consolidation writes a (synthetic) full backup
+        prefix = 'incr' if backup_type == 'incremental' else 'full'
+        
+        for candidate in self._list_backups(backup_dir, include_incomplete=True):
+            if not is_incomplete(candidate) or not candidate.name.startswith(prefix + '_'):
+                continue
+            journal = BackupJournal(candidate)
+            info = journal.load_info()
+            if info.get('type') == backup_type and info.get('source') == str(source):
+                self.logger.info(f"Resuming interrupted backup: {candidate.name}")
+                self._remove_temp_files(candidate)
+                journal.start(info)
+                return candidate, info['timestamp'], journal
+        
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        backup_path = backup_dir / f"{prefix}_{timestamp}"
+        journal = BackupJournal(backup_path)
+        journal.start({
+            'type': backup_type,
+            'timestamp': timestamp,
+            'source': str(source),
+            'base_backup': base_backup
+        })
+        return backup_path, timestamp, journal
+    
+    def _pack_writer(self, backup_path: Path) -> Optional[PackWriter]:
+        """Return a pack writer for the backup, or None if packing is disabled."""
+        if not self.pack_threshold:
+            return None
+        return PackWriter(backup_path, self.copier, self.pack_size)
+    
+    @profiled('copy')
+    def _backup_file(self, file_path: Path, relative_path: str, stat_result: os.stat_result,
+                     backup_path: Path, packer: Optional[PackWriter],
+                     journal: BackupJournal) -> str:
+        """
+        Store a file in the backup and return its content hash.
+        
+        The hash is computed from the reads that copy (or pack) the file and
+        is journaled once the file is committed.
+        """
+        digest = hashlib.new(self.hasher.algorithm)
+        entry = self._journal_entry(relative_path, stat_result, None, True)
+        
+        def committed():
+            entry['hash'] = digest.hexdigest()
+            journal.record(entry)
+        
+        if packer and stat_result.st_size < self.pack_threshold:
+            self.watchdog.call(file_path, stat_result.st_size, packer.add, relative_path,
+                               file_path, stat_result, on_commit=committed, digest=digest)
+        else:
+            self.watchdog.call(file_path, stat_result.st_size, self.copier.copy, file_path,
+                               backup_path / relative_path, on_commit=committed, digest=digest)
+        return digest.hexdigest()
+    
+    @profiled('dedup')
+    def _find_duplicates(self, source: Path, backup_dir: Path, files: List[Path],
+                         journal: BackupJournal) -> DuplicateGroups:
+        """
+        Group the files a full backup will copy by content.
+        
+        Packed files are left out (a pack entry cannot be hardlinked), and
+        the mode is part of the key since hardlinks share it. Hashes come
+        from the last backup's manifest while size and mtime still match.
+        """
+        last_backup = self._find_last_backup(backup_dir)
+        known = self._load_hashes(last_backup) if last_backup else {}
+        
+        candidates = []
+        for file_path in files:
+            try:
+                relative_path = str(file_path.relative_to(source))
+                stat_result = file_path.stat()
+            except (OSError, ValueError):
+                continue
+            if journal.lookup(relative_path, stat_result):
+                continue
+            if self.pack_threshold and stat_result.st_size < self.pack_threshold:
+                continue
+            last = known.get(relative_path, {})
+            file_hash = None
+            if last.get('size') == stat_result.st_size and \
+                    last.get('mtime_ns') == stat_result.st_mtime_ns:
+                file_hash = last.get('hash')
+            candidates.append(Candidate(relative_path, file_path, stat_result.st_size,
+                                        stat_result.st_mtime_ns, tag=stat_result.st_mode,
+                                        hash=file_hash))
+        return self.dedup.find(candidates)
+    
+    @profiled('link')
+    def _link_duplicate(self, file_path: Path, relative_path: str, stat_result: os.stat_result,
+                        backup_path: Path, groups: DuplicateGroups, manifest: dict,
+                        journal: BackupJournal) -> Optional[str]:
+        """
+        Hardlink a duplicate to its group's stored copy and journal it.
+        
+        Returns:
+            The content hash, or None if the file has to be copied instead
+        """
+        leader = groups.leaders[relative_path]
+        file_hash = groups.hashes[relative_path]
+        # Only link to a copy whose data hashed to the group's contents
+        if manifest.get(leader, {}).get('hash') != file_hash:
+            return None
+        
+        entry = self._journal_entry(relative_path, stat_result, file_hash, True)
+        try:
+            linked = self.copier.link(backup_path / leader, file_path, backup_path / relative_path,
+                                      hardlink=True, on_commit=lambda: journal.record(entry))
+        except OSError as e:
+            self.logger.warning(f"Could not hardlink {relative_path} to {leader}: {e}")
+            return None
+        return file_hash if linked else None
+    
+    def _in_read_order(self, files: Iterable[Path]) -> Iterable[Path]:
+        """Order files as backup.order asks, prefetching ahead in physical order."""
+        if self.order != 'physical':
+            return files
+        return readahead(in_disk_order(list(files), lambda path: path), lambda path: path)
+    
+    def _retry_stalled(self, work: RetryQueue, item, error: Stalled) -> bool:
+        """Queue a stalled file for a retry. Returns False once it is out of retries."""
+        if work.stall(item):
+            self.logger.warning(f"Stalled, will retry: {error}")
+            return True
+        self.logger.error(f"Stalled, giving up: {error}")
+        return False
+    
+    def _report(self, event: str, path: str) -> None:
+        """Pass per-file progress to on_progress, if set."""
+        if self.on_progress is not None:
+            self.on_progress(event, path)
+    
+    def _check_cancelled(self) -> None:
+        """
+        Stop between files once cancel_event is set.
+        
+        Batched copies are committed first, so every file in place is
+        complete. An interrupted backup keeps its .incomplete marker and
+        journal, and the next run resumes it.
+        """
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            self.copier.flush()
+            raise BackupCancelled("Cancelled")
+    
+    def _manifest_entry(self, stat_result: os.stat_result, file_hash: Optional[str]) -> dict:
+        """Build the hashes.json record for a file."""
+        return {'hash': file_hash, 'size': stat_result.st_size, 'mtime_ns': stat_result.st_mtime_ns}
+    
+    def list_backups(self, backup_dir: Path) -> List[Path]:
+        """List completed backup directories, newest first."""
+        return self._list_backups(backup_dir)
+    
+    def load_manifest(self, backup_path: Path, loaded: Optional[Dict[Path, dict]] = None) -> dict:
+        """
+        Return a backup's manifest: relative path -> {'hash', 'size', 'mtime_ns'}.
+        
+        loaded maps backup paths to manifests already loaded, which delta
+        chains reuse instead of reading back to their checkpoint.
+        """
+        return self._load_hashes(backup_path, loaded)
+    
+    def list_files(self, backup_path: Path) -> List[str]:
+        """
+        List the relative paths of all files stored in a backup.
+        
+        Covers both files stored as-is and files inside pack files.
+        """
+        files = {str(p.relative_to(backup_path)) for p in self._loose_files(backup_path)}
+        files.update(PackReader(backup_path).index)
+        return sorted(files)
+    
+    def _loose_files(self, backup_path: Path):
+        """Yield backed-up files stored as-is (not packed, not bookkeeping)."""
+        for root, dirs, filenames in os.walk(backup_path):
+            if root == str(backup_path) and PACK_DIR in dirs:
+                dirs.remove(PACK_DIR)
+            for name in filenames:
+                if root == str(backup_path) and name in BACKUP_META_FILES:
+                    continue
+                # Partial copies of an interrupted run
+                if is_temp_file(name):
+                    continue
+                yield Path(root) / name
+    
+    def _remove_temp_files(self, backup_path: Path) -> None:
+        """Delete the partial copies an interrupted run left in a backup."""
+        for root, dirs, filenames in os.walk(backup_path):
+            for name in filenames:
+                if is_temp_file(name):
+                    try:
+                        os.unlink(os.path.join(root, name))
+                    except OSError as e:
+                        self.logger.warning(f"Could not remove {os.path.join(root, name)}: {e}")
+    
+    def _journal_entry(self, relative_path: str, stat_result: os.stat_result,
+                       file_hash: Optional[str], copied: bool) -> dict:
+        """Build the journal record for a finished file."""
+        return {
+            'path': relative_path,
+            'size': stat_result.st_size,
+            'mtime_ns': stat_result.st_mtime_ns,
+            'hash': file_hash,
+            'copied': copied
+        }
+    
+    @profiled('restore')
     def restore(self, backup_path: Path, destination: Path) -> dict:
         """
         Restore files from backup to destination.
@@ -158,6 +555,9 @@ class BackupManager:
             raise FileNotFoundError(f"Backup not found: {backup_path}")
         
         metadata = self._load_metadata(backup_path)
+        self.throttle.apply_priority()
+        self.throttle.reset_stats()
+        self.watchdog.reset_stats()
         
         if metadata.get('type') == 'incremental':
             # For incremental, need to restore base backup first
@@ -166,40 +566,333 @@ class BackupManager:
         
         restored = 0
         errors = 0
+        # Deduped files share one inode, and so the mtime of the first copy
+        linked = []
         
-        for file_path in backup_path.rglob('*'):
-            if file_path.is_file() and file_path.name not in ['metadata.json', 'hashes.json']:
-                try:
-                    relative_path = file_path.relative_to(backup_path)
-                    dest_path = destination / relative_path
-                    dest_path.parent.mkdir(parents=True, exist_ok=True)
-                    
-                    shutil.copy2(file_path, dest_path)
-                    restored += 1
-                except Exception as e:
-                    self.logger.error(f"Restore error: {e}")
+        work = self.watchdog.queue(self._in_read_order(self._loose_files(backup_path)))
+        for file_path in work:
+            self._check_cancelled()
+            try:
+                relative_path = file_path.relative_to(backup_path)
+                dest_path = destination / relative_path
+                
+                st = file_path.stat()
+                self.watchdog.call(file_path, st.st_size, self.copier.copy, file_path, dest_path)
+                if st.st_nlink > 1:
+                    linked.append(str(relative_path))
+                restored += 1
+                self._report('restored', str(relative_path))
+            except Stalled as e:
+                if not self._retry_stalled(work, file_path, e):
                     errors += 1
+                    self._report('error', str(file_path))
+            except Exception as e:
+                self.logger.error(f"Restore error: {e}")
+                errors += 1
+                self._report('error', str(file_path))
+        
+        # Small files stored in packs, read back in pack order
+        def pack_error(relative_path, error):
+            nonlocal errors
+            self.logger.error(f"Restore error for packed {relative_path}: {error}")
+            errors += 1
+        
+        restored += PackReader(backup_path).extract(self.copier, destination, on_error=pack_error)
         
-        return {'restored': restored, 'errors': errors}
+        self.copier.flush()
+        
+        if linked:
+            self._restore_mtimes(backup_path, destination, linked)
+        
+        result = {'restored': restored, 'errors': errors}
+        result.update(self.throttle.stats())
+        result.update(self.watchdog.stats())
+        return result
+    
+    def _restore_mtimes(self, backup_path: Path, destination: Path, relative_paths: List[str]) -> None:
+        """Set restored files to the mtimes recorded in the backup's manifest."""
+        manifest = self._load_hashes(backup_path)
+        for relative_path in relative_paths:
+            mtime_ns = manifest.get(relative_path, {}).get('mtime_ns')
+            if mtime_ns is None:
+                continue
+            try:
+                os.utime(destination / relative_path, ns=(mtime_ns, mtime_ns))
+            except OSError as e:
+                self.logger.error(f"Could not set mtime of {relative_path}: {e}")
+    
+    @profiled('consolidate')
+    def consolidate(self, backup_dir: Path, retire: bool = False) -> dict:
+        """
+        Merge the newest backup's chain into a new, synthetic full backup.
+        
+        Every file in the newest backup's manifest is taken from the chain
+        member (the full backup it builds on, or an incremental since) that
+        stored it last, so the source is not read at all. Loose files are
+        reflinked, hardlinked where reflinks are not supported, and copied
+        in parallel otherwise; packed files are repacked, or extracted when
+        packing is off. Being the newest backup, the synthetic full is the
+        base of the next incremental.
+        
+        Args:
+            backup_dir: Directory holding the backups
+            retire: Remove the merged backups once the synthetic full is
+                complete (skipped if any file could not be carried over)
+            
+        Returns:
+            Dictionary with the synthetic backup's metadata
+            
+        Raises:
+            ValueError: No backup to consolidate, or a chain member is missing
+        """
+        newest = self._find_last_backup(backup_dir)
+        if newest is None:
+            raise ValueError(f"No completed backups in {backup_dir}")
+        chain = self._backup_chain(backup_dir, newest)
+        if len(chain) == 1:
+            raise ValueError(f"Nothing to consolidate: {newest.name} does not build on other backups")
+        source = self._load_metadata(newest).get('source', '')
+        self.throttle.apply_priority()
+        self.throttle.reset_stats()
+        
+        backup_path, timestamp, journal = self._start_backup('consolidate', Path(source), backup_dir,
+                                                             base_backup=str(newest))
+        # A resumed consolidation finishes the chain it started on
+        base = Path(journal.load_info().get('base_backup') or newest)
+        if base != newest:
+            newest, chain = base, self._backup_chain(backup_dir, base)
+        self.copier.reset_stats()
+        wanted = self._load_hashes(newest)
+        
+        manifest = {}
+        errors = 0
+        loose: List[Tuple[str, Path]] = []
+        packed: Dict[Path, Set[str]] = {}
+        pending = {}
+        for relative_path, entry in wanted.items():
+            recorded = _ManifestStat(entry.get('size'), entry.get('mtime_ns'))
+            if journal.lookup(relative_path, recorded):
+                manifest[relative_path] = entry
+            else:
+                pending[relative_path] = entry
+        
+        locations = self.locate_files(newest, pending)
+        for relative_path in pending:
+            if relative_path not in locations:
+                self.logger.error(f"Not stored in any backup of the chain: {relative_path}")
+                errors += 1
+                continue
+            member, in_pack = locations[relative_path]
+            if in_pack:
+                packed.setdefault(member, set()).add(relative_path)
+            else:
+                loose.append((relative_path, member))
+        
+        def committed(relative_path):
+            entry = wanted[relative_path]
+            recorded = _ManifestStat(entry.get('size'), entry.get('mtime_ns'))
+            journal.record(self._journal_entry(relative_path, recorded, entry.get('hash'), True))
+            manifest[relative_path] = entry
+        
+        packer = self._pack_writer(backup_path)
+        try:
+            with ThreadPoolExecutor(max_workers=self.consolidate_workers) as pool:
+                futures = {}
+                for relative_path, member in loose:
+                    self._check_cancelled()
+                    futures[pool.submit(self._carry_over, member / relative_path,
+                                        backup_path / relative_path,
+                                        functools.partial(committed, relative_path))] = relative_path
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                        self._report('copied', futures[future])
+                    except Exception as e:
+                        self.logger.error(f"Consolidate error for {futures[future]}: {e}")
+                        errors += 1
+                        self._report('error', futures[future])
+            
+            def pack_error(relative_path, error):
+                nonlocal errors
+                self.logger.error(f"Consolidate error for packed {relative_path}: {error}")
+                errors += 1
+            
+            for member, paths in packed.items():
+                self._check_cancelled()
+                reader = PackReader(member)
+                if packer is None:
+                    failed = set()
+                    
+                    def extract_error(relative_path, error):
+                        failed.add(relative_path)
+                        pack_error(relative_path, error)
+                    
+                    reader.extract(self.copier, backup_path, on_error=extract_error, paths=paths)
+                    # Journaled once the extracted files are durably in place
+                    self.copier.flush()
+                    for relative_path in paths - failed:
+                        committed(relative_path)
+                    continue
+                for entry in reader.entries():
+                    if entry['path'] not in paths:
+                        continue
+                    try:
+                        packer.add_data(entry['path'], reader.read(entry['path']), entry['mode'],
+                                        entry['mtime_ns'], functools.partial(committed, entry['path']))
+                    except OSError as e:
+                        pack_error(entry['path'], e)
+            
+            self.copier.flush()
+        finally:
+            if packer:
+                packer.close()
+            journal.close()
+        
+        # A full manifest, so the next incremental compares against the merged state
+        self._save_hashes(backup_path, manifest)
+        
+        metadata = {
+            'type': 'full',
+            'synthetic': True,
+            'timestamp': timestamp,
+            'source': source,
+            'consolidated': [member.name for member in reversed(chain)],
+            'files_copied': len(manifest),
+            'errors': errors,
+            'bytes_logical': self.copier.stats['bytes_logical'],
+            'bytes_physical': self.copier.stats['bytes_physical'],
+            'files_packed': packer.files_packed if packer else 0,
+            'files_linked': self.copier.stats['deduped'],
+            'bytes_linked': self.copier.stats['bytes_deduped']
+        }
+        metadata.update(self.throttle.stats())
+        
+        self._save_metadata(backup_path, metadata)
+        journal.finish()
+        
+        if retire and errors:
+            self.logger.warning(f"Keeping {len(chain)} merged backups: {errors} files were not carried over")
+        elif retire:
+            self._remove_backups(backup_dir, set(chain))
+        self._cleanup_old_backups(backup_dir)
+        
+        return metadata
+    
+    def locate_files(self, backup_path: Path,
+                     relative_paths: Optional[Iterable[str]] = None) -> Dict[str, Tuple[Path, bool]]:
+        """
+        Find where the files of a backup's manifest are stored.
+        
+        An incremental only stores the files that changed, so the rest are
+        looked up in the backups it builds on, newest first.
+        
+        Args:
+            backup_path: Backup whose files to look up
+            relative_paths: Files to look up (default: its whole manifest)
+            
+        Returns:
+            Relative path -> (backup storing its contents, whether in a pack);
+            files stored nowhere in the chain are left out
+        
+        Raises:
+            ValueError: A base backup is missing or incomplete
+        """
+        pending = set(self._load_hashes(backup_path) if relative_paths is None else relative_paths)
+        locations = {}
+        for member in self._backup_chain(backup_path.parent, backup_path):
+            if not pending:
+                break
+            index = PackReader(member).index
+            for relative_path in list(pending):
+                if relative_path in index:
+                    locations[relative_path] = (member, True)
+                elif (member / relative_path).is_file():
+                    locations[relative_path] = (member, False)
+                else:
+                    continue
+                pending.discard(relative_path)
+        return locations
+    
+    def _backup_chain(self, backup_dir: Path, newest: Path) -> List[Path]:
+        """
+        Return newest and the backups it builds on, newest first, ending at a full backup.
+        
+        Raises:
+            ValueError: A base backup is missing or incomplete
+        """
+        chain = [newest]
+        while True:
+            metadata = self._load_metadata(chain[-1])
+            base = metadata.get('base_backup')
+            if metadata.get('type') != 'incremental' or not base:
+                return chain
+            # Looked up by name, in case the backup directory was moved
+            base_path = backup_dir / Path(base).name
+            if not base_path.is_dir() or is_incomplete(base_path) or base_path in chain:
+                raise ValueError(f"Base backup of {chain[-1].name} is missing: {base}")
+            chain.append(base_path)
+    
+    def _chain_members(self, backup_dir: Path, backups: Iterable[Path]) -> Set[Path]:
+        """Return the backups that any of backups builds on, directly or not."""
+        needed = set()
+        for member in backups:
+            while True:
+                metadata = self._load_metadata(member)
+                base = metadata.get('base_backup')
+                if metadata.get('type') != 'incremental' or not base:
+                    break
+                member = backup_dir / Path(base).name
+                if member in needed or not member.is_dir():
+                    break
+                needed.add(member)
+        return needed
+    
+    def _carry_over(self, existing: Path, destination: Path,
+                    on_commit: Callable[[], None]) -> None:
+        """Store a file from another backup: reflinked, hardlinked, or failing that copied."""
+        if self.copier.link(existing, existing, destination, on_commit=on_commit):
+            return
+        if self.copier.link(existing, existing, destination, hardlink=True, on_commit=on_commit):
+            return
+        self.copier.copy(existing, destination, on_commit=on_commit)
     
     def _find_last_backup(self, backup_dir: Path) -> Optional[Path]:
-        """Find the most recent backup directory."""
-        if not backup_dir.exists():
-            return None
+        """Find the most recent completed backup directory."""
+        backups = self._list_backups(backup_dir)
+        return backups[0] if backups else None
+    
+    def _list_backups(self, backup_dir: Path, include_incomplete: bool = False) -> List[Path]:
+        """
+        List backup directories, newest first.
         
-        backups = [d for d in backup_dir.iterdir() if d.is_dir()]
-        if not backups:
-            return None
+        Sorted by the timestamp in the name so full_ and incr_ backups
+        interleave correctly. Incomplete backups are left out unless asked for.
+        """
+        if not backup_dir.exists():
+            return []
         
-        # Sort by name (timestamp based)
-        backups.sort(reverse=True)
-        return backups[0]
+        backups = [
+            d for d in backup_dir.iterdir()
+            if d.is_dir() and (include_incomplete or not is_incomplete(d))
+        ]
+        backups.sort(key=lambda d: d.name.split('_', 1)[-1], reverse=True)
+        return backups
     
     def _save_metadata(self, backup_path: Path, metadata: dict) -> None:
-        """Save backup metadata to JSON file."""
+        """
+        Save backup metadata to JSON file.
+        
+        Written atomically and synced, since its presence marks the backup
+        as complete.
+        """
         metadata_file = backup_path / 'metadata.json'
-        with open(metadata_file, 'w') as f:
+        temp_file = backup_path / 'metadata.json.tmp'
+        with open(temp_file, 'w') as f:
             json.dump(metadata, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, metadata_file)
+        fsync_directory(backup_path)
     
     def _load_metadata(self, backup_path: Path) -> dict:
         """Load backup metadata from JSON file."""
@@ -210,21 +903,31 @@ class BackupManager:
         with open(metadata_file, 'r') as f:
             return json.load(f)
     
-    def _save_hashes(self, backup_path: Path, hashes: dict) -> None:
-        """Save file hashes for incremental backup."""
-        hash_file = backup_path / 'hashes.json'
-        with open(hash_file, 'w') as f:
-            json.dump(hashes, f, indent=2)
+    @profiled('save_manifest')
+    def _save_hashes(self, backup_path: Path, hashes: dict, base_backup: Optional[Path] = None,
+                     base_hashes: Optional[dict] = None) -> None:
+        """
+        Save file hashes for incremental backup.
+        
+        Stored as a delta against base_backup's manifest when given, with a
+        full checkpoint every backup.manifest_checkpoint_interval backups.
+        """
+        interval = self.config.get('backup', {}).get('manifest_checkpoint_interval',
+                                                     DEFAULT_CHECKPOINT_INTERVAL)
+        save_manifest(backup_path, hashes, base_backup, base_hashes, interval)
     
-    def _load_hashes(self, backup_path: Path) -> dict:
-        """Load file hashes from backup."""
-        hash_file = backup_path / 'hashes.json'
-        if not hash_file.exists():
-            return {}
+    @profiled('load_manifest')
+    def _load_hashes(self, backup_path: Path, loaded: Optional[Dict[Path, dict]] = None) -> dict:
+        """
+        Load file hashes from backup.
         
-        with open(hash_file, 'r') as f:
-            return json.load(f)
+        Returns:
+            Dict mapping relative paths to {'hash', 'size', 'mtime_ns'}
+            (older backups only recorded the hash)
+        """
+        return load_manifest(backup_path, loaded)
     
+    @profiled('cleanup')
     def _cleanup_old_backups(self, backup_dir: Path) -> None:
         """
         Remove old backups beyond retention limit.
@@ -234,11 +937,37 @@ class BackupManager:
         if not backup_dir.exists():
             return
         
-        backups = sorted([d for d in backup_dir.iterdir() if d.is_dir()], 
-                        reverse=True)
+        # In-progress and interrupted backups are neither counted nor removed
+        backups = self._list_backups(backup_dir)
         
         # Keep only the newest retain_versions
-        for old_backup in backups[retain_versions:]:
+        self._remove_backups(backup_dir, set(backups[retain_versions:]))
+    
+    def _remove_backups(self, backup_dir: Path, removed: Set[Path]) -> None:
+        """
+        Delete backups, except those a kept backup builds on.
+        
+        A kept incremental needs every backup of its chain for the files it
+        did not store itself, so retention only removes whole chains (a full
+        backup or consolidation starts a new one). Kept backups whose
+        manifest is a delta against a removed one are checkpointed first.
+        """
+        backups = self._list_backups(backup_dir)
+        needed = self._chain_members(backup_dir, [b for b in backups if b not in removed])
+        if removed & needed:
+            self.logger.info(f"Keeping {len(removed & needed)} old backups that newer "
+                             f"incrementals build on")
+            removed = removed - needed
+        
+        # Retained backups must not depend on removed ones for their manifest
+        for kept in reversed([b for b in backups if b not in removed]):
+            parent = delta_parent(kept)
+            while parent is not None and parent not in removed:
+                parent = delta_parent(parent)
+            if parent is not None:
+                checkpoint(kept)
+        
+        for old_backup in [b for b in backups if b in removed]:
             try:
                 shutil.rmtree(old_backup)
                 # Inconsistent logging again!
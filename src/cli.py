@@ -2,26 +2,85 @@
 Command-line interface for FileSync.
 
 Provides sync, backup, and restore commands.
+
+Command implementations (engines, backup manager, remote protocol) are
+imported inside the commands that use them, so an invocation only pays
+the import cost of the subsystem it actually runs.
 """
 
 import click
 from pathlib import Path
 import sys
 from .config_manager import ConfigManager
-from .sync_engine import SyncEngine
-from .backup_manager import BackupManager
 from .logger import setup_logging
+from .utils import format_size
 import logging
 
 
+def _echo_latency(stats: dict) -> None:
+    """Show how long after the start files were committed."""
+    for prefix, label in (('latency', 'Latency'), ('priority_latency', 'Priority latency')):
+        if f'{prefix}_max' in stats:
+            click.echo(f"  {label}: p50 {stats[f'{prefix}_p50']:.2f}s, "
+                       f"p90 {stats[f'{prefix}_p90']:.2f}s, p99 {stats[f'{prefix}_p99']:.2f}s, "
+                       f"max {stats[f'{prefix}_max']:.2f}s")
+
+
+def _echo_rates(stats: dict) -> None:
+    """Show achieved I/O rates, with the limits when throttled."""
+    if 'rate_bytes_per_sec' not in stats:
+        return
+    line = f"  Rate: {format_size(stats['rate_bytes_per_sec'])}/s, {stats['rate_iops']} IOPS"
+    if stats['limit_bytes_per_sec'] or stats['limit_iops']:
+        byte_limit = (f"{format_size(stats['limit_bytes_per_sec'])}/s"
+                      if stats['limit_bytes_per_sec'] else 'unlimited')
+        iops_limit = stats['limit_iops'] or 'unlimited'
+        line += (f" (limit {byte_limit}, {iops_limit} IOPS; "
+                 f"throttled {stats['throttled_seconds']:.1f}s)")
+    click.echo(line)
+
+
+def _log_to_stderr() -> None:
+    """Move console logging off standard output."""
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, logging.StreamHandler) and handler.stream is sys.stdout:
+            handler.setStream(sys.stderr)
+
+
+def _echo_stalls(stats: dict) -> None:
+    """Show files the watchdog gave up waiting for."""
+    if not stats.get('stalled'):
+        return
+    click.echo(f"  Stalled: {stats['stalled']} times, {stats['stall_seconds']:.1f}s lost")
+    for path in stats['stalled_paths']:
+        click.echo(f"    {path}")
+
+
 @click.group()
 @click.option('--config', type=click.Path(exists=True), help='Path to config file')
 @click.option('--verbose', is_flag=True, help='Enable verbose output')
+@click.option('--profile', is_flag=True,
+              help='Profile the command (time and memory per phase, flamegraph stacks)')
+@click.option('--profile-dir', type=click.Path(file_okay=False), default='filesync-profile',
+              show_default=True, help='Where --profile writes its reports')
 @click.pass_context
-def cli(ctx, config, verbose):
+def cli(ctx, config, verbose, profile, profile_dir):
     """FileSync - Backup and synchronization tool."""
     ctx.ensure_object(dict)
     
+    if profile:
+        # Imported only here: without --profile the phase markers are no-ops
+        from .profiling import Profiler
+        profiler = Profiler(Path(profile_dir))
+        profiler.start()
+        
+        def report():
+            written = profiler.stop()
+            click.echo(f"Profile written to {profile_dir}: "
+                       f"{', '.join(p.name for p in written)}", err=True)
+        
+        ctx.call_on_close(report)
+    
     # Load configuration
     config_path = Path(config) if config else Path('config.yaml')
     config_manager = ConfigManager(config_path if config_path.exists() else None)
@@ -38,29 +97,46 @@ def cli(ctx, config, verbose):
 
 @cli.command()
 @click.argument('source', type=click.Path(exists=True))
-@click.argument('destination', type=click.Path())
+@click.argument('destinations', nargs=-1, required=True, type=click.Path())
 @click.option('--dry-run', is_flag=True, help='Show what would be done without making changes')
+@click.option('--shards', type=int, help='Sync in this many processes (0 = one per CPU)')
 @click.pass_context
-def sync(ctx, source, destination, dry_run):
+def sync(ctx, source, destinations, dry_run, shards):
     """
     Synchronize files between SOURCE and DESTINATION directories.
     
+    With several DESTINATIONS, each changed source file is read once and
+    written to every destination that needs it.
+    
     Examples:
         filesync sync /path/to/source /path/to/dest
         filesync sync --dry-run /home/user/docs /backup/docs
+        filesync sync --shards 32 /data /replica/data
+        filesync sync /data filesync://replica-host:8730
+        filesync sync /data /replica /mnt/nas/data /mnt/backup/data
     """
     config = ctx.obj['config']
     logger = logging.getLogger(__name__)
     
     source_path = Path(source)
+    destination = destinations[0]
     dest_path = Path(destination)
+    remote = False
+    if any('://' in d for d in destinations):
+        from .remote import parse_remote
+        remote = any(parse_remote(d) is not None for d in destinations)
+        if remote and len(destinations) > 1:
+            click.echo("Error: A remote destination can't be combined with others", err=True)
+            sys.exit(1)
     
     if not source_path.exists():
         click.echo(f"Error: Source directory does not exist: {source}", err=True)
         sys.exit(1)
     
-    # Create destination if it doesn't exist
-    dest_path.mkdir(parents=True, exist_ok=True)
+    # Create destinations if they don't exist
+    if not remote:
+        for d in destinations:
+            Path(d).mkdir(parents=True, exist_ok=True)
     
     if dry_run:
         click.echo("DRY RUN - No changes will be made")
@@ -68,18 +144,49 @@ def sync(ctx, source, destination, dry_run):
         return
     
     try:
-        engine = SyncEngine(str(source_path), str(dest_path), config)
+        if shards is None:
+            shards = config['sync'].get('shards', 1)
+        
+        if remote:
+            from .remote import RemoteSyncEngine
+            engine = RemoteSyncEngine(str(source_path), destination, config)
+        elif len(destinations) > 1:
+            from .fanout import FanoutSyncEngine
+            engine = FanoutSyncEngine(str(source_path), list(destinations), config)
+        elif shards == 1:
+            from .sync_engine import SyncEngine
+            engine = SyncEngine(str(source_path), str(dest_path), config)
+        else:
+            from .sharding import ShardedSyncEngine
+            engine = ShardedSyncEngine(str(source_path), str(dest_path), config, shards)
         
-        click.echo(f"Syncing {source} -> {destination}")
+        click.echo(f"Syncing {source} -> {', '.join(destinations)}")
         stats = engine.sync()
         
         # Display results
         click.echo("\nSync completed:")
+        for name, dest_stats in stats.get('destinations', {}).items():
+            click.echo(f"  {name}: {dest_stats['copied']} copied, {dest_stats['updated']} updated, "
+                       f"{dest_stats['deleted']} deleted, {dest_stats['skipped']} skipped, "
+                       f"{dest_stats['errors']} errors")
+        if 'bytes_read' in stats:
+            click.echo(f"  Source read: {format_size(stats['bytes_read'])}")
         click.echo(f"  Copied: {stats['copied']}")
         click.echo(f"  Updated: {stats['updated']}")
         click.echo(f"  Deleted: {stats['deleted']}")
         click.echo(f"  Skipped: {stats['skipped']}")
         click.echo(f"  Errors: {stats['errors']}")
+        click.echo(f"  Bytes: {format_size(stats['bytes_logical'])} logical, "
+                   f"{format_size(stats['bytes_physical'])} physical")
+        if stats.get('deduped'):
+            click.echo(f"  Deduped: {stats['deduped']} files as reflinks, "
+                       f"{format_size(stats['bytes_deduped'])} saved")
+        if 'listings_reused' in stats:
+            click.echo(f"  Directories: {stats['listings_reused']} unchanged, "
+                       f"{stats['listings_read']} read")
+        _echo_latency(stats)
+        _echo_rates(stats)
+        _echo_stalls(stats)
         
     except KeyboardInterrupt:
         click.echo("\nSync interrupted by user")
@@ -120,6 +227,7 @@ def backup(ctx, source, backup_dir, backup_type):
     backup_path.mkdir(parents=True, exist_ok=True)
     
     try:
+        from .backup_manager import BackupManager
         manager = BackupManager(config)
         
         click.echo(f"Creating {config['backup']['type']} backup...")
@@ -134,7 +242,16 @@ def backup(ctx, source, backup_dir, backup_type):
         click.echo(f"  Files copied: {result['files_copied']}")
         if 'files_skipped' in result:
             click.echo(f"  Files skipped: {result['files_skipped']}")
+        if result.get('files_packed'):
+            click.echo(f"  Files packed: {result['files_packed']}")
         click.echo(f"  Errors: {result['errors']}")
+        click.echo(f"  Bytes: {format_size(result['bytes_logical'])} logical, "
+                   f"{format_size(result['bytes_physical'])} physical")
+        if result.get('files_deduped'):
+            click.echo(f"  Deduped: {result['files_deduped']} files as hardlinks, "
+                       f"{format_size(result['bytes_deduped'])} saved")
+        _echo_rates(result)
+        _echo_stalls(result)
         
     except Exception as e:
         # Missing specific error handling!
@@ -161,6 +278,7 @@ def restore(ctx, backup_path, destination):
     dest_path.mkdir(parents=True, exist_ok=True)
     
     try:
+        from .backup_manager import BackupManager
         manager = BackupManager(config)
         
         click.echo(f"Restoring from {backup_path}")
@@ -171,6 +289,8 @@ def restore(ctx, backup_path, destination):
         click.echo("\nRestore completed:")
         click.echo(f"  Files restored: {result['restored']}")
         click.echo(f"  Errors: {result['errors']}")
+        _echo_rates(result)
+        _echo_stalls(result)
         
     except FileNotFoundError as e:
         click.echo(f"Error: {e}", err=True)
@@ -180,6 +300,205 @@ def restore(ctx, backup_path, destination):
         sys.exit(1)
 
 
+@cli.command()
+@click.argument('backup_dir', type=click.Path(exists=True, file_okay=False))
+@click.option('--retire', is_flag=True, help='Remove the merged backups afterwards')
+@click.pass_context
+def consolidate(ctx, backup_dir, retire):
+    """
+    Merge the newest backup in BACKUP_DIR and the backups it builds on
+    into a new synthetic full backup, without reading the source.
+    
+    Examples:
+        filesync consolidate /backups
+        filesync consolidate --retire /backups/data
+    """
+    config = ctx.obj['config']
+    
+    try:
+        from .backup_manager import BackupManager
+        result = BackupManager(config).consolidate(Path(backup_dir), retire=retire)
+    except KeyboardInterrupt:
+        click.echo("\nConsolidation interrupted by user (rerun to resume)")
+        sys.exit(1)
+    except Exception as e:
+        click.echo(f"Consolidation failed: {e}", err=True)
+        sys.exit(1)
+    
+    click.echo("Consolidation completed:")
+    click.echo(f"  Merged: {', '.join(result['consolidated'])}")
+    click.echo(f"  Timestamp: {result['timestamp']}")
+    click.echo(f"  Files: {result['files_copied']} ({result['files_linked']} linked, "
+               f"{result['files_packed']} packed)")
+    click.echo(f"  Errors: {result['errors']}")
+    click.echo(f"  Bytes: {format_size(result['bytes_logical'])} copied, "
+               f"{format_size(result['bytes_linked'])} linked")
+    
+    if result['errors']:
+        sys.exit(1)
+
+
+@cli.command()
+@click.argument('backup', type=click.Path(exists=True, file_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['tar', 'tar.gz', 'tar.zst']),
+              help='Archive format (default: from the output name, else tar)')
+@click.option('-o', '--output', default='-', show_default=True,
+              help="File to write, or '-' for standard output")
+@click.pass_context
+def export(ctx, backup, fmt, output):
+    """
+    Stream BACKUP as a tar archive, including files it shares with the
+    backups it builds on.
+    
+    Examples:
+        filesync export /backups/full_20231201_120000 -o data.tar.gz
+        filesync export --format tar.zst /backups/incr_20231202_120000 | ssh offsite 'cat > data.tar.zst'
+    """
+    config = ctx.obj['config']
+    
+    try:
+        from .export import BackupExporter
+        exporter = BackupExporter(config)
+        if output == '-':
+            # Standard output carries the archive, so messages go to stderr
+            _log_to_stderr()
+            result = exporter.export(Path(backup), sys.stdout.buffer, fmt or 'tar')
+        else:
+            result = exporter.export_file(Path(backup), Path(output), fmt)
+    except KeyboardInterrupt:
+        click.echo("\nExport interrupted by user", err=True)
+        sys.exit(1)
+    except Exception as e:
+        click.echo(f"Export failed: {e}", err=True)
+        sys.exit(1)
+    
+    click.echo(f"Exported {result['files']} files ({format_size(result['bytes'])}), "
+               f"wrote {format_size(result['bytes_written'])}", err=True)
+    for path in result['missing_paths']:
+        click.echo(f"  MISSING: {path}", err=True)
+    
+    if result['missing']:
+        sys.exit(1)
+
+
+@cli.command('run-jobs')
+@click.argument('names', nargs=-1)
+@click.pass_context
+def run_jobs(ctx, names):
+    """
+    Run the jobs in the config's jobs section (or only NAMES) together.
+    
+    Jobs share the scheduler's worker, bytes/s and IOPS budget, start in
+    priority order, and heavy jobs never share a device.
+    
+    Examples:
+        filesync run-jobs
+        filesync --config jobs.yaml run-jobs home photos
+    """
+    config = ctx.obj['config']
+    
+    try:
+        from .jobs import JobScheduler
+        summary = JobScheduler(config).run(names or None)
+    except KeyboardInterrupt:
+        click.echo("\nJobs interrupted by user")
+        sys.exit(1)
+    except Exception as e:
+        click.echo(f"Jobs failed: {e}", err=True)
+        sys.exit(1)
+    
+    click.echo("Jobs completed:")
+    for result in summary['jobs']:
+        line = (f"  {result['name']} ({result['type']}): {result['status']}, "
+                f"{result['seconds']:.1f}s, {format_size(result['io_bytes'])} moved, "
+                f"{format_size(result['rate_bytes_per_sec'])}/s, {result['errors']} errors")
+        if result['status'] != 'ok':
+            line += f" - {result['error']}"
+        click.echo(line)
+    click.echo(f"  Total: {len(summary['jobs'])} jobs, {summary['failed']} failed, "
+               f"{summary['seconds']:.1f}s, {format_size(summary['io_bytes'])} moved")
+    _echo_rates(summary)
+    
+    if summary['failed'] or any(result['errors'] for result in summary['jobs']):
+        sys.exit(1)
+
+
+@cli.command()
+@click.argument('backup_dir', type=click.Path(exists=True, file_okay=False))
+@click.option('--max-time', type=float, help='Stop after this many seconds')
+@click.option('--max-bytes', type=int, help='Stop after checking this many bytes')
+@click.pass_context
+def scrub(ctx, backup_dir, max_time, max_bytes):
+    """
+    Verify stored backups in BACKUP_DIR against their recorded hashes.
+    
+    Each run checks the files verified longest ago (never-verified files
+    first) until its budget runs out, so regular runs cover the whole
+    archive over time.
+    
+    Examples:
+        filesync scrub /backups
+        filesync scrub --max-time 3600 /backups
+    """
+    config = ctx.obj['config']
+    
+    try:
+        from .scrub import Scrubber
+        result = Scrubber(config).scrub(Path(backup_dir), max_seconds=max_time, max_bytes=max_bytes)
+    except KeyboardInterrupt:
+        click.echo("\nScrub interrupted by user (progress saved)")
+        sys.exit(1)
+    except Exception as e:
+        click.echo(f"Scrub failed: {e}", err=True)
+        sys.exit(1)
+    
+    click.echo("Scrub completed:")
+    click.echo(f"  Verified: {result['verified']} ({format_size(result['bytes'])})")
+    click.echo(f"  Corrupt: {result['corrupt']}")
+    click.echo(f"  Missing: {result['missing']}")
+    click.echo(f"  Without hashes: {result['unverifiable']}")
+    click.echo(f"  Left for later runs: {result['remaining']}")
+    for key in result['corrupt_files']:
+        click.echo(f"  CORRUPT: {key}", err=True)
+    
+    if result['corrupt'] or result['missing']:
+        sys.exit(1)
+
+
+@cli.command()
+@click.argument('root', type=click.Path(exists=True, file_okay=False))
+@click.option('--host', default='127.0.0.1', help='Address to listen on')
+@click.option('--port', type=int, default=8730, help='TCP port to listen on')
+@click.option('--socket', 'unix_socket', type=click.Path(), help='Listen on a Unix socket instead')
+@click.pass_context
+def serve(ctx, root, host, port, unix_socket):
+    """
+    Serve ROOT as a remote sync destination.
+    
+    Clients sync to it with a filesync://HOST:PORT or
+    filesync+unix:///path/to/socket destination. If ~/.backup_auth holds an
+    API key, clients must present the same key; without one, only loopback
+    addresses and Unix sockets are served. Traffic is not encrypted.
+    
+    Examples:
+        filesync serve /srv/replica --host 0.0.0.0
+        filesync serve /srv/replica --socket /run/filesync.sock
+    """
+    config = ctx.obj['config']
+    
+    try:
+        from .remote import SyncServer, load_api_key
+        server = SyncServer(Path(root), config, host=host, port=port,
+                            unix_socket=unix_socket, api_key=load_api_key())
+        click.echo(f"Serving {root} on {server.address}")
+        server.serve_forever()
+    except KeyboardInterrupt:
+        click.echo("\nServer stopped")
+    except (OSError, ValueError) as e:
+        click.echo(f"Error: {e}", err=True)
+        sys.exit(1)
+
+
 @cli.command()
 @click.argument('directory', type=click.Path(exists=True))
 @click.pass_context
@@ -2,14 +2,42 @@
 Configuration management for FileSync.
 
 Loads and validates configuration from YAML files.
+
+Parsing YAML (and importing yaml at all) is a noticeable part of CLI
+startup, so the merged configuration is cached in marshal form next to
+other per-user cache data, keyed by the config file's path, mtime and
+size. The cache is only an accelerator: any problem reading or writing it
+falls back to parsing the YAML file.
 """
 
-import yaml
+import contextlib
+import copy
+import marshal
+import os
+import sys
+import zlib
 from pathlib import Path
 from typing import Optional
 import logging
 
 
+# Accepted export.zstd_level range; negative levels are zstd's fast modes (--fast=N)
+ZSTD_MIN_LEVEL = -7
+ZSTD_MAX_LEVEL = 22
+
+
+def _yaml_loader():
+    """Return the fastest safe YAML loader available (libyaml if compiled in)."""
+    import yaml
+    return getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def default_cache_dir() -> Path:
+    """Return the directory used for cached parsed configs."""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return Path(base) / 'filesync'
+
+
 class ConfigManager:
     """Handles configuration loading and validation."""
     
@@ -18,12 +46,77 @@ class ConfigManager:
             'mode': 'bidirectional',
             'delete_orphaned': False,
             'check_timestamps': True,
-            'buffer_size': 65536
+            'buffer_size': 65536,
+            'mmap_threshold': 268435456,
+            'durability': 'batch',
+            'durability_batch_size': 1000,
+            'parallel_copy_threshold': 1073741824,
+            'parallel_copy_workers': 4,
+            'parallel_copy_range': 67108864,
+            'range_hash': False,
+            'hash_cache': False,
+            'listing_cache': False,
+            'verify': False,
+            'dedup': False,
+            'order': 'walk',
+            'priority_globs': [],
+            'shards': 1
         },
         'backup': {
             'type': 'incremental',
             'retain_versions': 5,
-            'compression': False
+            'compression': False,
+            'pack_threshold': 0,
+            'pack_size': 268435456,
+            'manifest_checkpoint_interval': 10,
+            'dedup': False,
+            'order': 'walk',
+            'listing_cache': False,
+            'consolidate_workers': 4
+        },
+        'fanout': {
+            'workers': 4,
+            'buffers': 4,
+            'block_size': 1048576
+        },
+        'export': {
+            'workers': 4,
+            'block_size': 1048576,
+            'gzip_level': 6,
+            'zstd_level': 3
+        },
+        'dedup': {
+            'min_size': 4096,
+            'sample_size': 65536
+        },
+        'scrub': {
+            'max_seconds': 0,
+            'max_bytes': 0,
+            'workers': 4
+        },
+        'throttle': {
+            'bytes_per_sec': 0,
+            'iops': 0,
+            'windows': [],
+            'nice': 0,
+            'ioprio': None,
+            'fadvise': False
+        },
+        'scheduler': {
+            'workers': 2,
+            'bytes_per_sec': 0,
+            'iops': 0
+        },
+        'jobs': [],
+        'watchdog': {
+            'file_timeout': 0,
+            'bytes_per_sec': 0,
+            'stall_timeout': 0,
+            'retries': 1
+        },
+        'remote': {
+            'window': 64,
+            'block_size': 131072
         },
         'filters': {
             'exclude': ['*.tmp', '*.log', '.git', '__pycache__'],
@@ -36,9 +129,11 @@ class ConfigManager:
         }
     }
     
-    def __init__(self, config_path: Optional[Path] = None):
+    def __init__(self, config_path: Optional[Path] = None, cache_dir: Optional[Path] = None):
         self.config_path = config_path
-        self.config = self.DEFAULT_CONFIG.copy()
+        # Deep copy so merging a config file never alters DEFAULT_CONFIG
+        self.config = copy.deepcopy(self.DEFAULT_CONFIG)
+        self.cache_dir = cache_dir if cache_dir is not None else default_cache_dir()
         
         if config_path and config_path.exists():
             self.load_config(config_path)
@@ -47,11 +142,22 @@ class ConfigManager:
         """
         Load configuration from YAML file.
         
-        Merges with default configuration.
+        Merges with default configuration. A cached copy of the merged
+        result is used when the file has not changed since it was parsed;
+        only configs that pass validate() are cached.
         """
+        cache_key = self._cache_key(config_path)
+        cached = self._read_cache(cache_key)
+        if cached is not None:
+            self.config = cached
+            print(f"Loaded configuration from {config_path}", file=sys.stderr)
+            return self.config
+        
+        import yaml
+        
         try:
             with open(config_path, 'r') as f:
-                user_config = yaml.safe_load(f)
+                user_config = yaml.load(f, Loader=_yaml_loader())
             
             # Merge with defaults (shallow merge)
             if user_config:
@@ -61,17 +167,72 @@ class ConfigManager:
                     else:
                         self.config[key] = value
             
-            print(f"Loaded configuration from {config_path}")
+            print(f"Loaded configuration from {config_path}", file=sys.stderr)
+            # Its warnings go to stderr with the other load messages
+            with contextlib.redirect_stdout(sys.stderr):
+                valid = self.validate()
+            if valid:
+                self._write_cache(cache_key)
             
         except yaml.YAMLError as e:
             # Different error handling pattern
             raise ValueError(f"Invalid YAML in config file: {e}")
         except Exception as e:
-            print(f"Warning: Could not load config from {config_path}: {e}")
-            print("Using default configuration")
+            print(f"Warning: Could not load config from {config_path}: {e}", file=sys.stderr)
+            print("Using default configuration", file=sys.stderr)
         
         return self.config
     
+    def _cache_key(self, config_path: Path) -> Optional[tuple]:
+        """
+        Identify one version of a config file.
+        
+        Includes the defaults so a release with new defaults never reuses a
+        merge made against the old ones.
+        """
+        try:
+            st = os.stat(config_path)
+        except OSError:
+            return None
+        defaults = zlib.crc32(repr(self.DEFAULT_CONFIG).encode())
+        return (os.path.abspath(config_path), st.st_mtime_ns, st.st_size, defaults)
+    
+    def _cache_file(self, cache_key: tuple) -> Path:
+        """Return the cache file for a config path."""
+        return self.cache_dir / f"config-{zlib.crc32(cache_key[0].encode()):08x}.bin"
+    
+    def _read_cache(self, cache_key: Optional[tuple]) -> Optional[dict]:
+        """Return the cached merged config for cache_key, or None on a miss."""
+        if cache_key is None:
+            return None
+        try:
+            with open(self._cache_file(cache_key), 'rb') as f:
+                key, config = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if tuple(key) != cache_key or not isinstance(config, dict):
+            return None
+        return config
+    
+    def _write_cache(self, cache_key: Optional[tuple]) -> None:
+        """Store the merged config for cache_key, ignoring any failure."""
+        if cache_key is None:
+            return
+        cache_file = self._cache_file(cache_key)
+        temp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}")
+        try:
+            data = marshal.dumps((cache_key, self.config))
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            with open(temp_file, 'wb') as f:
+                f.write(data)
+            os.replace(temp_file, cache_file)
+        except (OSError, ValueError):
+            # Unmarshallable values (e.g. YAML dates) or an unwritable cache dir
+            try:
+                temp_file.unlink()
+            except OSError:
+                pass
+    
     def get(self, key: str, default=None):
         """Get configuration value by key."""
         keys = key.split('.')
@@ -103,15 +264,114 @@ class ConfigManager:
             print(f"Warning: Invalid backup type: {backup_type}")
             return False
         
+        # Check pack settings (a threshold of 0 disables packing)
+        pack_threshold = self.get('backup.pack_threshold', 0)
+        if not isinstance(pack_threshold, int) or pack_threshold < 0:
+            print(f"Warning: Invalid pack threshold: {pack_threshold}")
+            return False
+        
         # Check buffer size
         buffer_size = self.get('sync.buffer_size')
-        if not isinstance(buffer_size, int) or buffer_size <= 0:
+        if buffer_size != 'auto' and (not isinstance(buffer_size, int) or buffer_size <= 0):
             print(f"Warning: Invalid buffer size: {buffer_size}")
             return False
         
+        # Check mmap threshold (0 disables mmap hashing)
+        mmap_threshold = self.get('sync.mmap_threshold', 0)
+        if not isinstance(mmap_threshold, int) or mmap_threshold < 0:
+            print(f"Warning: Invalid mmap threshold: {mmap_threshold}")
+            return False
+        
+        # Check durability mode
+        durability = self.get('sync.durability', 'batch')
+        if durability not in ['none', 'batch', 'per-file']:
+            print(f"Warning: Invalid durability mode: {durability}")
+            return False
+        
+        # Check parallel copy settings (a threshold of 0 disables ranged copies)
+        for key in ('sync.parallel_copy_threshold', 'sync.parallel_copy_workers',
+                    'sync.parallel_copy_range'):
+            value = self.get(key, 0)
+            if not isinstance(value, int) or value < 0:
+                print(f"Warning: Invalid {key}: {value}")
+                return False
+        
+        # Check copy order
+        order = self.get('sync.order', 'walk')
+        if order not in ['walk', 'mtime_desc', 'size_asc', 'priority_globs', 'physical']:
+            print(f"Warning: Invalid sync order: {order}")
+            return False
+        if self.get('backup.order', 'walk') not in ['walk', 'physical']:
+            print(f"Warning: Invalid backup order: {self.get('backup.order')}")
+            return False
+        
+        # Check dedup and fan-out settings
+        for key in ('dedup.min_size', 'dedup.sample_size', 'fanout.workers', 'fanout.buffers',
+                    'fanout.block_size', 'backup.consolidate_workers', 'export.workers',
+                    'export.block_size', 'scheduler.workers'):
+            value = self.get(key, 1)
+            if not isinstance(value, int) or value <= 0:
+                print(f"Warning: Invalid {key}: {value}")
+                return False
+        
+        # Check compression levels (gzip 0 stores, negative zstd levels are the fast ones)
+        gzip_level = self.get('export.gzip_level', 6)
+        if not isinstance(gzip_level, int) or not 0 <= gzip_level <= 9:
+            print(f"Warning: Invalid export.gzip_level: {gzip_level}")
+            return False
+        zstd_level = self.get('export.zstd_level', 3)
+        if not isinstance(zstd_level, int) or not ZSTD_MIN_LEVEL <= zstd_level <= ZSTD_MAX_LEVEL:
+            print(f"Warning: Invalid export.zstd_level: {zstd_level}")
+            return False
+        
+        # Check shard count (0 means one per CPU)
+        shards = self.get('sync.shards', 1)
+        if not isinstance(shards, int) or shards < 0:
+            print(f"Warning: Invalid shard count: {shards}")
+            return False
+        
+        # Check throttle limits and the shared job budget (0 means unlimited)
+        for key in ('throttle.bytes_per_sec', 'throttle.iops', 'scheduler.bytes_per_sec',
+                    'scheduler.iops'):
+            limit = self.get(key, 0)
+            if not isinstance(limit, int) or limit < 0:
+                print(f"Warning: Invalid {key}: {limit}")
+                return False
+        
+        ioprio = self.get('throttle.ioprio')
+        if ioprio not in [None, 'idle', 'best-effort']:
+            print(f"Warning: Invalid I/O priority: {ioprio}")
+            return False
+        
+        # Check job definitions
+        jobs = self.get('jobs') or []
+        if not isinstance(jobs, list):
+            print(f"Warning: Invalid jobs section: {jobs}")
+            return False
+        for job in jobs:
+            if not isinstance(job, dict) or not job.get('name') or \
+                    job.get('type', 'sync') not in ['sync', 'backup'] or \
+                    not job.get('source') or not job.get('destination'):
+                print(f"Warning: Invalid job: {job}")
+                return False
+            priority = job.get('priority', 0)
+            if not isinstance(priority, int) or isinstance(priority, bool):
+                print(f"Warning: Invalid priority for job {job['name']}: {priority}")
+                return False
+        
+        # Check watchdog deadlines (0 means no deadline)
+        for key in ('watchdog.file_timeout', 'watchdog.bytes_per_sec',
+                    'watchdog.stall_timeout', 'watchdog.retries'):
+            value = self.get(key, 0)
+            if not isinstance(value, (int, float)) or value < 0:
+                print(f"Warning: Invalid {key}: {value}")
+                return False
+        
         return True
     
     def save_config(self, config_path: Path) -> None:
         """Save current configuration to YAML file."""
+        import yaml
+        
         with open(config_path, 'w') as f:
             yaml.dump(self.config, f, default_flow_style=False)
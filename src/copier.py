@@ -0,0 +1,573 @@
+"""
+File copy module with atomic writes and batched durability.
+
+Every copy is written to a temporary name in the destination directory
+and renamed into place, so a crash never leaves a truncated file under
+the final name. How hard we push data to stable storage is controlled by
+the sync.durability setting:
+    
+    none     - rename as soon as the data is written, never sync
+    batch    - hold renames until the batch is flushed, then syncfs (or
+               fdatasync the batch), rename and fsync the touched directories
+    per-file - fdatasync each file before its rename and fsync its directory
+
+Temp files left behind by a crash are removed by the next sync as its
+scan comes across them.
+
+Files at or above sync.parallel_copy_threshold are preallocated and copied
+as disjoint ranges by a thread pool using positioned I/O, so one huge file
+is not limited to a single sequential stream. Copies that must also yield
+the whole-file hash stay sequential, so the source is read only once.
+
+A copy can also feed the source contents into a hash as they are read
+(copy_hashed), so callers that need the content hash don't read the file
+twice, and sync.verify re-reads each copy from storage to check it.
+
+link() materialises a file from an identical one already at the
+destination, as a hardlink or a reflink (copy-on-write clone), for
+destination-side dedup.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import hashlib
+import itertools
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional, List, Tuple
+from .hasher import FileHasher, DEFAULT_RANGE_SIZE, combine_range_hashes, update_zeros
+from .profiling import profiled
+from .throttle import Throttle
+from .utils import TEMP_PREFIX, is_sparse, data_extents
+from . import watchdog
+import logging
+
+
+DURABILITY_MODES = ('none', 'batch', 'per-file')
+# ioctl(dst, FICLONE, src) shares all of src's extents with dst (Linux)
+FICLONE = 0x40049409
+# Errors meaning the filesystem pair cannot clone, rather than a real failure
+_NO_REFLINK_ERRNOS = {errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS}
+
+
+def fsync_directory(directory: Path) -> None:
+    """Flush a directory entry table so renames into it survive a crash."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        # Some filesystems refuse fsync on directories
+        pass
+    finally:
+        os.close(fd)
+
+
+def datasync(fd: int) -> None:
+    """Flush file data (and only the metadata needed to read it back)."""
+    if hasattr(os, 'fdatasync'):
+        os.fdatasync(fd)
+    else:
+        os.fsync(fd)
+
+
+def write_all(dst, data: memoryview) -> None:
+    """Write all of data to an unbuffered file, retrying short writes."""
+    while data:
+        n = dst.write(data)
+        data = data[n:]
+
+
+def pread_into(fd: int, view: memoryview, offset: int) -> int:
+    """Read into view at offset without moving the file position."""
+    if hasattr(os, 'preadv'):
+        return os.preadv(fd, [view], offset)
+    data = os.pread(fd, len(view), offset)
+    view[:len(data)] = data
+    return len(data)
+
+
+def pwrite_all(fd: int, data: memoryview, offset: int) -> None:
+    """Write all of data at offset, retrying short writes."""
+    while data:
+        n = os.pwrite(fd, data, offset)
+        data = data[n:]
+        offset += n
+
+
+def reflink(src_fd: int, dst_fd: int) -> bool:
+    """Clone src into dst. Returns False if the filesystem cannot do it."""
+    try:
+        import fcntl
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+    except ImportError:
+        return False
+    except OSError as e:
+        if e.errno in _NO_REFLINK_ERRNOS:
+            return False
+        raise
+    return True
+
+
+_libc = None
+
+
+def _syncfs(fd: int) -> bool:
+    """Call syncfs(2) on the filesystem holding fd. Returns False if unsupported."""
+    global _libc
+    if _libc is None:
+        try:
+            _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        except OSError:
+            _libc = False
+    if not _libc or not hasattr(_libc, 'syncfs'):
+        return False
+    return _libc.syncfs(fd) == 0
+
+
+class FileCopier:
+    """Copies files atomically, syncing them according to the durability mode."""
+    
+    def __init__(self, config: dict, hasher: Optional[FileHasher] = None,
+                 throttle: Optional[Throttle] = None):
+        sync_config = config.get('sync', {})
+        self.durability = sync_config.get('durability', 'batch')
+        self.batch_size = sync_config.get('durability_batch_size', 1000)
+        self.hasher = hasher or FileHasher.from_config(config, throttle=throttle)
+        # Shared with the hasher so copies and hashes draw on the same limits
+        self.throttle = throttle or self.hasher.throttle
+        self.parallel_threshold = sync_config.get('parallel_copy_threshold', 1024 ** 3)
+        self.parallel_workers = sync_config.get('parallel_copy_workers', 4)
+        self.range_size = sync_config.get('parallel_copy_range', DEFAULT_RANGE_SIZE)
+        self.range_hash = sync_config.get('range_hash', False)
+        self.verify = sync_config.get('verify', False)
+        # Cleared after the first clone the destination filesystem refuses
+        self.reflink_supported = True
+        self.logger = logging.getLogger(__name__)
+        
+        if self.durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode: {self.durability}")
+        
+        self._lock = threading.Lock()
+        # One flush at a time, so a batch is never renamed twice
+        self._flush_lock = threading.RLock()
+        self._local = threading.local()
+        # (temp path, final path, on_commit) waiting for the next batch flush
+        self._pending: List[Tuple[Path, Path, Optional[Callable[[], None]]]] = []
+        self._counter = itertools.count()
+        self.reset_stats()
+    
+    def reset_stats(self) -> None:
+        """
+        Reset the byte counters.
+        
+        bytes_logical is the total size of the files copied; bytes_physical
+        is what was actually read and written, which is less when sparse
+        files have their holes skipped. Files written by link() count as
+        deduped instead, with their size in bytes_deduped.
+        """
+        with self._lock:
+            self.stats = {'bytes_logical': 0, 'bytes_physical': 0, 'sparse_files': 0, 'verified': 0,
+                          'deduped': 0, 'bytes_deduped': 0}
+    
+    def copy(self, source: Path, destination: Path,
+             on_commit: Optional[Callable[[], None]] = None, digest=None) -> int:
+        """
+        Copy source to destination, preserving modification time and mode.
+        
+        Args:
+            source: File to copy
+            destination: Final destination path
+            on_commit: Called once the copy is in place under its final
+                name and as durable as the durability mode promises
+            digest: hashlib object to feed the contents into while copying
+        
+        Returns:
+            Number of bytes written (holes in sparse files excluded)
+        """
+        return self._copy(source, destination, on_commit, digest)[0]
+    
+    def copy_tree_hashed(self, source: Path, destination: Path,
+                         on_commit: Optional[Callable[[], None]] = None) -> Optional[str]:
+        """
+        Copy source to destination and return its tree hash.
+        
+        Only files copied in parallel ranges with sync.range_hash get one
+        (None otherwise); it matches FileHasher.tree_hash() with
+        sync.parallel_copy_range as the range size.
+        """
+        return self._copy(source, destination, on_commit)[1]
+    
+    def _copy(self, source: Path, destination: Path,
+              on_commit: Optional[Callable[[], None]] = None,
+              digest=None) -> Tuple[int, Optional[str]]:
+        """Copy as for copy(), returning (bytes written, tree hash or None)."""
+        temp_path = self.temp_path_for(destination)
+        if self.verify and digest is None:
+            digest = hashlib.new(self.hasher.algorithm)
+        
+        try:
+            written, tree_hash = self._write_temp(source, temp_path, digest)
+            shutil.copystat(source, temp_path)
+            if self.verify:
+                self._verify(temp_path, destination, digest.hexdigest())
+        except BaseException:
+            self._discard(temp_path)
+            raise
+        
+        self.commit(temp_path, destination, on_commit)
+        return written, tree_hash
+    
+    def copy_hashed(self, source: Path, destination: Path,
+                    on_commit: Optional[Callable[[], None]] = None) -> str:
+        """
+        Copy source to destination and return its content hash.
+        
+        The hash is computed from the same reads as the copy, and matches
+        FileHasher.hash_file() for the source.
+        """
+        digest = hashlib.new(self.hasher.algorithm)
+        self.copy(source, destination, on_commit, digest=digest)
+        return digest.hexdigest()
+    
+    def link(self, existing: Path, source: Path, destination: Path, hardlink: bool = False,
+             on_commit: Optional[Callable[[], None]] = None) -> bool:
+        """
+        Write destination as a link to an identical file already stored.
+        
+        A hardlink shares existing's inode (and so its mode and mtime); a
+        reflink is a separate file sharing existing's data blocks, and gets
+        source's mode and mtime. Either way it is committed like a copy.
+        
+        Args:
+            existing: Committed file with the same contents as source
+            source: File the destination stands for
+            destination: Final destination path
+            hardlink: Hardlink instead of reflink
+            on_commit: As for copy()
+        
+        Returns:
+            False if the filesystem cannot link these files (nothing is
+            written; copy source instead)
+        """
+        if not hardlink and not self.reflink_supported:
+            return False
+        
+        temp_path = self.temp_path_for(destination)
+        try:
+            if hardlink:
+                try:
+                    os.link(existing, temp_path)
+                except OSError as e:
+                    if e.errno in (errno.EMLINK, errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP):
+                        return False
+                    raise
+            else:
+                with open(existing, 'rb') as src:
+                    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                    try:
+                        cloned = reflink(src.fileno(), fd)
+                    finally:
+                        os.close(fd)
+                if not cloned:
+                    self.reflink_supported = False
+                    self._discard(temp_path)
+                    return False
+                shutil.copystat(source, temp_path)
+            size = temp_path.stat().st_size
+        except BaseException:
+            self._discard(temp_path)
+            raise
+        
+        self.throttle.io(0)
+        with self._lock:
+            self.stats['deduped'] += 1
+            self.stats['bytes_deduped'] += size
+        self.commit(temp_path, destination, on_commit)
+        return True
+    
+    def _verify(self, temp_path: Path, destination: Path, expected: str) -> None:
+        """Re-read a written copy from storage and compare it with the source hash."""
+        actual = self.hasher.hash_file_uncached(temp_path)
+        if actual != expected:
+            raise OSError(f"Verification failed for {destination}: "
+                          f"copied data hashes to {actual}, source to {expected}")
+        with self._lock:
+            self.stats['verified'] += 1
+    
+    def commit(self, temp_path: Path, destination: Path,
+               on_commit: Optional[Callable[[], None]] = None) -> None:
+        """
+        Move a fully written temp file into place under the durability mode.
+        
+        Used by copy() and by writers that fill a temp_path_for() file
+        themselves (e.g. the remote sync server).
+        """
+        if self.durability == 'batch':
+            with self._lock:
+                self._pending.append((temp_path, destination, on_commit))
+                flush_now = len(self._pending) >= self.batch_size
+            if flush_now:
+                self.flush()
+        else:
+            if self.durability == 'per-file':
+                self._sync_data([temp_path], allow_syncfs=False)
+            os.replace(temp_path, destination)
+            if self.durability == 'per-file':
+                fsync_directory(destination.parent)
+            if on_commit:
+                on_commit()
+    
+    @profiled('flush')
+    def flush(self) -> None:
+        """
+        Make every pending batched copy durable and visible.
+        
+        Data is synced before the renames so a file never appears under its
+        final name with unwritten contents; directories are synced afterwards
+        so the renames themselves survive a crash. If the data cannot be
+        synced, the whole batch is discarded and the error raised.
+        """
+        with self._flush_lock:
+            with self._lock:
+                # Copies committed meanwhile stay queued behind this batch
+                pending = self._pending[:]
+            if not pending:
+                return
+            
+            try:
+                self._sync_data([temp for temp, _, _ in pending])
+            except OSError as e:
+                with self._lock:
+                    del self._pending[:len(pending)]
+                for temp_path, destination, _ in pending:
+                    self.logger.error(f"Failed to sync {destination}: {e}")
+                    self._discard(temp_path)
+                raise
+            
+            with self._lock:
+                del self._pending[:len(pending)]
+            self._commit_batch(pending)
+    
+    def _commit_batch(self, pending: List[Tuple[Path, Path, Optional[Callable[[], None]]]]) -> None:
+        """Rename a synced batch into place, then sync the directories it touched."""
+        directories = set()
+        committed = []
+        for temp_path, destination, on_commit in pending:
+            try:
+                os.replace(temp_path, destination)
+                directories.add(destination.parent)
+                if on_commit:
+                    committed.append(on_commit)
+            except OSError as e:
+                self.logger.error(f"Failed to move {temp_path} into place: {e}")
+                self._discard(temp_path)
+        
+        for directory in directories:
+            fsync_directory(directory)
+        
+        for on_commit in committed:
+            on_commit()
+    
+    def _write_temp(self, source: Path, temp_path: Path,
+                    digest=None) -> Tuple[int, Optional[str]]:
+        """
+        Copy source contents into a freshly created temp file.
+        
+        Returns:
+            (bytes written, tree hash or None)
+        """
+        tree_hash = None
+        with open(source, 'rb', buffering=0) as src:
+            st = os.fstat(src.fileno())
+            block_size = self.hasher.block_size_for(source, st.st_dev)
+            view = self._get_buffer(block_size)
+            extents = data_extents(src.fileno(), st.st_size) if is_sparse(st) else None
+            
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with open(fd, 'wb', buffering=0) as dst:
+                # Ranges finish out of order, so a whole-file hash would need a
+                # second read of the source: copy sequentially, hashing as it goes
+                if extents is None and digest is None and self.parallel_threshold and \
+                        st.st_size >= self.parallel_threshold:
+                    written, tree_hash = self._copy_parallel(src.fileno(), dst.fileno(),
+                                                             st.st_size, block_size)
+                elif extents is None:
+                    written = self._copy_range(src, dst, view, 0, None, digest)
+                else:
+                    # Copy only the data extents; holes come back via ftruncate
+                    written = 0
+                    zeros = memoryview(bytes(block_size)) if digest is not None else None
+                    position = 0
+                    for offset, length in extents:
+                        if zeros is not None:
+                            update_zeros(digest, offset - position, zeros)
+                        written += self._copy_range(src, dst, view, offset, length, digest)
+                        position = offset + length
+                    if zeros is not None:
+                        update_zeros(digest, st.st_size - position, zeros)
+                    os.ftruncate(dst.fileno(), st.st_size)
+                self.throttle.drop_cache(dst.fileno())
+            self.throttle.drop_cache(src.fileno())
+        
+        self.add_bytes(st.st_size, written, sparse=extents is not None)
+        return written, tree_hash
+    
+    def _copy_parallel(self, src_fd: int, dst_fd: int, size: int,
+                       block_size: int) -> Tuple[int, Optional[str]]:
+        """
+        Copy a large file as concurrent ranges into a preallocated destination.
+        
+        Returns:
+            (bytes written, tree hash if range_hash is enabled)
+        """
+        try:
+            # Reserve the space up front: fails early when the target is full
+            # and keeps concurrent writers from fragmenting the file
+            os.posix_fallocate(dst_fd, 0, size)
+        except (OSError, AttributeError):
+            os.ftruncate(dst_fd, size)
+        
+        ranges = [(offset, min(self.range_size, size - offset))
+                  for offset in range(0, size, self.range_size)]
+        workers = max(1, min(self.parallel_workers, len(ranges)))
+        # Progress of the ranges counts towards the watched copy, if any
+        operation = watchdog.current()
+        
+        def copy_range(r):
+            with watchdog.attached(operation):
+                return self._copy_range_at(src_fd, dst_fd, r[0], r[1], block_size)
+        
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(copy_range, ranges))
+        
+        tree_hash = None
+        if self.range_hash:
+            tree_hash = combine_range_hashes(self.hasher.algorithm, [d for _, d in results])
+        return sum(n for n, _ in results), tree_hash
+    
+    def _copy_range_at(self, src_fd: int, dst_fd: int, offset: int, length: int,
+                       block_size: int) -> Tuple[int, Optional[str]]:
+        """
+        Copy one range with positioned I/O, so ranges can run concurrently.
+        
+        Uses copy_file_range when no hash is wanted, falling back to
+        pread/pwrite through the thread's buffer.
+        """
+        hasher = hashlib.new(self.hasher.algorithm) if self.range_hash else None
+        copied = 0
+        
+        if hasher is None and hasattr(os, 'copy_file_range'):
+            try:
+                while copied < length:
+                    n = os.copy_file_range(src_fd, dst_fd, min(block_size, length - copied),
+                                           offset + copied, offset + copied)
+                    if not n:
+                        break
+                    # One read and one write of n bytes, charged as pread/pwrite
+                    # are below: separately, so ops limits see two operations
+                    self.throttle.io(n)  # read
+                    self.throttle.io(n)  # write
+                    copied += n
+            except OSError:
+                # Not supported between these filesystems; continue with pread/pwrite
+                pass
+        
+        view = self._get_buffer(block_size)
+        while copied < length:
+            n = pread_into(src_fd, view[:min(block_size, length - copied)], offset + copied)
+            if not n:
+                break
+            self.throttle.io(n)
+            if hasher:
+                hasher.update(view[:n])
+            pwrite_all(dst_fd, view[:n], offset + copied)
+            self.throttle.io(n)
+            copied += n
+        
+        if copied < length:
+            raise OSError(f"Source shrank during copy (range at {offset})")
+        return copied, hasher.hexdigest() if hasher else None
+    
+    def add_bytes(self, logical: int, physical: int, sparse: bool = False) -> None:
+        """Account for a file written outside copy() in the byte counters."""
+        with self._lock:
+            self.stats['bytes_logical'] += logical
+            self.stats['bytes_physical'] += physical
+            if sparse:
+                self.stats['sparse_files'] += 1
+    
+    def _copy_range(self, src, dst, view: memoryview, offset: int,
+                    length: Optional[int], digest=None) -> int:
+        """
+        Copy length bytes at offset (or everything from offset if None).
+        
+        With dst None the range is only read, into digest.
+        """
+        src.seek(offset)
+        if dst is not None:
+            dst.seek(offset)
+        
+        copied = 0
+        while length is None or copied < length:
+            chunk = view if length is None else view[:min(len(view), length - copied)]
+            n = src.readinto(chunk)
+            if not n:
+                break
+            self.throttle.io(n)
+            if digest is not None:
+                digest.update(chunk[:n])
+            if dst is not None:
+                write_all(dst, chunk[:n])
+                self.throttle.io(n)
+            copied += n
+        return copied
+    
+    def _sync_data(self, paths: List[Path], allow_syncfs: bool = True) -> None:
+        """Sync file data once per filesystem, falling back to per-file fdatasync."""
+        synced_devices = set()
+        for path in paths:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except OSError:
+                continue
+            try:
+                st_dev = os.fstat(fd).st_dev
+                if st_dev in synced_devices:
+                    continue
+                if allow_syncfs and _syncfs(fd):
+                    synced_devices.add(st_dev)
+                else:
+                    datasync(fd)
+            finally:
+                os.close(fd)
+    
+    def temp_path_for(self, destination: Path) -> Path:
+        """
+        Pick a unique temp name next to destination (same filesystem).
+        
+        Creates the destination directory if needed.
+        """
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        unique = f"{os.getpid()}-{next(self._counter)}"
+        return destination.parent / f"{TEMP_PREFIX}{unique}-{destination.name[:200]}"
+    
+    def _get_buffer(self, size: int) -> memoryview:
+        """Return this thread's reusable copy buffer, growing it if needed."""
+        view = getattr(self._local, 'view', None)
+        if view is None or len(view) < size:
+            self._local.view = view = memoryview(bytearray(size))
+        return view[:size]
+    
+    def _discard(self, temp_path: Path) -> None:
+        """Remove a temp file after a failed copy."""
+        try:
+            temp_path.unlink()
+        except OSError:
+            pass
@@ -0,0 +1,150 @@
+"""
+Detection of content-identical files for destination-side dedup.
+
+Source trees often contain many byte-identical files (vendored libraries,
+duplicated assets). With dedup enabled, the files about to be written are
+grouped in stages, each stage only reading the files that survived the
+previous one:
+    
+    1. size        - no reads; files with a unique size are dropped
+    2. fast hash   - hash of the first and last sample_size bytes
+    3. full hash   - content hash with the hasher's algorithm
+
+Hashes the caller already knows (from the hash cache or a previous
+manifest) skip stages 2 and 3, so a warm cache finds duplicates without
+reading any file. The first file of each group is copied as usual and the
+others are materialised from it, as hardlinks in backups or reflinks at a
+sync destination (see FileCopier.link).
+"""
+
+import hashlib
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, NamedTuple, Optional
+from .hasher import FileHasher
+
+
+DEFAULT_MIN_SIZE = 4096
+DEFAULT_SAMPLE_SIZE = 64 * 1024
+
+
+class Candidate(NamedTuple):
+    """A file that may be written as a link to an identical one."""
+    relative_path: str
+    path: Path
+    size: int
+    mtime_ns: int
+    # Must also match for files to be grouped (e.g. the mode of hardlinks)
+    tag: object = None
+    # Content hash if already known, e.g. from the hash cache
+    hash: Optional[str] = None
+
+
+class DuplicateGroups:
+    """Result of DuplicateFinder.find()."""
+    
+    def __init__(self):
+        # Duplicate relative path -> relative path of the first file of its group
+        self.leaders: Dict[str, str] = {}
+        # Relative path -> content hash, for every file in a group
+        self.hashes: Dict[str, str] = {}
+        # Hashes computed by this pass (for callers to cache)
+        self.computed: Dict[str, str] = {}
+        self.bytes_read = 0
+    
+    def __len__(self) -> int:
+        return len(self.leaders)
+    
+    def is_leader(self, relative_path: str) -> bool:
+        """Check whether a file is the first of a duplicate group."""
+        return relative_path in self.hashes and relative_path not in self.leaders
+
+
+class DuplicateFinder:
+    """Groups candidate files by size, fast hash and full hash."""
+    
+    def __init__(self, hasher: FileHasher, min_size: int = DEFAULT_MIN_SIZE,
+                 sample_size: int = DEFAULT_SAMPLE_SIZE):
+        self.hasher = hasher
+        self.min_size = max(1, min_size)
+        self.sample_size = sample_size
+    
+    @classmethod
+    def from_config(cls, config: dict, hasher: FileHasher) -> 'DuplicateFinder':
+        """Create a finder using the dedup section of the config."""
+        dedup_config = config.get('dedup', {})
+        return cls(hasher,
+                   min_size=dedup_config.get('min_size', DEFAULT_MIN_SIZE),
+                   sample_size=dedup_config.get('sample_size', DEFAULT_SAMPLE_SIZE))
+    
+    def find(self, candidates: Iterable[Candidate]) -> DuplicateGroups:
+        """
+        Find groups of identical files.
+        
+        The first candidate of each group (in the given order) is its
+        leader. Files that cannot be read are left out of every group.
+        """
+        result = DuplicateGroups()
+        by_size = defaultdict(list)
+        for candidate in candidates:
+            if candidate.size >= self.min_size:
+                by_size[(candidate.size, candidate.tag)].append(candidate)
+        
+        for group in by_size.values():
+            if len(group) < 2:
+                continue
+            
+            if any(c.hash is None for c in group):
+                # Only files sharing a fast hash are worth a full read
+                by_sample = defaultdict(list)
+                for candidate in group:
+                    sample = self.fast_hash(candidate.path, candidate.size, result)
+                    if sample is not None:
+                        by_sample[sample].append(candidate)
+                group = [c for sub in by_sample.values() if len(sub) > 1 for c in sub]
+            
+            by_hash = defaultdict(list)
+            for candidate in group:
+                file_hash = candidate.hash
+                if file_hash is None:
+                    file_hash = self.hasher.hash_file(candidate.path)
+                    if file_hash is None:
+                        continue
+                    result.computed[candidate.relative_path] = file_hash
+                    result.bytes_read += candidate.size
+                by_hash[file_hash].append(candidate)
+            
+            for file_hash, members in by_hash.items():
+                if len(members) < 2:
+                    continue
+                leader = members[0].relative_path
+                for member in members:
+                    result.hashes[member.relative_path] = file_hash
+                    if member.relative_path != leader:
+                        result.leaders[member.relative_path] = leader
+        
+        return result
+    
+    def fast_hash(self, path: Path, size: int,
+                  result: Optional[DuplicateGroups] = None) -> Optional[str]:
+        """Hash the size and the first and last sample_size bytes of a file."""
+        digest = hashlib.new(self.hasher.algorithm)
+        digest.update(size.to_bytes(8, 'little'))
+        try:
+            with open(path, 'rb') as f:
+                chunks = [f.read(self.sample_size)]
+                if size > 2 * self.sample_size:
+                    f.seek(-self.sample_size, 2)
+                    chunks.append(f.read(self.sample_size))
+                elif size > self.sample_size:
+                    chunks.append(f.read())
+        except OSError:
+            return None
+        
+        for chunk in chunks:
+            self.hasher.throttle.io(len(chunk))
+            digest.update(chunk)
+            if result is not None:
+                result.bytes_read += len(chunk)
+        return digest.hexdigest()
+
@@ -0,0 +1,267 @@
+"""
+Streaming tar export of backups.
+
+Writes the files of a backup, as recorded in its manifest and resolved
+through the backups an incremental builds on, as one tar stream for
+shipping offsite or to tape. Compressed formats cut the stream into
+fixed-size blocks that are compressed independently on a thread pool
+(like pigz) and written in order as separate gzip members or zstd frames,
+so the output is an ordinary .tar.gz or .tar.zst that gzip and zstd read
+as usual. Memory is bounded by the blocks in flight, whatever the size of
+the backup, and the output is never seeked, so it can go to a pipe.
+"""
+
+import functools
+import gzip
+import io
+import os
+import stat
+import tarfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO, Callable, Optional
+from .backup_manager import BackupManager
+from .pack import PackReader
+from .profiling import profiled
+from .utils import TEMP_PREFIX
+import logging
+
+
+FORMATS = ('tar', 'tar.gz', 'tar.zst')
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+DEFAULT_WORKERS = 4
+DEFAULT_LEVELS = {'tar.gz': 6, 'tar.zst': 3}
+
+_SUFFIXES = {'.tar': 'tar', '.tar.gz': 'tar.gz', '.tgz': 'tar.gz',
+             '.tar.zst': 'tar.zst', '.tzst': 'tar.zst'}
+
+
+def format_for(path: Path) -> Optional[str]:
+    """Guess the export format from a file name, or None if it doesn't say."""
+    name = Path(path).name
+    for suffix, fmt in _SUFFIXES.items():
+        if name.endswith(suffix):
+            return fmt
+    return None
+
+
+def _gzip_compressor(level: int) -> Callable[[bytes], bytes]:
+    """Compress a block into a complete gzip member."""
+    return functools.partial(gzip.compress, compresslevel=level, mtime=0)
+
+
+def _zstd_compressor(level: int) -> Callable[[bytes], bytes]:
+    """Compress a block into a complete zstd frame (needs the zstandard package)."""
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("tar.zst export needs the zstandard package "
+                         "(pip install zstandard)") from None
+    # Compressor objects must not be shared between threads
+    local = threading.local()
+    
+    def compress(block: bytes) -> bytes:
+        compressor = getattr(local, 'compressor', None)
+        if compressor is None:
+            compressor = local.compressor = zstandard.ZstdCompressor(level=level)
+        return compressor.compress(block)
+    
+    return compress
+
+
+class _CountingWriter:
+    """Passes writes through, counting the bytes."""
+    
+    def __init__(self, out: BinaryIO):
+        self.out = out
+        self.bytes = 0
+    
+    def write(self, data) -> int:
+        self.out.write(data)
+        self.bytes += len(data)
+        return len(data)
+
+
+class _ThrottledReader:
+    """Reads a file under the throttle's limits."""
+    
+    def __init__(self, f: BinaryIO, throttle):
+        self.f = f
+        self.throttle = throttle
+    
+    def read(self, size: int = -1) -> bytes:
+        data = self.f.read(size)
+        self.throttle.io(len(data))
+        return data
+
+
+class BlockCompressor:
+    """
+    Compresses a stream in independent blocks on a thread pool.
+    
+    Blocks are written in order, and at most two per worker are in flight,
+    so memory stays at about (2 * workers + 1) * block_size.
+    """
+    
+    def __init__(self, out, compress: Callable[[bytes], bytes],
+                 workers: int = DEFAULT_WORKERS, block_size: int = DEFAULT_BLOCK_SIZE):
+        self.out = out
+        self.compress = compress
+        self.block_size = block_size
+        self._max_pending = 2 * workers
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._pending = deque()
+        self._buffer = bytearray()
+    
+    def write(self, data) -> int:
+        self._buffer += data
+        while len(self._buffer) >= self.block_size:
+            self._submit(bytes(self._buffer[:self.block_size]))
+            del self._buffer[:self.block_size]
+        return len(data)
+    
+    def close(self) -> None:
+        """Compress the last partial block and write everything still in flight."""
+        if self._buffer:
+            self._submit(bytes(self._buffer))
+            self._buffer.clear()
+        while self._pending:
+            self._write_next()
+        self._pool.shutdown()
+    
+    def abort(self) -> None:
+        """Drop the blocks in flight (the stream is abandoned anyway)."""
+        self._pool.shutdown(cancel_futures=True)
+        self._pending.clear()
+    
+    def _submit(self, block: bytes) -> None:
+        if len(self._pending) >= self._max_pending:
+            self._write_next()
+        self._pending.append(self._pool.submit(self.compress, block))
+    
+    def _write_next(self) -> None:
+        self.out.write(self._pending.popleft().result())
+
+
+class BackupExporter:
+    """Writes backups as (optionally compressed) tar streams."""
+    
+    def __init__(self, config: dict):
+        export_config = config.get('export', {})
+        self.workers = max(1, export_config.get('workers', DEFAULT_WORKERS))
+        self.block_size = export_config.get('block_size', DEFAULT_BLOCK_SIZE)
+        self.levels = {'tar.gz': export_config.get('gzip_level', DEFAULT_LEVELS['tar.gz']),
+                       'tar.zst': export_config.get('zstd_level', DEFAULT_LEVELS['tar.zst'])}
+        self.manager = BackupManager(config)
+        self.throttle = self.manager.throttle
+        self.logger = logging.getLogger(__name__)
+    
+    @profiled('export')
+    def export(self, backup_path: Path, out: BinaryIO, fmt: str = 'tar') -> dict:
+        """
+        Write a backup to out as a tar stream.
+        
+        Args:
+            backup_path: Backup to export (an incremental includes the files
+                it shares with the backups it builds on)
+            out: Binary stream to write to; only written, never seeked
+            fmt: One of FORMATS
+        
+        Returns:
+            dict: Files and bytes exported, bytes written, and the files of
+                the manifest that are stored nowhere in the chain
+        
+        Raises:
+            ValueError: Unknown format, or a base backup is missing
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown export format: {fmt}")
+        if not backup_path.is_dir():
+            raise FileNotFoundError(f"Backup not found: {backup_path}")
+        self.throttle.apply_priority()
+        self.throttle.reset_stats()
+        
+        manifest = self.manager.load_manifest(backup_path)
+        locations = self.manager.locate_files(backup_path)
+        stats = {'files': 0, 'bytes': 0, 'missing': 0, 'missing_paths': []}
+        
+        writer = _CountingWriter(out)
+        compressor = None
+        if fmt == 'tar.gz':
+            compressor = BlockCompressor(writer, _gzip_compressor(self.levels[fmt]),
+                                         self.workers, self.block_size)
+        elif fmt == 'tar.zst':
+            compressor = BlockCompressor(writer, _zstd_compressor(self.levels[fmt]),
+                                         self.workers, self.block_size)
+        
+        try:
+            self._write_tar(compressor or writer, manifest, locations, stats)
+            if compressor is not None:
+                compressor.close()
+        except BaseException:
+            if compressor is not None:
+                compressor.abort()
+            raise
+        out.flush()
+        
+        stats['bytes_written'] = writer.bytes
+        stats.update(self.throttle.stats())
+        return stats
+    
+    def _write_tar(self, sink, manifest: dict, locations: dict, stats: dict) -> None:
+        """Write the manifest's files to sink as a tar stream, in path order."""
+        readers = {}
+        with tarfile.open(fileobj=sink, mode='w|', format=tarfile.PAX_FORMAT) as tar:
+            for relative_path in sorted(manifest):
+                location = locations.get(relative_path)
+                if location is None:
+                    self.logger.error(f"Not stored in any backup of the chain: {relative_path}")
+                    stats['missing'] += 1
+                    stats['missing_paths'].append(relative_path)
+                    continue
+                
+                member, in_pack = location
+                info = tarfile.TarInfo(relative_path)
+                # Whole seconds, as fractions would cost a PAX header per file
+                mtime_ns = manifest[relative_path].get('mtime_ns')
+                if in_pack:
+                    reader = readers.get(member)
+                    if reader is None:
+                        reader = readers[member] = PackReader(member)
+                    entry = reader.index[relative_path]
+                    info.size = entry['length']
+                    info.mode = entry['mode']
+                    info.mtime = (mtime_ns or entry['mtime_ns']) // 10 ** 9
+                    data = reader.read(relative_path)
+                    self.throttle.io(len(data))
+                    tar.addfile(info, io.BytesIO(data))
+                else:
+                    with open(member / relative_path, 'rb') as f:
+                        st = os.fstat(f.fileno())
+                        info.size = st.st_size
+                        info.mode = stat.S_IMODE(st.st_mode)
+                        info.mtime = (mtime_ns or st.st_mtime_ns) // 10 ** 9
+                        tar.addfile(info, _ThrottledReader(f, self.throttle))
+                stats['files'] += 1
+                stats['bytes'] += info.size
+    
+    def export_file(self, backup_path: Path, output: Path, fmt: Optional[str] = None) -> dict:
+        """
+        Export a backup to a file, which only appears once it is complete.
+        
+        The format defaults to the one the file name suggests, else plain tar.
+        """
+        fmt = fmt or format_for(output) or 'tar'
+        temp_file = output.with_name(f"{TEMP_PREFIX}{os.getpid()}-{output.name}")
+        try:
+            with open(temp_file, 'wb') as f:
+                stats = self.export(backup_path, f, fmt)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_file, output)
+        except BaseException:
+            temp_file.unlink(missing_ok=True)
+            raise
+        return stats
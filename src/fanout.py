@@ -0,0 +1,273 @@
+"""
+Syncing one source to several destinations with a single read.
+
+Running one SyncEngine per destination reads every changed source file
+once per destination. FanoutSyncEngine scans the source once, plans each
+destination with its own SyncEngine (so comparisons, hash caches,
+durability batches and statistics stay per destination), and then copies
+each needed file once: every block read from the source is written to all
+destinations that need the file. Blocks come from one BufferPool shared by
+all in-flight copies, so memory does not grow with the number of
+destinations.
+
+A destination that fails (e.g. runs out of space) is dropped for that file
+only; the other destinations still get it, and the failure is counted in
+the failing destination's statistics. Fan-out syncs are one-way: files
+found only in a destination are never copied back, though
+sync.delete_orphaned still applies to each destination.
+"""
+
+import hashlib
+import os
+import queue
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from .file_scanner import FileScanner
+from .file_table import FileRecord
+from .hasher import update_zeros
+from .copier import pwrite_all
+from .profiling import profiled
+from .scheduling import priority_band, schedule
+from .sync_engine import SyncEngine
+from .throttle import Throttle
+from .utils import data_extents, is_sparse
+import logging
+
+
+DEFAULT_WORKERS = 4
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+
+class BufferPool:
+    """Fixed set of copy buffers shared by every in-flight copy."""
+    
+    def __init__(self, count: int, size: int):
+        self.size = size
+        self._free = queue.Queue()
+        for _ in range(max(1, count)):
+            self._free.put(memoryview(bytearray(size)))
+    
+    @contextmanager
+    def buffer(self):
+        """Borrow a buffer, waiting for one to be returned if all are in use."""
+        view = self._free.get()
+        try:
+            yield view
+        finally:
+            self._free.put(view)
+
+
+class _Target:
+    """One destination of a file being fanned out."""
+    
+    __slots__ = ('engine', 'action', 'temp_path', 'fd')
+    
+    def __init__(self, engine: SyncEngine, action: str):
+        self.engine = engine
+        self.action = action
+        self.temp_path = None
+        self.fd = None
+
+
+class FanoutSyncEngine:
+    """Syncs one source tree to several destination directories."""
+    
+    def __init__(self, source: str, destinations: List[str], config: dict):
+        if len(set(destinations)) != len(destinations):
+            raise ValueError("Each destination can only be named once")
+        self.source = Path(source)
+        self.config = config
+        self.scanner = FileScanner(config.get('filters', {}),
+                                   cache_listings=config.get('sync', {}).get('listing_cache', False))
+        self.throttle = Throttle.from_config(config, 'sync')
+        self.engines = [SyncEngine(source, destination, config, throttle=self.throttle)
+                        for destination in destinations]
+        # One cache for the source, not one per engine racing on the same file
+        for engine in self.engines[1:]:
+            engine.source_cache = self.engines[0].source_cache
+        
+        fanout_config = config.get('fanout', {})
+        self.workers = max(1, fanout_config.get('workers', DEFAULT_WORKERS))
+        self.buffers = BufferPool(fanout_config.get('buffers', self.workers),
+                                  fanout_config.get('block_size', DEFAULT_BLOCK_SIZE))
+        self.algorithm = self.engines[0].hasher.algorithm
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self.bytes_read = 0
+    
+    @profiled('sync')
+    def sync(self) -> dict:
+        """
+        Synchronize the source to every destination.
+        
+        Returns:
+            dict: Totals over all destinations, the source bytes read, and
+                per-destination statistics under 'destinations'
+        """
+        self.throttle.apply_priority()
+        self.throttle.reset_stats()
+        self.bytes_read = 0
+        if self.config.get('sync', {}).get('mode') == 'bidirectional':
+            self.logger.warning("Syncing to several destinations is one-way; "
+                                "files only in a destination are not copied back")
+        
+        source_table = self.scanner.scan_table(self.source)
+        per_destination: Dict[str, dict] = {}
+        dest_only: Dict[SyncEngine, List[str]] = {}
+        # Relative path -> (source record, [(engine, action)]) in scan order
+        needed: Dict[str, Tuple[FileRecord, list]] = {}
+        
+        for engine in self.engines:
+            stats = per_destination[str(engine.destination)] = engine.begin()
+            engine.destination.mkdir(parents=True, exist_ok=True)
+            dest_table = engine.scanner.scan_table(engine.destination)
+            to_copy, dest_only[engine] = engine.plan(source_table, dest_table, stats)
+            for relative_path, info, action in to_copy:
+                needed.setdefault(relative_path, (info, []))[1].append((engine, action))
+        
+        order = schedule(list(needed), self.engines[0].order, self.engines[0].priority_globs,
+                         lambda path: (path, needed[path][0].size, needed[path][0].mtime_ns),
+                         lambda path: self.source / path)
+        
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for _ in pool.map(lambda path: self._fan_out(path, needed[path][1],
+                                                         per_destination), order):
+                pass
+        
+        for engine in self.engines:
+            stats = per_destination[str(engine.destination)]
+            if self.config.get('sync', {}).get('delete_orphaned'):
+                engine._delete_orphaned_files(dest_only[engine], stats)
+            engine.finish(stats)
+        
+        totals = {key: sum(s[key] for s in per_destination.values())
+                  for key in ('copied', 'updated', 'deleted', 'skipped', 'errors',
+                              'bytes_logical', 'bytes_physical')}
+        totals['bytes_read'] = self.bytes_read
+        totals.update(self.throttle.stats())
+        totals['destinations'] = per_destination
+        return totals
+    
+    def _fan_out(self, relative_path: str, targets: List[Tuple[SyncEngine, str]],
+                 per_destination: Dict[str, dict]) -> None:
+        """Copy one source file to each of its targets from a single read."""
+        source = self.source / relative_path
+        live = [_Target(engine, action) for engine, action in targets]
+        globs = self.engines[0].priority_globs
+        priority = bool(globs) and priority_band(relative_path, globs) < len(globs)
+        
+        try:
+            with open(source, 'rb', buffering=0) as src, self.buffers.buffer() as view:
+                st = os.fstat(src.fileno())
+                for target in list(live):
+                    destination = target.engine.destination / relative_path
+                    try:
+                        target.temp_path = target.engine.copier.temp_path_for(destination)
+                        target.fd = os.open(target.temp_path,
+                                            os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                    except OSError as e:
+                        self._drop(live, target, relative_path, e, per_destination)
+                if not live:
+                    return
+                
+                extents = data_extents(src.fileno(), st.st_size) if is_sparse(st) else None
+                digest = hashlib.new(self.algorithm)
+                written = self._copy_data(src, st, extents, view, live, digest, relative_path,
+                                          per_destination)
+                file_hash = digest.hexdigest()
+                
+                for target in list(live):
+                    try:
+                        if extents is not None:
+                            # Holes come back as the file is extended
+                            os.ftruncate(target.fd, st.st_size)
+                        os.close(target.fd)
+                        target.fd = None
+                        shutil.copystat(source, target.temp_path)
+                    except OSError as e:
+                        self._drop(live, target, relative_path, e, per_destination)
+        except Exception as e:
+            # The source itself failed: every target misses this file
+            for target in list(live):
+                self._drop(live, target, relative_path, e, per_destination)
+            return
+        
+        for target in list(live):
+            engine = target.engine
+            destination = engine.destination / relative_path
+            try:
+                engine.copier.commit(target.temp_path, destination, engine._completion(priority))
+            except OSError as e:
+                self._drop(live, target, relative_path, e, per_destination)
+                continue
+            engine.copier.add_bytes(st.st_size, written, sparse=extents is not None)
+            if engine.source_cache:
+                engine.source_cache.put(relative_path, st.st_size, st.st_mtime_ns, file_hash)
+                engine.dest_cache.put(relative_path, st.st_size, st.st_mtime_ns, file_hash)
+            with self._lock:
+                per_destination[str(engine.destination)][target.action] += 1
+            self.logger.info(f"{target.action.capitalize()}: {relative_path} -> {engine.destination}")
+    
+    def _copy_data(self, src, st: os.stat_result, extents: Optional[list], view: memoryview,
+                   live: List[_Target], digest, relative_path: str,
+                   per_destination: Dict[str, dict]) -> int:
+        """
+        Read the source once, writing each block to every live target.
+        
+        With extents (sparse files) only the data extents are copied; the
+        caller restores the holes with ftruncate, and they are hashed as zeros.
+        
+        Returns:
+            Bytes read (and written to each target)
+        """
+        ranges = extents if extents is not None else [(0, None)]
+        zeros = memoryview(bytes(len(view))) if extents is not None else None
+        written = 0
+        position = 0
+        
+        for offset, length in ranges:
+            if zeros is not None:
+                update_zeros(digest, offset - position, zeros)
+            src.seek(offset)
+            copied = 0
+            while length is None or copied < length:
+                chunk = view if length is None else view[:min(len(view), length - copied)]
+                n = src.readinto(chunk)
+                if not n:
+                    break
+                self.throttle.io(n)
+                digest.update(chunk[:n])
+                for target in list(live):
+                    try:
+                        pwrite_all(target.fd, chunk[:n], offset + copied)
+                        self.throttle.io(n)
+                    except OSError as e:
+                        self._drop(live, target, relative_path, e, per_destination)
+                copied += n
+            written += copied
+            position = offset + copied
+        
+        if zeros is not None:
+            update_zeros(digest, st.st_size - position, zeros)
+        with self._lock:
+            self.bytes_read += written
+        return written
+    
+    def _drop(self, live: List[_Target], target: _Target, relative_path: str,
+              error: Exception, per_destination: Dict[str, dict]) -> None:
+        """Give up on one destination of a file, leaving the others running."""
+        live.remove(target)
+        if target.fd is not None:
+            os.close(target.fd)
+        if target.temp_path is not None:
+            try:
+                target.temp_path.unlink()
+            except OSError:
+                pass
+        self.logger.error(f"Error processing {relative_path} for {target.engine.destination}: {error}")
+        with self._lock:
+            per_destination[str(target.engine.destination)]['errors'] += 1
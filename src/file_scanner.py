@@ -1,24 +1,53 @@
 """
 File scanner module for discovering files in directories.
 
-Handles file filtering based on include/exclude patterns.
+Handles file filtering based on include/exclude patterns. With listing
+caching on, directories unchanged since the last scan are not read again
+(see listing_cache).
 """
 
 import os
 from pathlib import Path
-from typing import List, Set
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
 import fnmatch
 import logging
+from .file_table import FileTable
+from .listing_cache import ListingCache
+from .profiling import profiled
+from .utils import is_temp_file
 
 
 class FileScanner:
     """Scans directories and returns filtered file lists."""
     
-    def __init__(self, filters: dict):
+    def __init__(self, filters: dict, cache_listings: bool = False,
+                 cache_dir: Optional[Path] = None):
         self.exclude_patterns = filters.get('exclude', [])
         self.include_patterns = filters.get('include', ['*'])
+        self.cache_listings = cache_listings
+        self.cache_dir = cache_dir
+        # Temp files whose inode last changed before this time are left
+        # from an interrupted run and removed as they are found (None keeps them)
+        self.sweep_before: Optional[float] = None
         self.logger = logging.getLogger(__name__)
+        self.reset_stats()
+    
+    def reset_stats(self) -> None:
+        """Zero the counts of directory listings reused and read, and of temp files removed."""
+        self.listings_reused = 0
+        self.listings_read = 0
+        self.temp_files_removed = 0
+    
+    def stats(self) -> dict:
+        """Directory listings reused and read, and stale temp files removed, since reset_stats()."""
+        stats = {}
+        if self.cache_listings:
+            stats.update(listings_reused=self.listings_reused, listings_read=self.listings_read)
+        if self.sweep_before is not None:
+            stats['temp_files_removed'] = self.temp_files_removed
+        return stats
         
+    @profiled('scan')
     def scan(self, directory: Path) -> List[Path]:
         """
         Scan directory and return list of file paths.
@@ -35,26 +64,186 @@ class FileScanner:
             return []
         
         files = []
+        cache = self._open_cache(directory)
         
         try:
-            for root, dirs, filenames in os.walk(directory):
-                # Filter directories to skip excluded ones
-                dirs[:] = [d for d in dirs if not self._is_excluded(d)]
-                
+            for root, rel_dir, dirs, filenames in self.walk(directory, cache=cache):
                 for filename in filenames:
-                    file_path = Path(root) / filename
-                    relative_path = file_path.relative_to(directory)
-                    
-                    if self._should_include(str(relative_path)):
-                        files.append(file_path)
+                    files.append(Path(root) / filename)
         except PermissionError as e:
             self.logger.error(f"Permission denied scanning {directory}: {e}")
         except Exception as e:
             # Generic error handling - not very specific
             self.logger.error(f"Error scanning directory: {e}")
         
+        self._close_cache(cache)
         return files
     
+    @profiled('scan')
+    def scan_table(self, directory: Path,
+                   units: Optional[Iterable[Tuple[str, bool]]] = None,
+                   changed: Optional[Iterable[str]] = None) -> FileTable:
+        """
+        Scan directory into a compact, sorted FileTable.
+        
+        Applies the same filters as scan(), but stores the result in typed
+        columns so multi-million-file trees fit in a fraction of the memory
+        of a list of Paths.
+        
+        Args:
+            directory: Path to directory to scan
+            units: Optional (relative directory, recursive) pairs limiting the
+                scan to part of the tree; non-recursive units cover only the
+                files directly inside that directory
+            changed: Optional change feed: the relative paths created, removed
+                or modified since the last scan. With listing caching on,
+                directories with no change at or below them are taken from
+                the cache, file stats included, without touching the disk
+            
+        Returns:
+            FileTable of matching files, sorted by (directory, name)
+        """
+        table = FileTable(directory)
+        
+        if not directory.exists():
+            print(f"Warning: Directory does not exist: {directory}")
+            return table
+        
+        # Listings are cached per tree, so partial scans don't use them
+        cache = self._open_cache(directory) if units is None else None
+        dirty = _dirty_dirs(changed) if cache is not None and changed is not None else None
+        if units is None:
+            units = [('', True)]
+        
+        try:
+            walks = (self.walk(directory, start, recursive, cache, dirty) for start, recursive in units)
+            for root, rel_dir, dirs, filenames in (item for walk in walks for item in walk):
+                entries = None
+                if dirty is not None and rel_dir not in dirty:
+                    entries = _cached_stats(cache, rel_dir, filenames)
+                if entries is None:
+                    entries = []
+                    for filename in filenames:
+                        try:
+                            entries.append((filename, os.stat(os.path.join(root, filename))))
+                        except OSError as e:
+                            self.logger.error(f"Cannot stat {os.path.join(root, filename)}: {e}")
+                    if cache is not None:
+                        cache.put_stats(rel_dir, {name: [st.st_size, st.st_mtime_ns, st.st_ino]
+                                                  for name, st in entries})
+                table.add_directory(rel_dir, entries)
+        except PermissionError as e:
+            self.logger.error(f"Permission denied scanning {directory}: {e}")
+        except Exception as e:
+            self.logger.error(f"Error scanning directory: {e}")
+        
+        self._close_cache(cache)
+        return table.finalize()
+    
+    def walk(self, directory: Path, start: str = '', recursive: bool = True,
+             cache: Optional[ListingCache] = None,
+             dirty: Optional[Set[str]] = None) -> Iterator[Tuple[str, str, List[str], List[str]]]:
+        """
+        Walk directory applying the filters.
+        
+        Args:
+            directory: Scan root that relative paths and filters refer to
+            start: Subdirectory of the root to walk from
+            recursive: Whether to descend below start
+            cache: Listing cache for the scan root; directories whose stat
+                matches their cached listing are not read again
+            dirty: With a cache, the relative directories that may have
+                changed; all others are taken from the cache unchecked
+            
+        Yields:
+            (directory path, path relative to the scan root,
+             included subdirectory names, included file names)
+        """
+        top = os.path.join(directory, start)
+        tree = os.walk(top) if cache is None else self._cached_walk(top, start, cache, dirty)
+        for root, dirs, filenames in tree:
+            # Filter directories to skip excluded ones
+            dirs[:] = [d for d in dirs if not self._is_excluded(d)]
+            
+            rel_dir = os.path.relpath(root, directory)
+            if rel_dir == os.curdir:
+                rel_dir = ''
+            
+            included = []
+            for filename in filenames:
+                # Skip in-flight copies, removing those left by an interrupted run
+                if is_temp_file(filename):
+                    if self.sweep_before is not None:
+                        self._sweep(os.path.join(root, filename))
+                    continue
+                
+                relative_path = os.path.join(rel_dir, filename) if rel_dir else filename
+                if self._should_include(relative_path):
+                    included.append(filename)
+            
+            yield root, rel_dir, dirs, included
+            
+            if not recursive:
+                dirs[:] = []
+    
+    def _cached_walk(self, top: str, rel_top: str, cache: ListingCache,
+                     dirty: Optional[Set[str]]) -> Iterator[Tuple[str, List[str], List[str]]]:
+        """
+        Top-down os.walk that reads only directories whose listing is stale.
+        
+        Like os.walk, pruning the yielded dirs list in place skips those
+        subdirectories and unreadable directories are skipped silently.
+        Unlike it, symlinks to directories are left out of dirs.
+        """
+        pending = [(top, rel_top)]
+        while pending:
+            root, rel_dir = pending.pop()
+            listing = None
+            if dirty is not None and rel_dir not in dirty:
+                listing = cache.cached(rel_dir)
+            if listing is None:
+                try:
+                    st = os.stat(root, follow_symlinks=False)
+                    listing = cache.get(rel_dir, st)
+                    if listing is None:
+                        listing = _list_directory(root)
+                        cache.put(rel_dir, st, *listing)
+                        self.listings_read += 1
+                    else:
+                        self.listings_reused += 1
+                except OSError:
+                    continue
+            else:
+                self.listings_reused += 1
+            
+            dirs, filenames = list(listing[0]), list(listing[1])
+            yield root, dirs, filenames
+            
+            for name in reversed(dirs):
+                pending.append((os.path.join(root, name),
+                                os.path.join(rel_dir, name) if rel_dir else name))
+    
+    def _sweep(self, path: str) -> None:
+        """Remove a temp file unless it was created or touched during this run."""
+        try:
+            # ctime, as a finished temp file already carries its source's mtime
+            if os.lstat(path).st_ctime >= self.sweep_before:
+                return
+            os.unlink(path)
+        except OSError:
+            return
+        self.temp_files_removed += 1
+        self.logger.info(f"Removed stale temp file: {path}")
+    
+    def _open_cache(self, directory: Path) -> Optional[ListingCache]:
+        if not self.cache_listings:
+            return None
+        return ListingCache.for_tree(directory, self.cache_dir)
+    
+    def _close_cache(self, cache: Optional[ListingCache]) -> None:
+        if cache is not None:
+            cache.save()
+    
     def _should_include(self, path: str) -> bool:
         """Check if file should be included based on filters."""
         # Check exclude patterns first
@@ -104,3 +293,42 @@ class FileScanner:
                     count += 1
         
         return count
+
+
+class _CachedStat(NamedTuple):
+    """The stat fields a FileTable keeps, as recorded in the listing cache."""
+    st_size: int
+    st_mtime_ns: int
+    st_ino: int
+
+
+def _list_directory(path: str) -> Tuple[List[str], List[str]]:
+    """Read a directory's (subdirectory names, other entry names), sorted."""
+    dirs, files = [], []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                dirs.append(entry.name)
+            elif not entry.is_dir():
+                files.append(entry.name)
+    return sorted(dirs), sorted(files)
+
+
+def _dirty_dirs(changed: Iterable[str]) -> Set[str]:
+    """Relative directories a change feed may have touched: each path and its parents."""
+    dirty = {''}
+    for path in changed:
+        path = os.path.normpath(path).strip(os.sep)
+        while path and path != os.curdir and path not in dirty:
+            dirty.add(path)
+            path = os.path.dirname(path)
+    return dirty
+
+
+def _cached_stats(cache: ListingCache, rel_dir: str,
+                  filenames: List[str]) -> Optional[List[Tuple[str, _CachedStat]]]:
+    """The cached stats of filenames, or None unless all are recorded."""
+    recorded = cache.stats(rel_dir)
+    if recorded is None or any(name not in recorded for name in filenames):
+        return None
+    return [(name, _CachedStat(*recorded[name])) for name in filenames]
@@ -0,0 +1,171 @@
+"""
+Compact, column-oriented file table for large scans.
+
+A list of Path objects costs several hundred bytes per file once the
+relative_to() sets used for comparisons are added. FileTable instead keeps
+one interned string per directory, file names packed into a single byte
+buffer, and sizes/mtimes/inodes in typed arrays. Entries are sorted by
+(directory, name), so two tables can be compared with a linear merge
+instead of building hashed sets of paths.
+"""
+
+import os
+import sys
+from array import array
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+
+class FileRecord:
+    """Stat details for one entry of a FileTable."""
+    
+    __slots__ = ('size', 'mtime_ns', 'inode')
+    
+    def __init__(self, size: int, mtime_ns: int, inode: int):
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.inode = inode
+
+
+class FileTable:
+    """Sorted table of files below a root directory."""
+    
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.dirs: List[str] = []
+        self.dir_ids = array('I')
+        self.sizes = array('q')
+        self.mtimes = array('q')
+        self.inodes = array('Q')
+        self._names = bytearray()
+        self._name_offsets = array('Q', [0])
+        self._groups: List[Tuple[int, int, int]] = []
+        self._sorted = True
+    
+    def add_directory(self, rel_dir: str, entries: List[Tuple[str, os.stat_result]]) -> None:
+        """
+        Append the files of one directory.
+        
+        Args:
+            rel_dir: Directory relative to root ('' for the root itself)
+            entries: (file name, stat result) pairs for files in the directory
+        """
+        if not entries:
+            return
+        
+        dir_id = len(self.dirs)
+        # Interned so source and destination tables share directory strings
+        rel_dir = sys.intern(rel_dir)
+        self.dirs.append(rel_dir)
+        start = len(self.sizes)
+        
+        for name, st in sorted(entries, key=lambda item: item[0]):
+            self.dir_ids.append(dir_id)
+            self.sizes.append(st.st_size)
+            self.mtimes.append(st.st_mtime_ns)
+            self.inodes.append(st.st_ino)
+            self._names += os.fsencode(name)
+            self._name_offsets.append(len(self._names))
+        
+        if self._groups and rel_dir < self.dirs[self._groups[-1][0]]:
+            self._sorted = False
+        self._groups.append((dir_id, start, len(self.sizes) - start))
+    
+    def finalize(self) -> 'FileTable':
+        """
+        Reorder the table by (directory, name) once all directories are added.
+        
+        Names are already sorted within a directory, so only the directory
+        groups need reordering; the columns are rebuilt in one pass.
+        """
+        if self._sorted:
+            return self
+        
+        order = sorted(range(len(self._groups)), key=lambda g: self.dirs[self._groups[g][0]])
+        dirs, dir_ids = [], array('I')
+        sizes, mtimes, inodes = array('q'), array('q'), array('Q')
+        names, offsets = bytearray(), array('Q', [0])
+        groups = []
+        
+        for group in order:
+            old_dir, start, count = self._groups[group]
+            dir_id = len(dirs)
+            dirs.append(self.dirs[old_dir])
+            groups.append((dir_id, len(sizes), count))
+            end = start + count
+            dir_ids.extend([dir_id] * count)
+            sizes.extend(self.sizes[start:end])
+            mtimes.extend(self.mtimes[start:end])
+            inodes.extend(self.inodes[start:end])
+            base = len(names) - self._name_offsets[start]
+            names += self._names[self._name_offsets[start]:self._name_offsets[end]]
+            offsets.extend(self._name_offsets[i] + base for i in range(start + 1, end + 1))
+        
+        self.dirs, self.dir_ids = dirs, dir_ids
+        self.sizes, self.mtimes, self.inodes = sizes, mtimes, inodes
+        self._names, self._name_offsets = names, offsets
+        self._groups = groups
+        self._sorted = True
+        return self
+    
+    def __len__(self) -> int:
+        return len(self.sizes)
+    
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over relative paths in sorted order."""
+        for i in range(len(self)):
+            yield self.relative_path(i)
+    
+    def name(self, i: int) -> str:
+        """Return the file name of entry i."""
+        return os.fsdecode(bytes(self._names[self._name_offsets[i]:self._name_offsets[i + 1]]))
+    
+    def key(self, i: int) -> Tuple[str, str]:
+        """Return the (directory, name) sort key of entry i."""
+        return self.dirs[self.dir_ids[i]], self.name(i)
+    
+    def relative_path(self, i: int) -> str:
+        """Return entry i's path relative to root."""
+        rel_dir = self.dirs[self.dir_ids[i]]
+        name = self.name(i)
+        return os.path.join(rel_dir, name) if rel_dir else name
+    
+    def path(self, i: int) -> Path:
+        """Return entry i's full path."""
+        return self.root / self.relative_path(i)
+    
+    def record(self, i: int) -> FileRecord:
+        """Return the stat details of entry i."""
+        return FileRecord(self.sizes[i], self.mtimes[i], self.inodes[i])
+    
+    def paths(self) -> List[Path]:
+        """Expand the table into a list of full paths (as FileScanner.scan returns)."""
+        return [self.path(i) for i in range(len(self))]
+    
+    def merge(self, other: 'FileTable') -> Iterator[Tuple[str, Optional[int], Optional[int]]]:
+        """
+        Walk two sorted tables side by side.
+        
+        Yields:
+            (relative path, index in self or None, index in other or None)
+        """
+        i, j = 0, 0
+        n, m = len(self), len(other)
+        left = self.key(0) if n else None
+        right = other.key(0) if m else None
+        
+        while i < n or j < m:
+            if j >= m or (i < n and left < right):
+                yield self.relative_path(i), i, None
+                i += 1
+                left = self.key(i) if i < n else None
+            elif i >= n or right < left:
+                yield other.relative_path(j), None, j
+                j += 1
+                right = other.key(j) if j < m else None
+            else:
+                yield self.relative_path(i), i, j
+                i += 1
+                j += 1
+                left = self.key(i) if i < n else None
+                right = other.key(j) if j < m else None
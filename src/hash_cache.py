@@ -0,0 +1,91 @@
+"""
+Persistent content-hash cache for a directory tree.
+
+Hashing both sides of every same-size file pair is the most expensive
+part of a sync. The cache remembers each file's hash together with the
+size and mtime it had when hashed, so an unchanged file is never read
+again just to be compared. Hashes computed while copying
+(FileCopier.copy_hashed) are stored directly.
+"""
+
+import json
+import os
+import threading
+import zlib
+from pathlib import Path
+from typing import Optional
+from .config_manager import default_cache_dir
+import logging
+
+
+class HashCache:
+    """Maps relative paths of one tree to (size, mtime_ns, hash)."""
+    
+    def __init__(self, path: Path):
+        self.path = path
+        self.logger = logging.getLogger(__name__)
+        self.hits = 0
+        self._lock = threading.Lock()
+        self._entries = self._load()
+        # Paths looked up or stored this run; save() forgets the rest
+        self._seen = set()
+        self._dirty = False
+    
+    @classmethod
+    def for_tree(cls, root: Path, cache_dir: Optional[Path] = None) -> 'HashCache':
+        """Open the cache for a directory tree in the per-user cache directory."""
+        root = os.path.abspath(root)
+        cache_dir = cache_dir if cache_dir is not None else default_cache_dir()
+        return cls(Path(cache_dir) / f"hashes-{zlib.crc32(root.encode()):08x}.json")
+    
+    def get(self, relative_path: str, size: int, mtime_ns: int) -> Optional[str]:
+        """Return the cached hash if the file still has the given size and mtime."""
+        with self._lock:
+            self._seen.add(relative_path)
+            entry = self._entries.get(relative_path)
+            if entry and entry[0] == size and entry[1] == mtime_ns:
+                self.hits += 1
+                return entry[2]
+        return None
+    
+    def put(self, relative_path: str, size: int, mtime_ns: int, file_hash: Optional[str]) -> None:
+        """Remember the hash of a file as of the given size and mtime."""
+        if file_hash is None:
+            return
+        with self._lock:
+            self._seen.add(relative_path)
+            self._entries[relative_path] = [size, mtime_ns, file_hash]
+            self._dirty = True
+    
+    def save(self) -> None:
+        """Write the cache, dropping entries for files not seen this run."""
+        with self._lock:
+            if set(self._entries) - self._seen:
+                self._entries = {k: v for k, v in self._entries.items() if k in self._seen}
+                self._dirty = True
+            if not self._dirty:
+                return
+            data = json.dumps(self._entries, separators=(',', ':'))
+            self._dirty = False
+        
+        temp_file = self.path.with_name(f"{self.path.name}.{os.getpid()}")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(temp_file, 'w') as f:
+                f.write(data)
+            os.replace(temp_file, self.path)
+        except OSError as e:
+            self.logger.warning(f"Could not save hash cache {self.path}: {e}")
+            try:
+                temp_file.unlink()
+            except OSError:
+                pass
+    
+    def _load(self) -> dict:
+        """Read the cache file, starting empty if it is missing or unreadable."""
+        try:
+            with open(self.path, 'r') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return entries if isinstance(entries, dict) else {}
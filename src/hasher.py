@@ -5,38 +5,148 @@ Uses MD5 hashing for file comparison.
 """
 
 import hashlib
+import mmap
+import os
+import threading
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Union
+from .profiling import profiled
+from .throttle import Throttle
+from .utils import is_sparse, data_extents
 import logging
 
 
+MIN_BLOCK_SIZE = 64 * 1024
+MAX_BLOCK_SIZE = 4 * 1024 * 1024
+DEFAULT_MMAP_THRESHOLD = 256 * 1024 * 1024
+DEFAULT_RANGE_SIZE = 64 * 1024 * 1024
+
+
+def probe_block_size(path: Path) -> int:
+    """
+    Pick a read block size for the filesystem or block device holding path.
+    
+    Starts from the larger of the preferred I/O size (st_blksize) and the
+    filesystem block size, then widens it to the device readahead window
+    when one is exposed under /sys/dev/block. The result is clamped to
+    [MIN_BLOCK_SIZE, MAX_BLOCK_SIZE] and rounded to a multiple of the base.
+    """
+    st = os.stat(path)
+    base = getattr(st, 'st_blksize', 0) or 4096
+    try:
+        base = max(base, os.statvfs(path).f_bsize)
+    except (OSError, AttributeError):
+        pass
+    
+    block_size = base * 16
+    readahead = _device_readahead(st.st_dev)
+    if readahead:
+        block_size = max(block_size, readahead)
+    
+    block_size = max(MIN_BLOCK_SIZE, min(block_size, MAX_BLOCK_SIZE))
+    return max(base, block_size - block_size % base)
+
+
+def _device_readahead(st_dev: int) -> int:
+    """Return the readahead window in bytes for a device, or 0 if unknown."""
+    sys_dir = f"/sys/dev/block/{os.major(st_dev)}:{os.minor(st_dev)}"
+    # Partitions keep their queue settings on the parent disk
+    for candidate in (f"{sys_dir}/queue/read_ahead_kb",
+                      f"{sys_dir}/../queue/read_ahead_kb"):
+        try:
+            with open(candidate, 'r') as f:
+                return int(f.read().strip()) * 1024
+        except (OSError, ValueError):
+            continue
+    return 0
+
+
+def update_zeros(hasher, count: int, zeros: memoryview) -> None:
+    """Feed count zero bytes into hasher, at most len(zeros) at a time."""
+    while count > 0:
+        n = min(count, len(zeros))
+        hasher.update(zeros[:n])
+        count -= n
+
+
+def combine_range_hashes(algorithm: str, digests: list) -> str:
+    """
+    Combine per-range hex digests into a tree hash.
+    
+    The root is the hash of the concatenated range digests, so a file
+    copied range by range in parallel can be hashed without a second read.
+    """
+    root = hashlib.new(algorithm)
+    for digest in digests:
+        root.update(bytes.fromhex(digest))
+    return root.hexdigest()
+
+
 class FileHasher:
     """Handles file hashing operations."""
     
-    def __init__(self, algorithm: str = 'md5'):
+    # Block sizes probed per st_dev, shared by all hashers in the process
+    _block_sizes = {}
+    _block_sizes_lock = threading.Lock()
+    
+    def __init__(self, algorithm: str = 'md5',
+                 buffer_size: Union[int, str, None] = 'auto',
+                 mmap_threshold: int = DEFAULT_MMAP_THRESHOLD,
+                 throttle: Optional[Throttle] = None):
         self.algorithm = algorithm
+        self.buffer_size = buffer_size
+        self.mmap_threshold = mmap_threshold
+        self.throttle = throttle or Throttle()
         self.logger = logging.getLogger(__name__)
-        
-    def hash_file(self, file_path: Path, buffer_size: int = 65536) -> Optional[str]:
+        self._local = threading.local()
+    
+    @classmethod
+    def from_config(cls, config: dict, algorithm: str = 'md5',
+                    throttle: Optional[Throttle] = None) -> 'FileHasher':
+        """Create a hasher using the read settings from the sync config."""
+        sync_config = config.get('sync', {})
+        return cls(
+            algorithm,
+            buffer_size=sync_config.get('buffer_size', 'auto'),
+            mmap_threshold=sync_config.get('mmap_threshold', DEFAULT_MMAP_THRESHOLD),
+            throttle=throttle
+        )
+    
+    @profiled('hash')
+    def hash_file(self, file_path: Path, buffer_size: Optional[int] = None) -> Optional[str]:
         """
         Calculate hash of file contents.
         
+        Small and medium files are read with readinto() into a buffer owned
+        by the calling thread, so no per-block bytes objects are allocated.
+        Files at or above mmap_threshold are mapped and hashed in place.
+        Holes in sparse files are hashed as runs of zeros without reading them.
+        
         Args:
             file_path: Path to file to hash
-            buffer_size: Size of read buffer
-            
+            buffer_size: Size of read buffer (defaults to the configured
+                or auto-tuned block size)
+        
         Returns:
             Hex string of hash, or None if error
         """
         try:
             hasher = hashlib.new(self.algorithm)
             
-            with open(file_path, 'rb') as f:
-                while True:
-                    data = f.read(buffer_size)
-                    if not data:
-                        break
-                    hasher.update(data)
+            with open(file_path, 'rb', buffering=0) as f:
+                st = os.fstat(f.fileno())
+                block_size = buffer_size or self.block_size_for(file_path, st.st_dev)
+                
+                extents = data_extents(f.fileno(), st.st_size) if is_sparse(st) else None
+                
+                if extents is not None:
+                    self._hash_sparse(f, hasher, block_size, extents, st.st_size)
+                elif self.mmap_threshold and st.st_size >= self.mmap_threshold:
+                    self._hash_mmap(f, hasher, block_size)
+                else:
+                    self._hash_readinto(f, hasher, block_size)
+                
+                self.throttle.drop_cache(f.fileno())
             
             return hasher.hexdigest()
         
@@ -50,6 +160,157 @@ class FileHasher:
             self.logger.error(f"Error hashing file {file_path}: {e}")
             return None
     
+    def hash_file_uncached(self, file_path: Path) -> Optional[str]:
+        """
+        Hash a file from storage rather than the page cache.
+        
+        Reads with O_DIRECT where the filesystem supports it. Otherwise the
+        file is synced and its cached pages dropped before a normal read, so
+        a freshly written copy is checked against what actually reached disk.
+        """
+        try:
+            digest = self._hash_direct(file_path)
+        except OSError:
+            digest = None
+        if digest is not None:
+            return digest
+        
+        try:
+            fd = os.open(file_path, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+                if hasattr(os, 'posix_fadvise'):
+                    os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            self.logger.warning(f"Could not evict {file_path} from the page cache: {e}")
+        return self.hash_file(file_path)
+    
+    def _hash_direct(self, file_path: Path) -> Optional[str]:
+        """Hash a file with O_DIRECT reads, or return None if unsupported."""
+        if not hasattr(os, 'O_DIRECT'):
+            return None
+        try:
+            fd = os.open(file_path, os.O_RDONLY | os.O_DIRECT)
+        except OSError:
+            # EINVAL on filesystems without direct I/O (e.g. tmpfs)
+            return None
+        
+        try:
+            block_size = self.block_size_for(file_path)
+            block_size += -block_size % mmap.PAGESIZE
+            hasher = hashlib.new(self.algorithm)
+            # Anonymous maps are page aligned, as O_DIRECT requires
+            with mmap.mmap(-1, block_size) as buffer:
+                view = memoryview(buffer)
+                try:
+                    while True:
+                        n = os.readv(fd, [view])
+                        if not n:
+                            break
+                        self.throttle.io(n)
+                        hasher.update(view[:n])
+                finally:
+                    view.release()
+            return hasher.hexdigest()
+        finally:
+            os.close(fd)
+    
+    def tree_hash(self, file_path: Path, range_size: int = DEFAULT_RANGE_SIZE) -> Optional[str]:
+        """
+        Calculate the tree hash of a file (see combine_range_hashes).
+        
+        Matches the hash FileCopier computes while copying large files in
+        parallel ranges with sync.range_hash enabled, for later verification.
+        """
+        try:
+            digests = []
+            with open(file_path, 'rb', buffering=0) as f:
+                st = os.fstat(f.fileno())
+                view = self._get_buffer(min(range_size, self.block_size_for(file_path, st.st_dev)))
+                for offset in range(0, st.st_size, range_size):
+                    hasher = hashlib.new(self.algorithm)
+                    remaining = min(range_size, st.st_size - offset)
+                    while remaining > 0:
+                        n = f.readinto(view[:min(len(view), remaining)])
+                        if not n:
+                            break
+                        self.throttle.io(n)
+                        hasher.update(view[:n])
+                        remaining -= n
+                    digests.append(hasher.hexdigest())
+            return combine_range_hashes(self.algorithm, digests)
+        
+        except OSError as e:
+            self.logger.error(f"Error hashing file {file_path}: {e}")
+            return None
+    
+    def block_size_for(self, file_path: Path, st_dev: Optional[int] = None) -> int:
+        """Return the read block size to use for file_path."""
+        if isinstance(self.buffer_size, int) and self.buffer_size > 0:
+            return self.buffer_size
+        
+        if st_dev is None:
+            st_dev = os.stat(file_path).st_dev
+        block_size = self._block_sizes.get(st_dev)
+        if block_size is None:
+            block_size = probe_block_size(file_path)
+            with self._block_sizes_lock:
+                self._block_sizes[st_dev] = block_size
+        return block_size
+    
+    def _get_buffer(self, size: int) -> memoryview:
+        """Return this thread's reusable read buffer, growing it if needed."""
+        view = getattr(self._local, 'view', None)
+        if view is None or len(view) < size:
+            self._local.view = view = memoryview(bytearray(size))
+        return view[:size]
+    
+    def _hash_readinto(self, f, hasher, block_size: int) -> None:
+        """Feed a raw file object into hasher through the thread buffer."""
+        view = self._get_buffer(block_size)
+        while True:
+            n = f.readinto(view)
+            if not n:
+                break
+            self.throttle.io(n)
+            hasher.update(view[:n])
+    
+    def _hash_sparse(self, f, hasher, block_size: int, extents: list, size: int) -> None:
+        """Hash the data extents of a sparse file, feeding zeros for the holes."""
+        view = self._get_buffer(block_size)
+        zeros = memoryview(bytes(block_size))
+        position = 0
+        
+        for offset, length in extents + [(size, 0)]:
+            # Synthetic zero run for the hole before this extent
+            update_zeros(hasher, offset - position, zeros)
+            
+            f.seek(offset)
+            remaining = length
+            while remaining > 0:
+                n = f.readinto(view[:min(block_size, remaining)])
+                if not n:
+                    break
+                self.throttle.io(n)
+                hasher.update(view[:n])
+                remaining -= n
+            position = offset + length
+    
+    def _hash_mmap(self, f, hasher, block_size: int) -> None:
+        """Feed a memory-mapped file into hasher without copying it."""
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if hasattr(mapped, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            view = memoryview(mapped)
+            try:
+                for offset in range(0, len(view), block_size):
+                    self.throttle.io(min(block_size, len(view) - offset))
+                    hasher.update(view[offset:offset + block_size])
+            finally:
+                view.release()
+    
     def hash_directory(self, directory: Path) -> dict:
         """
         Create hash map of all files in directory.
@@ -0,0 +1,236 @@
+"""
+Running many sync and backup jobs in one process under a shared budget.
+
+Rather than one filesync process per cron entry, all competing for the
+same disks, the jobs section lists every job and `filesync run-jobs`
+runs them together:
+    
+    scheduler:
+      workers: 2                # jobs running at once
+      bytes_per_sec: 0          # shared by all jobs (0 = unlimited)
+      iops: 0
+    jobs:
+      - name: home
+        type: sync              # sync | backup
+        source: /home
+        destination: /mnt/mirror/home   # a list syncs to several
+        priority: 10            # higher starts first
+        heavy: true             # never alongside another heavy job on the same device
+        config:                 # this job's overrides of the top-level sections
+          sync: {mode: mirror}
+
+Each job keeps its own throttle (from its config), and all of its I/O is
+also charged to the scheduler's shared budget. Jobs start in priority
+order as worker slots free up. A heavy job waits while another heavy job
+uses one of its devices (the filesystems of its source and destinations);
+jobs that don't conflict may start ahead of it meanwhile.
+
+throttle.nice and throttle.ioprio change the priority of the whole
+process, so the jobs run together must agree on them.
+"""
+
+import copy
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Iterable, List, Optional, Set
+from .throttle import Throttle, throttle_settings
+import logging
+
+
+JOB_TYPES = ('sync', 'backup')
+DEFAULT_WORKERS = 2
+
+
+def device_of(path: Path) -> Optional[int]:
+    """Return the device a path is (or would be created) on, or None if unknown."""
+    path = Path(path).absolute()
+    for candidate in (path, *path.parents):
+        try:
+            return os.stat(candidate).st_dev
+        except OSError:
+            continue
+    return None
+
+
+def job_config(config: dict, overrides: Optional[dict]) -> dict:
+    """Apply a job's overrides to a copy of the config, section by section like the config file."""
+    config = copy.deepcopy(config)
+    for key, value in (overrides or {}).items():
+        if isinstance(config.get(key), dict) and isinstance(value, dict):
+            config[key].update(value)
+        else:
+            config[key] = value
+    return config
+
+
+class Job:
+    """One entry of the jobs section."""
+    
+    def __init__(self, name: str, job_type: str, source: Path, destinations: List[Path],
+                 priority: int = 0, heavy: bool = True, overrides: Optional[dict] = None):
+        self.name = name
+        self.type = job_type
+        self.source = source
+        self.destinations = destinations
+        self.priority = priority
+        self.heavy = heavy
+        self.overrides = overrides or {}
+        self._devices = None
+    
+    @classmethod
+    def from_entry(cls, entry: dict) -> 'Job':
+        """
+        Build a job from its config entry.
+        
+        Raises:
+            ValueError: The entry is missing a field or has an invalid one
+        """
+        name = entry.get('name')
+        if not name:
+            raise ValueError(f"Job without a name: {entry}")
+        job_type = entry.get('type', 'sync')
+        if job_type not in JOB_TYPES:
+            raise ValueError(f"Unknown type for job {name}: {job_type}")
+        if not entry.get('source') or not entry.get('destination'):
+            raise ValueError(f"Job {name} needs a source and a destination")
+        
+        destinations = entry['destination']
+        if isinstance(destinations, str):
+            destinations = [destinations]
+        if job_type == 'backup' and len(destinations) != 1:
+            raise ValueError(f"Backup job {name} takes a single destination")
+        priority = entry.get('priority', 0)
+        if not isinstance(priority, int) or isinstance(priority, bool):
+            raise ValueError(f"Invalid priority for job {name}: {priority}")
+        return cls(name, job_type, Path(entry['source']), [Path(d) for d in destinations],
+                   priority=priority, heavy=entry.get('heavy', True),
+                   overrides=entry.get('config'))
+    
+    @property
+    def devices(self) -> Set[int]:
+        """Devices the job reads from or writes to."""
+        if self._devices is None:
+            devices = (device_of(path) for path in (self.source, *self.destinations))
+            self._devices = {device for device in devices if device is not None}
+        return self._devices
+
+
+class JobScheduler:
+    """Runs the configured jobs concurrently within a global worker and I/O budget."""
+    
+    def __init__(self, config: dict):
+        settings = config.get('scheduler', {})
+        self.config = config
+        self.workers = max(1, settings.get('workers', DEFAULT_WORKERS))
+        self.budget = Throttle(bytes_per_sec=settings.get('bytes_per_sec', 0),
+                               iops=settings.get('iops', 0))
+        self.jobs = [Job.from_entry(entry) for entry in config.get('jobs') or []]
+        self.logger = logging.getLogger(__name__)
+        
+        names = [job.name for job in self.jobs]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            raise ValueError(f"Job names must be unique: {', '.join(duplicates)}")
+    
+    def run(self, names: Optional[Iterable[str]] = None) -> dict:
+        """
+        Run the jobs (or only those named) and wait for all of them.
+        
+        A failing job is reported and does not stop the others.
+        
+        Returns:
+            dict: Per-job results under 'jobs' (in config order), the number
+                of failed jobs, and the aggregate rates against the budget
+        """
+        jobs = self.jobs
+        if names is not None:
+            names = list(names)
+            unknown = set(names) - {job.name for job in jobs}
+            if unknown:
+                raise ValueError(f"Unknown jobs: {', '.join(sorted(unknown))}")
+            jobs = [job for job in jobs if job.name in names]
+        
+        levels = {self._process_priority(job) for job in jobs}
+        if len(levels) > 1:
+            raise ValueError("Jobs run together share one process priority: give them the same "
+                             "throttle.nice and throttle.ioprio, or run them separately")
+        
+        self.budget.reset_stats()
+        started = time.monotonic()
+        # Stable, so equal priorities keep their config order
+        pending = sorted(jobs, key=lambda job: -job.priority)
+        running = {}
+        results = {}
+        
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while pending or running:
+                for job in list(pending):
+                    if len(running) >= self.workers:
+                        break
+                    if self._conflicts(job, running.values()):
+                        continue
+                    pending.remove(job)
+                    self.logger.info(f"Starting job {job.name}")
+                    running[pool.submit(self._run_job, job)] = job
+                
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = running.pop(future)
+                    results[job.name] = future.result()
+        
+        summary = {
+            'jobs': [results[job.name] for job in jobs],
+            'failed': sum(1 for result in results.values() if result['status'] != 'ok'),
+            'seconds': round(time.monotonic() - started, 3)
+        }
+        summary.update(self.budget.stats())
+        return summary
+    
+    def _process_priority(self, job: Job) -> tuple:
+        """The (nice, ioprio) a job's engine would apply to the process."""
+        settings = throttle_settings(job_config(self.config, job.overrides), job.type)
+        return settings.get('nice') or 0, settings.get('ioprio')
+    
+    def _conflicts(self, job: Job, running: Iterable[Job]) -> bool:
+        """Whether a heavy job would share a device with a running heavy job."""
+        if not job.heavy:
+            return False
+        return any(other.heavy and other.devices & job.devices for other in running)
+    
+    def _run_job(self, job: Job) -> dict:
+        """Run one job, returning its outcome, duration and statistics."""
+        result = {'name': job.name, 'type': job.type, 'status': 'ok'}
+        started = time.monotonic()
+        try:
+            stats = self._execute(job, job_config(self.config, job.overrides))
+        except Exception as e:
+            self.logger.error(f"Job {job.name} failed: {e}")
+            result.update(status='failed', error=str(e))
+            stats = {}
+        result['seconds'] = round(time.monotonic() - started, 3)
+        result['errors'] = stats.get('errors', 0)
+        result['io_bytes'] = stats.get('io_bytes', 0)
+        result['rate_bytes_per_sec'] = stats.get('rate_bytes_per_sec', 0)
+        result['stats'] = stats
+        return result
+    
+    def _execute(self, job: Job, config: dict) -> dict:
+        """Run a job's engine with its throttle charging the shared budget."""
+        if job.type == 'backup':
+            from .backup_manager import BackupManager
+            manager = BackupManager(config)
+            manager.throttle.parent = self.budget
+            job.destinations[0].mkdir(parents=True, exist_ok=True)
+            return manager.create_backup(job.source, job.destinations[0])
+        
+        if len(job.destinations) > 1:
+            from .fanout import FanoutSyncEngine
+            engine = FanoutSyncEngine(str(job.source), [str(d) for d in job.destinations], config)
+        else:
+            # Sharded syncs run in other processes, outside the shared budget
+            from .sync_engine import SyncEngine
+            engine = SyncEngine(str(job.source), str(job.destinations[0]), config)
+        engine.throttle.parent = self.budget
+        return engine.sync()
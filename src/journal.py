@@ -0,0 +1,127 @@
+"""
+Write-ahead progress journal for resumable backups.
+
+A backup directory is marked incomplete before the first file is written
+and the marker is only removed once metadata.json is in place. While the
+backup runs, every file that is safely stored (or confirmed unchanged) is
+appended to journal.jsonl, so an interrupted backup can pick up where it
+stopped instead of starting again from zero.
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+import logging
+
+
+INCOMPLETE_MARKER = '.incomplete'
+JOURNAL_FILE = 'journal.jsonl'
+
+
+def is_incomplete(backup_path: Path) -> bool:
+    """Check whether a backup directory was never finished."""
+    return (backup_path / INCOMPLETE_MARKER).exists()
+
+
+class BackupJournal:
+    """Records completed files for one backup directory."""
+    
+    def __init__(self, backup_path: Path):
+        self.backup_path = backup_path
+        self.marker_file = backup_path / INCOMPLETE_MARKER
+        self.journal_file = backup_path / JOURNAL_FILE
+        self.completed = {}
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._handle = None
+    
+    def start(self, info: dict) -> None:
+        """
+        Mark the backup incomplete and open the journal for appending.
+        
+        Args:
+            info: Details needed to resume (type, source, timestamp, base)
+        """
+        self.backup_path.mkdir(parents=True, exist_ok=True)
+        if not self.marker_file.exists():
+            with open(self.marker_file, 'w') as f:
+                json.dump(info, f)
+                f.flush()
+                os.fsync(f.fileno())
+        
+        self.completed = self._load()
+        self._handle = open(self.journal_file, 'a')
+        # Terminate a line torn by the crash so new entries start cleanly
+        if self._handle.tell() and not self._ends_with_newline():
+            self._handle.write('\n')
+    
+    def load_info(self) -> dict:
+        """Return the details saved by start(), or {} if unreadable."""
+        try:
+            with open(self.marker_file, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def lookup(self, relative_path: str, stat_result: os.stat_result) -> Optional[dict]:
+        """
+        Return the journal entry for a file if it is still current.
+        
+        An entry only counts when size and mtime still match the source,
+        so files modified after the interruption are processed again.
+        """
+        entry = self.completed.get(relative_path)
+        if entry is None:
+            return None
+        if entry['size'] != stat_result.st_size or entry['mtime_ns'] != stat_result.st_mtime_ns:
+            return None
+        return entry
+    
+    def record(self, entry: dict) -> None:
+        """Append a completed file to the journal."""
+        line = json.dumps(entry, separators=(',', ':')) + '\n'
+        with self._lock:
+            self._handle.write(line)
+            self._handle.flush()
+    
+    def finish(self) -> None:
+        """Close the journal and remove it along with the incomplete marker."""
+        self.close()
+        for path in (self.marker_file, self.journal_file):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+    
+    def close(self) -> None:
+        """Close the journal file, keeping it for a later resume."""
+        if self._handle:
+            self._handle.close()
+            self._handle = None
+    
+    def _ends_with_newline(self) -> bool:
+        """Check whether the journal file ends with a complete line."""
+        with open(self.journal_file, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+    
+    def _load(self) -> dict:
+        """Read entries written by an earlier, interrupted run."""
+        completed = {}
+        if not self.journal_file.exists():
+            return completed
+        
+        with open(self.journal_file, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A torn final line from the crash; everything before it is good
+                    continue
+                completed[entry['path']] = entry
+        
+        if completed:
+            self.logger.info(f"Resuming backup with {len(completed)} files already done")
+        return completed
@@ -0,0 +1,128 @@
+"""
+Persistent directory listings for incremental scans.
+
+On large trees that rarely change, most of a scan is spent re-reading
+directories whose contents are the same as last time. Creating, removing
+or renaming an entry updates its directory's mtime, so a listing taken at
+one mtime (and inode) stays valid as long as neither changes. The cache
+keeps each directory's entry names; the scanner stats every directory
+but lists only those whose stat changed. Files are still stat'd, since
+writing to a file doesn't touch its directory.
+
+Given a change feed (the paths changed since the last scan, e.g. from an
+inotify watcher), the scanner relies on it instead: directories with no
+change at or below them are taken from the cache without any system call,
+file stats included.
+
+A listing is only cached once its directory's mtime is RACY_NS old: a
+change within the same timestamp tick would not move the mtime.
+"""
+
+import json
+import os
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from .config_manager import default_cache_dir
+import logging
+
+
+RACY_NS = 2 * 10 ** 9
+
+# Entry fields: [mtime_ns, inode, subdirectory names, file names, file stats or None]
+_MTIME, _INO, _DIRS, _FILES, _STATS = range(5)
+
+
+class ListingCache:
+    """Maps directories of one tree to their entries as of an mtime and inode."""
+    
+    def __init__(self, path: Path):
+        self.path = path
+        self.logger = logging.getLogger(__name__)
+        self.hits = 0
+        self.misses = 0
+        self._entries = self._load()
+        # Directories visited this run; save() forgets the rest
+        self._seen = set()
+        self._dirty = False
+    
+    @classmethod
+    def for_tree(cls, root: Path, cache_dir: Optional[Path] = None) -> 'ListingCache':
+        """Open the cache for a directory tree in the per-user cache directory."""
+        root = os.path.abspath(root)
+        cache_dir = cache_dir if cache_dir is not None else default_cache_dir()
+        return cls(Path(cache_dir) / f"listings-{zlib.crc32(root.encode()):08x}.json")
+    
+    def get(self, rel_dir: str, st: os.stat_result) -> Optional[Tuple[List[str], List[str]]]:
+        """Return (subdirectories, files) if the directory is unchanged since listed."""
+        self._seen.add(rel_dir)
+        entry = self._entries.get(rel_dir)
+        if entry and entry[_MTIME] == st.st_mtime_ns and entry[_INO] == st.st_ino:
+            self.hits += 1
+            return entry[_DIRS], entry[_FILES]
+        self.misses += 1
+        return None
+    
+    def cached(self, rel_dir: str) -> Optional[Tuple[List[str], List[str]]]:
+        """Return the stored listing without checking it (for change-feed scans)."""
+        entry = self._entries.get(rel_dir)
+        if entry is None:
+            return None
+        self._seen.add(rel_dir)
+        self.hits += 1
+        return entry[_DIRS], entry[_FILES]
+    
+    def put(self, rel_dir: str, st: os.stat_result, dirs: List[str], files: List[str]) -> None:
+        """Remember a directory's listing as of its current stat."""
+        self._seen.add(rel_dir)
+        if time.time_ns() - st.st_mtime_ns < RACY_NS:
+            # Could still change without its mtime moving
+            if self._entries.pop(rel_dir, None) is not None:
+                self._dirty = True
+            return
+        self._entries[rel_dir] = [st.st_mtime_ns, st.st_ino, dirs, files, None]
+        self._dirty = True
+    
+    def stats(self, rel_dir: str) -> Optional[Dict[str, list]]:
+        """Return the file stats recorded by the last scan, as name -> [size, mtime_ns, ino]."""
+        entry = self._entries.get(rel_dir)
+        return entry[_STATS] if entry else None
+    
+    def put_stats(self, rel_dir: str, stats: Dict[str, list]) -> None:
+        """Record the stats of a directory's files alongside its listing."""
+        entry = self._entries.get(rel_dir)
+        if entry is not None and entry[_STATS] != stats:
+            entry[_STATS] = stats
+            self._dirty = True
+    
+    def save(self) -> None:
+        """Write the cache, dropping directories not seen this run."""
+        if set(self._entries) - self._seen:
+            self._entries = {k: v for k, v in self._entries.items() if k in self._seen}
+            self._dirty = True
+        if not self._dirty:
+            return
+        self._dirty = False
+        
+        temp_file = self.path.with_name(f"{self.path.name}.{os.getpid()}")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(temp_file, 'w') as f:
+                json.dump(self._entries, f, separators=(',', ':'))
+            os.replace(temp_file, self.path)
+        except OSError as e:
+            self.logger.warning(f"Could not save listing cache {self.path}: {e}")
+            try:
+                temp_file.unlink()
+            except OSError:
+                pass
+    
+    def _load(self) -> dict:
+        """Read the cache file, starting empty if it is missing or unreadable."""
+        try:
+            with open(self.path, 'r') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return entries if isinstance(entries, dict) else {}
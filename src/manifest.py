@@ -0,0 +1,160 @@
+"""
+Backup manifests stored as a chain of deltas.
+
+Every backup records the hash, size and mtime of each source file so the
+next incremental can detect changes. Writing that whole map for every
+incremental costs time and space proportional to the tree even when a
+handful of files changed. Instead an incremental stores only what changed
+against its parent backup's manifest:
+    
+    hashes.delta.json   {"parent": "full_20240101_000000", "depth": 3,
+                         "added": {...}, "changed": {...}, "removed": [...]}
+
+and every checkpoint_interval backups (and for every full backup) the
+complete map is written as a checkpoint in hashes.json. Loading walks back
+to the nearest checkpoint and applies the deltas forward.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Dict, Optional
+from .copier import fsync_directory
+
+
+MANIFEST_FILE = 'hashes.json'
+DELTA_FILE = 'hashes.delta.json'
+DEFAULT_CHECKPOINT_INTERVAL = 10
+
+
+def _normalize(manifest: dict) -> dict:
+    """Accept manifests from older versions, which stored only the hash."""
+    return {path: value if isinstance(value, dict) else {'hash': value}
+            for path, value in manifest.items()}
+
+
+def _write_json(path: Path, data: dict) -> None:
+    """Write compact JSON atomically."""
+    temp_file = path.with_name(f"{path.name}.tmp")
+    with open(temp_file, 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_file, path)
+    fsync_directory(path.parent)
+
+
+def _read_json(path: Path) -> Optional[dict]:
+    """Read a JSON file, or None if it does not exist."""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def is_checkpoint(backup_path: Path) -> bool:
+    """Check whether a backup stores a complete manifest."""
+    return (backup_path / MANIFEST_FILE).exists()
+
+
+def delta_parent(backup_path: Path) -> Optional[Path]:
+    """Return the backup a delta manifest is based on, or None for a checkpoint."""
+    if is_checkpoint(backup_path):
+        return None
+    delta = _read_json(backup_path / DELTA_FILE)
+    if delta is None:
+        return None
+    return backup_path.parent / delta['parent']
+
+
+def load_manifest(backup_path: Path, loaded: Optional[Dict[Path, dict]] = None) -> dict:
+    """
+    Load the complete manifest of a backup.
+    
+    Args:
+        backup_path: Backup to load
+        loaded: Manifests already loaded, by backup path; the delta chain
+            stops at the first of them instead of going back to a checkpoint
+    
+    Returns:
+        Dict mapping relative paths to {'hash', 'size', 'mtime_ns'}, or {}
+        if the backup has no manifest
+    """
+    # Walk back to the nearest checkpoint, then apply the deltas forward
+    deltas = []
+    current = backup_path
+    while True:
+        if loaded and current in loaded:
+            manifest = dict(loaded[current])
+            break
+        full = _read_json(current / MANIFEST_FILE)
+        if full is not None:
+            manifest = _normalize(full)
+            break
+        delta = _read_json(current / DELTA_FILE)
+        if delta is None:
+            manifest = {}
+            break
+        deltas.append(delta)
+        current = current.parent / delta['parent']
+    
+    for delta in reversed(deltas):
+        for path in delta['removed']:
+            manifest.pop(path, None)
+        manifest.update(delta['added'])
+        manifest.update(delta['changed'])
+    return manifest
+
+
+def save_manifest(backup_path: Path, manifest: dict, parent_path: Optional[Path] = None,
+                  parent_manifest: Optional[dict] = None,
+                  checkpoint_interval: int = DEFAULT_CHECKPOINT_INTERVAL) -> None:
+    """
+    Store a backup's manifest, as a delta against its parent where possible.
+    
+    Args:
+        backup_path: Backup directory to write into
+        manifest: Complete manifest of this backup
+        parent_path: Backup the manifest should be a delta against
+        parent_manifest: Complete manifest of parent_path, as already loaded
+        checkpoint_interval: Write a full checkpoint once a chain has this
+            many deltas (0 or 1 always writes checkpoints)
+    """
+    depth = _depth(parent_path) + 1 if parent_path and parent_manifest else None
+    if depth is None or depth >= max(1, checkpoint_interval):
+        _write_json(backup_path / MANIFEST_FILE, manifest)
+        return
+    
+    added, changed = {}, {}
+    for path, entry in manifest.items():
+        previous = parent_manifest.get(path)
+        if previous is None:
+            added[path] = entry
+        elif previous != entry:
+            changed[path] = entry
+    removed = [path for path in parent_manifest if path not in manifest]
+    
+    _write_json(backup_path / DELTA_FILE, {
+        'parent': parent_path.name,
+        'depth': depth,
+        'added': added,
+        'changed': changed,
+        'removed': removed
+    })
+
+
+def checkpoint(backup_path: Path) -> None:
+    """Turn a delta manifest into a full one, so it no longer needs its parents."""
+    if is_checkpoint(backup_path) or not (backup_path / DELTA_FILE).exists():
+        return
+    _write_json(backup_path / MANIFEST_FILE, load_manifest(backup_path))
+    (backup_path / DELTA_FILE).unlink()
+
+
+def _depth(backup_path: Path) -> int:
+    """Number of deltas between a backup and its checkpoint (0 for a checkpoint)."""
+    if is_checkpoint(backup_path):
+        return 0
+    delta = _read_json(backup_path / DELTA_FILE)
+    return delta['depth'] if delta else 0
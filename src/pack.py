@@ -0,0 +1,274 @@
+"""
+Pack files for storing many small files in a backup.
+
+Creating one file per tiny source file makes a backup of a node cache or
+maildir spend its time in mkdir/open/copystat and use an inode per file.
+Files below backup.pack_threshold are instead appended to large pack files
+in the backup's PACK_DIR, and an index records where each one lives:
+    
+    .filesync-packs/pack-00000.dat    concatenated file contents
+    .filesync-packs/index.jsonl       {"path", "pack", "offset", "length",
+                                       "mode", "mtime_ns"} per packed file
+
+Pack data is synced before its index entries are written, so every
+indexed file is readable. Like the backup journal the index is append-only;
+a resumed backup keeps the existing packs and starts a new one.
+"""
+
+import json
+import os
+import stat
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+from .copier import FileCopier, datasync, fsync_directory, pwrite_all
+import logging
+
+
+PACK_DIR = '.filesync-packs'
+PACK_INDEX = 'index.jsonl'
+DEFAULT_PACK_SIZE = 256 * 1024 * 1024
+# Buffer for appending to a pack, so small files become large writes
+PACK_WRITE_BUFFER = 1024 * 1024
+
+
+def pack_dir(backup_path: Path) -> Path:
+    """Return the pack directory of a backup."""
+    return backup_path / PACK_DIR
+
+
+def load_index(backup_path: Path) -> Dict[str, dict]:
+    """Read a backup's pack index, later entries replacing earlier ones."""
+    index_file = pack_dir(backup_path) / PACK_INDEX
+    entries = {}
+    if not index_file.exists():
+        return entries
+    
+    with open(index_file, 'r') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Torn final line from an interrupted run
+                continue
+            entries[entry['path']] = entry
+    return entries
+
+
+def _ends_with_newline(path: Path) -> bool:
+    """Check whether a non-empty file ends with a complete line."""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        if not f.tell():
+            return True
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
+
+
+class PackWriter:
+    """Appends small files to the pack files of one backup."""
+    
+    def __init__(self, backup_path: Path, copier: FileCopier,
+                 pack_size: int = DEFAULT_PACK_SIZE):
+        self.directory = pack_dir(backup_path)
+        self.copier = copier
+        self.pack_size = pack_size
+        self.logger = logging.getLogger(__name__)
+        self.files_packed = 0
+        self._pack = None
+        self._pack_name = None
+        self._index = None
+        # Index entries (and journal callbacks) waiting for the pack data to be synced
+        self._pending: List[Tuple[dict, Optional[Callable[[], None]]]] = []
+    
+    def add(self, relative_path: str, source: Path, stat_result: os.stat_result,
+            on_commit: Optional[Callable[[], None]] = None, digest=None) -> int:
+        """
+        Append a file to the current pack.
+        
+        Args:
+            relative_path: Path of the file within the backup
+            source: File to read
+            stat_result: Stat of source (mode and mtime are recorded)
+            on_commit: Called once the file is durably indexed
+            digest: hashlib object to feed the file contents into
+        
+        Returns:
+            Number of bytes packed
+        """
+        with open(source, 'rb') as f:
+            data = f.read()
+        self.copier.throttle.io(len(data))
+        if digest is not None:
+            digest.update(data)
+        return self.add_data(relative_path, data, stat.S_IMODE(stat_result.st_mode),
+                             stat_result.st_mtime_ns, on_commit)
+    
+    def add_data(self, relative_path: str, data: bytes, mode: int, mtime_ns: int,
+                 on_commit: Optional[Callable[[], None]] = None) -> int:
+        """
+        Append contents already in memory (e.g. read from another backup's pack).
+        
+        Returns:
+            Number of bytes packed
+        """
+        if self._pack is None or self._pack.tell() + len(data) > self.pack_size:
+            self._next_pack()
+        
+        offset = self._pack.tell()
+        self._pack.write(data)
+        self.copier.throttle.io(len(data))
+        self.copier.add_bytes(len(data), len(data))
+        
+        self._pending.append(({
+            'path': relative_path,
+            'pack': self._pack_name,
+            'offset': offset,
+            'length': len(data),
+            'mode': mode,
+            'mtime_ns': mtime_ns
+        }, on_commit))
+        self.files_packed += 1
+        
+        if len(self._pending) >= self.copier.batch_size:
+            self.flush()
+        return len(data)
+    
+    def flush(self) -> None:
+        """Sync pending pack data, then index it and run the commit callbacks."""
+        if not self._pending:
+            return
+        
+        self._pack.flush()
+        if self.copier.durability != 'none':
+            datasync(self._pack.fileno())
+        
+        if self._index is None:
+            index_file = self.directory / PACK_INDEX
+            torn = index_file.exists() and not _ends_with_newline(index_file)
+            self._index = open(index_file, 'a')
+            # Terminate a line torn by an earlier crash
+            if torn:
+                self._index.write('\n')
+        self._index.write(''.join(json.dumps(entry, separators=(',', ':')) + '\n'
+                                  for entry, _ in self._pending))
+        self._index.flush()
+        if self.copier.durability != 'none':
+            datasync(self._index.fileno())
+        
+        pending, self._pending = self._pending, []
+        for _, on_commit in pending:
+            if on_commit:
+                on_commit()
+    
+    def close(self) -> None:
+        """Flush and close the current pack and the index."""
+        self.flush()
+        for handle in (self._pack, self._index):
+            if handle:
+                handle.close()
+        self._pack = self._index = None
+    
+    def _next_pack(self) -> None:
+        """Start a new pack file after any existing ones."""
+        self.flush()
+        if self._pack:
+            self._pack.close()
+        
+        new_dir = not self.directory.exists()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        number = len(list(self.directory.glob('pack-*.dat')))
+        while (self.directory / f"pack-{number:05d}.dat").exists():
+            number += 1
+        self._pack_name = f"pack-{number:05d}.dat"
+        self._pack = open(self.directory / self._pack_name, 'xb', buffering=PACK_WRITE_BUFFER)
+        if self.copier.durability != 'none':
+            fsync_directory(self.directory)
+            if new_dir:
+                fsync_directory(self.directory.parent)
+
+
+class PackReader:
+    """Reads packed files back through a backup's index."""
+    
+    def __init__(self, backup_path: Path):
+        self.directory = pack_dir(backup_path)
+        self.index = load_index(backup_path)
+    
+    def __contains__(self, relative_path: str) -> bool:
+        return relative_path in self.index
+    
+    def __len__(self) -> int:
+        return len(self.index)
+    
+    def entries(self) -> Iterator[dict]:
+        """Yield index entries in pack order, so restores read packs sequentially."""
+        yield from sorted(self.index.values(), key=lambda e: (e['pack'], e['offset']))
+    
+    def read(self, relative_path: str) -> bytes:
+        """Return the contents of a packed file."""
+        entry = self.index[relative_path]
+        with open(self.directory / entry['pack'], 'rb') as f:
+            f.seek(entry['offset'])
+            data = f.read(entry['length'])
+        if len(data) != entry['length']:
+            raise OSError(f"Pack {entry['pack']} is truncated at {relative_path}")
+        return data
+    
+    def extract(self, copier: FileCopier, destination_root: Path,
+                on_error: Optional[Callable[[str, Exception], None]] = None,
+                paths: Optional[Set[str]] = None) -> int:
+        """
+        Write every packed file below destination_root through the copier.
+        
+        Files are written atomically with their recorded mode and mtime,
+        under the copier's durability mode. Given paths, only those are
+        extracted.
+        
+        Returns:
+            Number of files extracted
+        """
+        extracted = 0
+        handles = {}
+        try:
+            for entry in self.entries():
+                if paths is not None and entry['path'] not in paths:
+                    continue
+                try:
+                    src = handles.get(entry['pack'])
+                    if src is None:
+                        src = handles[entry['pack']] = open(self.directory / entry['pack'], 'rb')
+                    src.seek(entry['offset'])
+                    data = src.read(entry['length'])
+                    if len(data) != entry['length']:
+                        raise OSError(f"Pack {entry['pack']} is truncated")
+                    copier.throttle.io(len(data))
+                    
+                    destination = destination_root / entry['path']
+                    self._write_file(copier, destination, data, entry)
+                    extracted += 1
+                except OSError as e:
+                    if on_error is None:
+                        raise
+                    on_error(entry['path'], e)
+        finally:
+            for handle in handles.values():
+                handle.close()
+        return extracted
+    
+    def _write_file(self, copier: FileCopier, destination: Path, data: bytes, entry: dict) -> None:
+        """Write one extracted file to a temp name and commit it into place."""
+        temp_path = copier.temp_path_for(destination)
+        try:
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            try:
+                pwrite_all(fd, memoryview(data), 0)
+                os.fchmod(fd, entry['mode'])
+            finally:
+                os.close(fd)
+            copier.throttle.io(len(data))
+            os.utime(temp_path, ns=(entry['mtime_ns'], entry['mtime_ns']))
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+        copier.add_bytes(len(data), len(data))
+        copier.commit(temp_path, destination)
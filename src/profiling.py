@@ -0,0 +1,257 @@
+"""
+Built-in profiling for the --profile CLI option.
+
+Engines mark the stages of their work as named phases, either with the
+phase() context manager or the profiled() decorator:
+    
+    with phase('compare'):
+        ...
+
+When no Profiler is running both cost one global lookup, so the markers
+stay in place in production code. While a Profiler runs, each phase
+records its wall time, call count and peak traced memory (tracemalloc),
+and the command is profiled by a sampling profiler where the interpreter
+supports one (sys._current_frames), otherwise by cProfile. stop() writes
+to the output directory:
+    
+    summary.txt      phases, top-N functions and top-N allocation sites
+    phases.folded    collapsed phase stacks weighted by self time (us)
+    stacks.folded    collapsed Python stacks under their phases (sampling)
+    profile.pstats   raw cProfile data (cProfile mode)
+
+The .folded files are ready for flamegraph.pl or speedscope.
+"""
+
+import contextlib
+import functools
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+
+DEFAULT_INTERVAL = 0.005
+DEFAULT_TOP = 25
+
+_active: Optional['Profiler'] = None
+_NULL = contextlib.nullcontext()
+
+
+def phase(name: str):
+    """Context manager attributing the enclosed work to a named phase."""
+    if _active is None:
+        return _NULL
+    return _active.phase(name)
+
+
+def profiled(name: str) -> Callable:
+    """Decorator attributing every call of a function to a named phase."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return func(*args, **kwargs)
+            with _active.phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class _PhaseStats:
+    """Totals for one phase path."""
+    
+    __slots__ = ('calls', 'seconds', 'child_seconds', 'peak_memory')
+    
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.child_seconds = 0.0
+        self.peak_memory = 0
+
+
+class Profiler:
+    """Profiles the current process and attributes time and memory to phases."""
+    
+    def __init__(self, output_dir: Path, mode: str = 'auto',
+                 interval: float = DEFAULT_INTERVAL, top: int = DEFAULT_TOP):
+        """
+        Args:
+            output_dir: Directory for the reports (created if needed)
+            mode: 'sample', 'cprofile' or 'auto' (sample where supported)
+            interval: Seconds between stack samples
+            top: Number of functions and allocation sites in the summary
+        """
+        if mode == 'auto':
+            mode = 'sample' if hasattr(sys, '_current_frames') else 'cprofile'
+        if mode not in ('sample', 'cprofile'):
+            raise ValueError(f"Unknown profiler mode: {mode}")
+        self.output_dir = Path(output_dir)
+        self.mode = mode
+        self.interval = interval
+        self.top = top
+        self.phases: Dict[tuple, _PhaseStats] = defaultdict(_PhaseStats)
+        self.samples: Counter = Counter()
+        self._lock = threading.Lock()
+        # Thread id -> open phases as [name, start, peak memory, child seconds]
+        self._stacks: Dict[int, List[list]] = {}
+        self._profile = None
+        self._sampler = None
+        self._stopping = threading.Event()
+        self._start_time = 0.0
+        self._elapsed = 0.0
+        self._snapshot = None
+    
+    def start(self) -> None:
+        """Begin profiling; phase markers report here until stop()."""
+        global _active
+        import tracemalloc
+        
+        tracemalloc.start()
+        self._start_time = time.perf_counter()
+        if self.mode == 'cprofile':
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._sampler = threading.Thread(target=self._sample_loop, name='filesync-profiler',
+                                             daemon=True)
+            self._sampler.start()
+        _active = self
+    
+    def stop(self) -> List[Path]:
+        """
+        Stop profiling and write the reports.
+        
+        Returns:
+            Paths of the files written
+        """
+        global _active
+        import tracemalloc
+        
+        _active = None
+        self._elapsed = time.perf_counter() - self._start_time
+        if self._profile is not None:
+            self._profile.disable()
+        if self._sampler is not None:
+            self._stopping.set()
+            self._sampler.join()
+        self._snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        written = [self._write_phases(), self._write_summary()]
+        if self.samples:
+            written.append(self._write_stacks())
+        if self._profile is not None:
+            path = self.output_dir / 'profile.pstats'
+            self._profile.dump_stats(str(path))
+            written.append(path)
+        return written
+    
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """Record time and peak memory for a phase on the calling thread."""
+        import tracemalloc
+        
+        stack = self._stacks.setdefault(threading.get_ident(), [])
+        self._note_peak(stack)
+        frame = [name, time.perf_counter(), tracemalloc.get_traced_memory()[0], 0.0]
+        stack.append(frame)
+        try:
+            yield
+        finally:
+            self._note_peak(stack)
+            stack.pop()
+            seconds = time.perf_counter() - frame[1]
+            if stack:
+                stack[-1][3] += seconds
+                stack[-1][2] = max(stack[-1][2], frame[2])
+            key = tuple(f[0] for f in stack) + (name,)
+            with self._lock:
+                stats = self.phases[key]
+                stats.calls += 1
+                stats.seconds += seconds
+                stats.child_seconds += frame[3]
+                stats.peak_memory = max(stats.peak_memory, frame[2])
+    
+    def _note_peak(self, stack: List[list]) -> None:
+        """Credit the memory peak since the last check to every open phase."""
+        import tracemalloc
+        
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        for frame in stack:
+            frame[2] = max(frame[2], peak)
+    
+    def _sample_loop(self) -> None:
+        """Sample every other thread's stack until stopped."""
+        me = threading.get_ident()
+        while not self._stopping.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                phases = [f[0] for f in list(self._stacks.get(thread_id, ()))]
+                self.samples[';'.join(phases + names[::-1])] += 1
+    
+    def _write_phases(self) -> Path:
+        """Write phase paths weighted by self time in microseconds."""
+        path = self.output_dir / 'phases.folded'
+        with open(path, 'w') as f:
+            for key, stats in sorted(self.phases.items()):
+                self_us = int(max(0.0, stats.seconds - stats.child_seconds) * 1e6)
+                if self_us:
+                    f.write(f"{';'.join(key)} {self_us}\n")
+        return path
+    
+    def _write_stacks(self) -> Path:
+        """Write the sampled stacks in collapsed form."""
+        path = self.output_dir / 'stacks.folded'
+        with open(path, 'w') as f:
+            for stack, count in sorted(self.samples.items()):
+                f.write(f"{stack} {count}\n")
+        return path
+    
+    def _write_summary(self) -> Path:
+        """Write the human-readable report."""
+        lines = [f"Profile ({self.mode}), {self._elapsed:.3f}s wall", "", "Phases:",
+                 f"  {'phase':<40} {'calls':>8} {'total s':>10} {'self s':>10} {'peak mem':>12}"]
+        for key, stats in sorted(self.phases.items()):
+            label = '  ' * (len(key) - 1) + key[-1]
+            lines.append(f"  {label:<40} {stats.calls:>8} {stats.seconds:>10.3f} "
+                         f"{stats.seconds - stats.child_seconds:>10.3f} "
+                         f"{stats.peak_memory / 1048576:>10.1f}MB")
+        
+        lines += ["", f"Top {self.top} functions:"]
+        lines += self._top_functions()
+        
+        lines += ["", f"Top {self.top} allocation sites (live at exit):"]
+        for stat in self._snapshot.statistics('lineno')[:self.top]:
+            lines.append(f"  {stat.size / 1024:>10.1f}KB {stat.count:>8} blocks  {stat.traceback}")
+        
+        path = self.output_dir / 'summary.txt'
+        path.write_text('\n'.join(lines) + '\n')
+        return path
+    
+    def _top_functions(self) -> List[str]:
+        """Hottest functions by own time (samples) or cumulative time (cProfile)."""
+        if self._profile is not None:
+            import io
+            import pstats
+            out = io.StringIO()
+            pstats.Stats(self._profile, stream=out).sort_stats('cumulative').print_stats(self.top)
+            return ['  ' + line for line in out.getvalue().splitlines() if line.strip()]
+        
+        own = Counter()
+        total = sum(self.samples.values()) or 1
+        for stack, count in self.samples.items():
+            own[stack.rsplit(';', 1)[-1]] += count
+        return [f"  {count * 100 / total:>6.1f}%  {count:>8} samples  {name}"
+                for name, count in own.most_common(self.top)]
@@ -0,0 +1,817 @@
+"""
+Remote synchronization over a pipelined binary protocol.
+
+`filesync serve ROOT` exposes a directory over TCP or a Unix socket, and
+RemoteSyncEngine syncs a local source to it. Instead of paying network
+latency on every stat/exists call (as with NFS), the client fetches the
+whole remote manifest in one request, plans locally, and keeps up to
+remote.window requests in flight. Files that exist on both sides are
+compared block by block so only changed blocks cross the wire.
+
+Every frame is a fixed header followed by a payload:
+    
+    opcode (u8) | request id (u32) | payload length (u64)
+
+Control payloads are JSON; DATA payloads are raw bytes (PATCH data is
+prefixed with its u64 file offset). The server answers requests in the
+order it receives them with OK or ERROR, preceded by DATA frames for
+requests that return file contents. A client that cannot finish
+streaming a file sends ERROR instead of END so the server discards it.
+
+The transport is not encrypted: file contents and the API key cross the
+network in cleartext, so use a Unix socket, a trusted network or a tunnel
+(e.g. ssh -L). Without an API key the server only listens on loopback.
+"""
+
+import hashlib
+import hmac
+import ipaddress
+import json
+import os
+import queue
+import shutil
+import socket
+import socketserver
+import struct
+import threading
+import zlib
+from collections import namedtuple
+from pathlib import Path
+from typing import Callable, Optional, Tuple, Union
+from urllib.parse import urlparse
+from .copier import FileCopier, write_all
+from .file_scanner import FileScanner
+from .file_table import FileTable
+import logging
+
+
+HEADER = struct.Struct('!BIQ')
+OFFSET = struct.Struct('!Q')
+
+# Client -> server
+OP_HELLO = 1
+OP_MANIFEST = 2
+OP_PUT = 3
+OP_BLOCKS = 4
+OP_PATCH = 5
+OP_GET = 6
+OP_DELETE = 7
+OP_END = 8
+OP_BYE = 9
+# Both directions
+OP_DATA = 20
+OP_ERROR = 31
+# Server -> client
+OP_OK = 30
+
+DEFAULT_PORT = 8730
+SCHEME_TCP = 'filesync'
+SCHEME_UNIX = 'filesync+unix'
+
+# Stat-like record for remote manifest entries (what FileTable needs)
+RemoteStat = namedtuple('RemoteStat', ['st_size', 'st_mtime_ns', 'st_ino'])
+
+
+class ProtocolError(Exception):
+    """Raised when the peer sends an unexpected or malformed frame."""
+
+
+def parse_remote(destination: str) -> Optional[Tuple[int, Union[str, Tuple[str, int]]]]:
+    """
+    Parse a remote destination URL.
+    
+    Accepts filesync://HOST[:PORT] and filesync+unix:///path/to/socket.
+    
+    Returns:
+        (address family, address) or None if destination is a local path
+    """
+    parsed = urlparse(destination)
+    if parsed.scheme == SCHEME_TCP:
+        return socket.AF_INET, (parsed.hostname or '127.0.0.1', parsed.port or DEFAULT_PORT)
+    if parsed.scheme == SCHEME_UNIX:
+        return socket.AF_UNIX, parsed.path
+    return None
+
+
+def is_loopback(host: str) -> bool:
+    """Whether a listen address only accepts connections from this machine."""
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        # A host name could resolve to anything
+        return False
+
+
+def load_api_key(auth_file: Optional[Path] = None) -> Optional[str]:
+    """
+    Load the API key from ~/.backup_auth (format: API_KEY=your_key_here).
+    
+    Returns:
+        The key, or None if the file does not exist or has no key
+    """
+    auth_file = auth_file or Path.home() / '.backup_auth'
+    if not auth_file.exists():
+        return None
+    
+    with open(auth_file, 'r') as f:
+        for line in f:
+            key, _, value = line.strip().partition('=')
+            if key == 'API_KEY' and value:
+                return value
+    return None
+
+
+def send_frame(sock: socket.socket, opcode: int, request_id: int, payload=b'') -> None:
+    """Send one frame."""
+    sock.sendall(HEADER.pack(opcode, request_id, len(payload)))
+    if payload:
+        sock.sendall(payload)
+
+
+def send_json(sock: socket.socket, opcode: int, request_id: int, message: dict) -> None:
+    """Send a frame with a JSON payload."""
+    send_frame(sock, opcode, request_id, json.dumps(message, separators=(',', ':')).encode())
+
+
+def recv_exact(sock: socket.socket, size: int) -> bytearray:
+    """Read exactly size bytes or raise ProtocolError on EOF."""
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:])
+        if not n:
+            raise ProtocolError('Connection closed by peer')
+        received += n
+    return buffer
+
+
+def recv_frame(sock: socket.socket) -> Tuple[int, int, bytearray]:
+    """Read one frame, returning (opcode, request id, payload)."""
+    opcode, request_id, length = HEADER.unpack(recv_exact(sock, HEADER.size))
+    return opcode, request_id, recv_exact(sock, length) if length else bytearray()
+
+
+def block_hashes(path: Path, block_size: int) -> list:
+    """Return the MD5 of each block_size block of a file."""
+    hashes = []
+    view = memoryview(bytearray(block_size))
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(view)
+            if not n:
+                break
+            hashes.append(hashlib.md5(view[:n]).hexdigest())
+    return hashes
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+    """Serves one client connection, answering requests in order."""
+    
+    def handle(self) -> None:
+        server = self.server.sync_server
+        session = _ServerSession(server, self.request)
+        try:
+            session.run()
+        except ProtocolError as e:
+            server.logger.debug(f"Connection closed: {e}")
+        finally:
+            session.copier.flush()
+
+
+class _ServerSession:
+    """State of one client connection on the server side."""
+    
+    def __init__(self, server: 'SyncServer', sock: socket.socket):
+        self.server = server
+        self.sock = sock
+        self.copier = FileCopier(server.config)
+        self.authenticated = server.api_key is None
+        self.logger = server.logger
+    
+    def run(self) -> None:
+        handlers = {
+            OP_HELLO: self._hello,
+            OP_MANIFEST: self._manifest,
+            OP_PUT: self._put,
+            OP_BLOCKS: self._blocks,
+            OP_PATCH: self._patch,
+            OP_GET: self._get,
+            OP_DELETE: self._delete,
+        }
+        while True:
+            opcode, request_id, payload = recv_frame(self.sock)
+            if opcode == OP_BYE:
+                self.copier.flush()
+                send_json(self.sock, OP_OK, request_id, {})
+                return
+            
+            handler = handlers.get(opcode)
+            if handler is None:
+                raise ProtocolError(f"Unexpected opcode {opcode}")
+            if not self.authenticated and opcode != OP_HELLO:
+                send_json(self.sock, OP_ERROR, request_id, {'error': 'Authentication required'})
+                raise ProtocolError('Unauthenticated request')
+            
+            try:
+                reply = handler(request_id, self._decode(opcode, request_id, payload))
+                send_json(self.sock, OP_OK, request_id, reply or {})
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                # Malformed requests (bad JSON, missing fields) included
+                self.logger.error(f"Request {opcode} failed: {e!r}")
+                send_json(self.sock, OP_ERROR, request_id, {'error': str(e)})
+    
+    def _decode(self, opcode: int, request_id: int, payload: bytearray) -> dict:
+        """Parse a request's JSON message, skipping the data of a stream it can't describe."""
+        try:
+            message = json.loads(payload) if payload else {}
+            if not isinstance(message, dict):
+                raise ValueError('Request is not a JSON object')
+        except ValueError:
+            if opcode in (OP_PUT, OP_PATCH):
+                self._receive_stream(request_id, None)
+            raise
+        return message
+    
+    def _resolve(self, relative_path: str, follow: bool = False) -> Path:
+        """
+        Map a client path onto the served root, refusing escapes.
+        
+        Only the parent directory is resolved, so a symlink as the final
+        component is itself replaced or deleted rather than its target.
+        With follow, the link is resolved too (for reads), and its target
+        must be inside the root as well.
+        """
+        root = self.server.root
+        path = root / relative_path
+        if path.name in ('', '..'):
+            raise ValueError(f"Not a file path: {relative_path}")
+        parent = path.parent.resolve()
+        if parent != root and root not in parent.parents:
+            raise ValueError(f"Path outside served root: {relative_path}")
+        path = parent / path.name
+        if follow:
+            target = path.resolve()
+            if root not in target.parents:
+                raise ValueError(f"Path outside served root: {relative_path}")
+            return target
+        return path
+    
+    def _receive_stream(self, request_id: int,
+                        handle_data: Optional[Callable[[memoryview], None]]) -> None:
+        """
+        Consume DATA frames for a request up to its END frame.
+        
+        The stream is always read to the end, even after handle_data fails,
+        so the connection stays in step; the first failure is raised after.
+        """
+        failure = None
+        while True:
+            opcode, frame_id, payload = recv_frame(self.sock)
+            if frame_id != request_id or opcode not in (OP_DATA, OP_END, OP_ERROR):
+                raise ProtocolError(f"Unexpected frame {opcode} in stream {request_id}")
+            if opcode == OP_ERROR:
+                raise OSError(f"Aborted by client: {json.loads(payload).get('error')}")
+            if opcode == OP_END:
+                break
+            if handle_data is not None and failure is None:
+                try:
+                    handle_data(memoryview(payload))
+                except OSError as e:
+                    failure = e
+        if failure is not None:
+            raise failure
+    
+    def _hello(self, request_id: int, message: dict) -> dict:
+        expected = self.server.api_key
+        if expected is not None and not hmac.compare_digest(message.get('api_key') or '', expected):
+            raise PermissionError('Invalid API key')
+        self.authenticated = True
+        return {'block_size': self.server.block_size}
+    
+    def _manifest(self, request_id: int, message: dict) -> dict:
+        """Stream the filtered manifest of the served tree as compressed JSON."""
+        scanner = FileScanner(message.get('filters', {}))
+        table = scanner.scan_table(self.server.root)
+        entries = [
+            [table.relative_path(i).replace(os.sep, '/'), table.sizes[i], table.mtimes[i]]
+            for i in range(len(table))
+        ]
+        send_frame(self.sock, OP_DATA, request_id,
+                   zlib.compress(json.dumps(entries, separators=(',', ':')).encode()))
+        return {'files': len(entries)}
+    
+    def _put(self, request_id: int, message: dict) -> dict:
+        """Receive a whole file into a temp name and commit it."""
+        try:
+            destination = self._resolve(message['path'])
+            temp_path = self.copier.temp_path_for(destination)
+            f = open(temp_path, 'xb', buffering=0)
+        except (OSError, ValueError, KeyError, TypeError):
+            self._receive_stream(request_id, None)
+            raise
+        
+        try:
+            with f:
+                self._receive_stream(request_id, lambda data: write_all(f, data))
+            self._finish_file(temp_path, destination, message)
+        except BaseException:
+            self._discard(temp_path)
+            raise
+        return {}
+    
+    def _blocks(self, request_id: int, message: dict) -> dict:
+        path = self._resolve(message['path'], follow=True)
+        return {'hashes': block_hashes(path, message['block_size'])}
+    
+    def _patch(self, request_id: int, message: dict) -> dict:
+        """Rebuild a file from its current contents plus changed blocks."""
+        try:
+            destination = self._resolve(message['path'])
+            temp_path = self.copier.temp_path_for(destination)
+            # Based on what the path reads as; the commit replaces a link itself
+            shutil.copyfile(self._resolve(message['path'], follow=True), temp_path)
+        except (OSError, ValueError, KeyError, TypeError):
+            self._receive_stream(request_id, None)
+            raise
+        
+        try:
+            with open(temp_path, 'r+b', buffering=0) as f:
+                def apply(data: memoryview) -> None:
+                    f.seek(OFFSET.unpack_from(data)[0])
+                    write_all(f, data[OFFSET.size:])
+                self._receive_stream(request_id, apply)
+                f.truncate(message['size'])
+            self._finish_file(temp_path, destination, message)
+        except BaseException:
+            self._discard(temp_path)
+            raise
+        return {}
+    
+    def _get(self, request_id: int, message: dict) -> dict:
+        path = self._resolve(message['path'], follow=True)
+        block_size = self.server.block_size
+        with open(path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            while True:
+                chunk = f.read(block_size)
+                if not chunk:
+                    break
+                send_frame(self.sock, OP_DATA, request_id, chunk)
+        return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'mode': st.st_mode & 0o7777}
+    
+    def _delete(self, request_id: int, message: dict) -> dict:
+        self._resolve(message['path']).unlink()
+        return {}
+    
+    def _finish_file(self, temp_path: Path, destination: Path, message: dict) -> None:
+        """Apply the sender's mode and mtime, then commit the temp file."""
+        os.chmod(temp_path, message.get('mode', 0o644))
+        os.utime(temp_path, ns=(message['mtime_ns'], message['mtime_ns']))
+        self.copier.commit(temp_path, destination)
+    
+    def _discard(self, temp_path: Path) -> None:
+        try:
+            temp_path.unlink()
+        except OSError:
+            pass
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+if hasattr(socketserver, 'UnixStreamServer'):
+    class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+
+class SyncServer:
+    """Serves a directory to RemoteSyncEngine clients."""
+    
+    def __init__(self, root: Path, config: dict, host: str = '127.0.0.1',
+                 port: int = DEFAULT_PORT, unix_socket: Optional[str] = None,
+                 api_key: Optional[str] = None):
+        if not unix_socket and api_key is None and not is_loopback(host):
+            raise ValueError(f"Refusing to serve on {host} without an API key "
+                             f"(set one in ~/.backup_auth, or listen on loopback)")
+        self.root = Path(root).resolve()
+        self.config = config
+        self.api_key = api_key
+        self.block_size = config.get('remote', {}).get('block_size', 131072)
+        self.logger = logging.getLogger(__name__)
+        
+        if unix_socket:
+            if os.path.exists(unix_socket):
+                os.unlink(unix_socket)
+            self._server = _UnixServer(unix_socket, _RequestHandler)
+        else:
+            self._server = _TCPServer((host, port), _RequestHandler)
+        self._server.sync_server = self
+    
+    @property
+    def address(self) -> str:
+        """URL clients can use to reach this server."""
+        address = self._server.server_address
+        if isinstance(address, tuple):
+            return f"{SCHEME_TCP}://{address[0]}:{address[1]}"
+        return f"{SCHEME_UNIX}://{address}"
+    
+    def serve_forever(self) -> None:
+        self.logger.info(f"Serving {self.root} on {self.address}")
+        self._server.serve_forever()
+    
+    def start(self) -> threading.Thread:
+        """Serve from a background thread (used by tests and embedding)."""
+        thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        thread.start()
+        return thread
+    
+    def shutdown(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class _Reply:
+    """Outcome of one pipelined request."""
+    
+    def __init__(self, on_data: Optional[Callable[[bytearray], None]] = None,
+                 on_done: Optional[Callable[['_Reply'], None]] = None):
+        self.on_data = on_data
+        self.on_done = on_done
+        self.message = None
+        self.error = None
+        self.data = []
+        self.done = threading.Event()
+
+
+class RemoteClient:
+    """
+    Client side of the protocol with a bounded window of in-flight requests.
+    
+    A reader thread consumes responses as they arrive, so large replies
+    never block the sender and the connection is never deadlocked.
+    """
+    
+    def __init__(self, address: Tuple[int, Union[str, Tuple[str, int]]], window: int = 64,
+                 api_key: Optional[str] = None):
+        family, target = address
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.connect(target)
+        if family == socket.AF_INET:
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        
+        self._window = threading.Semaphore(window)
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._next_id = 0
+        self._closed = False
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+        
+        try:
+            hello = self.call(OP_HELLO, {'api_key': api_key})
+        except OSError:
+            self._closed = True
+            self.sock.close()
+            raise
+        self.block_size = hello['block_size']
+    
+    def request(self, opcode: int, message: dict, chunks=(),
+                on_data: Optional[Callable[[bytearray], None]] = None,
+                on_done: Optional[Callable[[_Reply], None]] = None) -> _Reply:
+        """
+        Send a request without waiting for its reply.
+        
+        Blocks only while the window of in-flight requests is full.
+        
+        Args:
+            opcode: Request type
+            message: JSON control message
+            chunks: Optional DATA payloads streamed after the message
+            on_data: Called with each DATA payload of the reply
+            on_done: Called (from the reader thread) once the reply completes
+        """
+        self._window.acquire()
+        reply = _Reply(on_data, on_done)
+        with self._send_lock:
+            self._next_id += 1
+            request_id = self._next_id
+            with self._pending_lock:
+                self._pending[request_id] = reply
+            send_json(self.sock, opcode, request_id, message)
+            if opcode in (OP_PUT, OP_PATCH):
+                try:
+                    for chunk in chunks:
+                        send_frame(self.sock, OP_DATA, request_id, chunk)
+                except (OSError, ValueError) as e:
+                    # Tell the server to drop the partial file; it replies ERROR
+                    send_json(self.sock, OP_ERROR, request_id, {'error': str(e)})
+                else:
+                    send_frame(self.sock, OP_END, request_id)
+        return reply
+    
+    def call(self, opcode: int, message: dict) -> dict:
+        """Send a request and wait for its reply message."""
+        reply = self.request(opcode, message)
+        reply.done.wait()
+        if reply.error:
+            raise OSError(reply.error)
+        return reply.message
+    
+    def close(self) -> None:
+        """Finish outstanding requests, let the server flush, and disconnect."""
+        try:
+            self.call(OP_BYE, {})
+        finally:
+            self._closed = True
+            self.sock.close()
+    
+    def _read_loop(self) -> None:
+        try:
+            while True:
+                opcode, request_id, payload = recv_frame(self.sock)
+                with self._pending_lock:
+                    reply = self._pending.get(request_id)
+                if reply is None:
+                    raise ProtocolError(f"Reply for unknown request {request_id}")
+                
+                if opcode == OP_DATA:
+                    if reply.on_data:
+                        reply.on_data(payload)
+                    else:
+                        reply.data.append(payload)
+                    continue
+                
+                message = json.loads(payload) if payload else {}
+                if opcode == OP_ERROR:
+                    reply.error = message.get('error', 'Remote error')
+                else:
+                    reply.message = message
+                self._complete(request_id, reply)
+        except (ProtocolError, OSError) as e:
+            # Fail whatever is still waiting so callers don't hang
+            with self._pending_lock:
+                pending = list(self._pending.items())
+            for request_id, reply in pending:
+                reply.error = 'Connection closed' if self._closed else str(e)
+                self._complete(request_id, reply)
+    
+    def _complete(self, request_id: int, reply: _Reply) -> None:
+        with self._pending_lock:
+            self._pending.pop(request_id, None)
+        try:
+            if reply.on_done:
+                reply.on_done(reply)
+        finally:
+            reply.done.set()
+            self._window.release()
+
+
+class RemoteSyncEngine:
+    """Syncs a local source to a directory served by `filesync serve`."""
+    
+    def __init__(self, source: str, destination: str, config: dict,
+                 api_key: Optional[str] = None):
+        self.source = Path(source)
+        self.destination = destination
+        self.address = parse_remote(destination)
+        if self.address is None:
+            raise ValueError(f"Not a remote destination: {destination}")
+        self.config = config
+        self.api_key = api_key if api_key is not None else load_api_key()
+        self.window = config.get('remote', {}).get('window', 64)
+        self.scanner = FileScanner(config.get('filters', {}))
+        self.copier = FileCopier(config)
+        self.logger = logging.getLogger(__name__)
+        # Completed replies handed from the reader thread to the sync loop
+        self._completed = queue.Queue()
+    
+    def sync(self) -> dict:
+        """
+        Perform synchronization between the local source and the server.
+        
+        Returns:
+            dict: Statistics about the sync operation
+        """
+        stats = {
+            'copied': 0,
+            'updated': 0,
+            'deleted': 0,
+            'skipped': 0,
+            'errors': 0,
+            'bytes_logical': 0,
+            'bytes_physical': 0
+        }
+        sync_config = self.config.get('sync', {})
+        client = RemoteClient(self.address, self.window, self.api_key)
+        self.block_size = client.block_size
+        in_flight = 0
+        
+        try:
+            source_table = self.scanner.scan_table(self.source)
+            remote_table = self._fetch_manifest(client)
+            dest_only = []
+            
+            for relative_path, i, j in source_table.merge(remote_table):
+                if i is None:
+                    dest_only.append(relative_path)
+                    continue
+                try:
+                    if j is None:
+                        self._put(client, relative_path)
+                    else:
+                        # Compare block hashes; the reply decides skip vs patch
+                        client.request(OP_BLOCKS, {
+                            'path': self._wire_path(relative_path),
+                            'block_size': self.block_size
+                        }, on_done=self._queue(('compare', relative_path, remote_table.mtimes[j])))
+                    in_flight += 1
+                except OSError as e:
+                    self.logger.error(f"Error processing {relative_path}: {e}")
+                    stats['errors'] += 1
+                in_flight -= self._process_completed(client, stats, block=False)
+            
+            for relative_path in dest_only:
+                try:
+                    if sync_config.get('mode') == 'bidirectional':
+                        self._get(client, relative_path)
+                    elif sync_config.get('delete_orphaned'):
+                        client.request(OP_DELETE, {'path': self._wire_path(relative_path)},
+                                       on_done=self._queue(('deleted', relative_path)))
+                    else:
+                        continue
+                    in_flight += 1
+                except OSError as e:
+                    self.logger.error(f"Error processing {relative_path}: {e}")
+                    stats['errors'] += 1
+            
+            while in_flight:
+                in_flight -= self._process_completed(client, stats, block=True)
+        finally:
+            client.close()
+            self.copier.flush()
+        
+        return stats
+    
+    def _fetch_manifest(self, client: RemoteClient) -> FileTable:
+        """Fetch the remote manifest in one request and load it into a FileTable."""
+        reply = client.request(OP_MANIFEST, {'filters': self.config.get('filters', {})})
+        reply.done.wait()
+        if reply.error:
+            raise OSError(reply.error)
+        
+        table = FileTable(Path(self.destination))
+        by_dir = {}
+        for path, size, mtime_ns in json.loads(zlib.decompress(reply.data[0])):
+            rel_dir, _, name = path.rpartition('/')
+            by_dir.setdefault(rel_dir.replace('/', os.sep), []).append(
+                (name, RemoteStat(size, mtime_ns, 0)))
+        for rel_dir, entries in by_dir.items():
+            table.add_directory(rel_dir, entries)
+        return table.finalize()
+    
+    def _queue(self, context) -> Callable[[_Reply], None]:
+        """Build an on_done callback that hands the reply to the sync loop."""
+        return lambda reply: self._completed.put((context, reply))
+    
+    def _process_completed(self, client: RemoteClient, stats: dict, block: bool) -> int:
+        """
+        Handle finished replies, issuing follow-up requests where needed.
+        
+        Returns:
+            Number of requests that are now fully done
+        """
+        done = 0
+        while True:
+            try:
+                context, reply = self._completed.get(block=block and done == 0)
+            except queue.Empty:
+                return done
+            done += 1
+            
+            kind, relative_path = context[0], context[1]
+            if reply.error:
+                self.logger.error(f"Remote error for {relative_path}: {reply.error}")
+                stats['errors'] += 1
+            elif kind == 'compare':
+                try:
+                    if self._patch(client, relative_path, context[2], reply.message['hashes']):
+                        # The patch is now in flight in place of the comparison
+                        done -= 1
+                    else:
+                        stats['skipped'] += 1
+                except OSError as e:
+                    self.logger.error(f"Error processing {relative_path}: {e}")
+                    stats['errors'] += 1
+            elif kind == 'fetched':
+                stats['copied'] += 1
+                self.logger.info(f"Fetched: {relative_path}")
+            else:
+                stats[kind] += 1
+                self.logger.info(f"{kind.capitalize()}: {relative_path}")
+                if kind != 'deleted':
+                    stats['bytes_logical'] += context[2]
+                    stats['bytes_physical'] += context[3]
+    
+    def _put(self, client: RemoteClient, relative_path: str) -> None:
+        """Stream a whole file to the server."""
+        path = self.source / relative_path
+        f = open(path, 'rb')
+        
+        def chunks():
+            with f:
+                while True:
+                    chunk = f.read(self.block_size)
+                    if not chunk:
+                        break
+                    yield chunk
+        
+        try:
+            st = os.fstat(f.fileno())
+            client.request(OP_PUT, self._file_message(relative_path, st), chunks(),
+                           on_done=self._queue(('copied', relative_path, st.st_size, st.st_size)))
+        except BaseException:
+            # chunks() closes the file only once it has been consumed
+            f.close()
+            raise
+    
+    def _patch(self, client: RemoteClient, relative_path: str, remote_mtime_ns: int,
+               remote_hashes: list) -> bool:
+        """
+        Send only the blocks that differ from the remote copy.
+        
+        Identical content is skipped unless timestamps are checked and the
+        source is newer, in which case an empty patch refreshes the mtime.
+        
+        Returns:
+            True if a patch was sent, False if the file was skipped
+        """
+        path = self.source / relative_path
+        st = path.stat()
+        local_hashes = block_hashes(path, self.block_size)
+        
+        if local_hashes == remote_hashes:
+            check_timestamps = self.config.get('sync', {}).get('check_timestamps', True)
+            if not (check_timestamps and st.st_mtime_ns > remote_mtime_ns):
+                return False
+        
+        changed = [
+            index for index, digest in enumerate(local_hashes)
+            if index >= len(remote_hashes) or remote_hashes[index] != digest
+        ]
+        sent = sum(min(self.block_size, st.st_size - index * self.block_size) for index in changed)
+        
+        def chunks():
+            with open(path, 'rb') as f:
+                for index in changed:
+                    offset = index * self.block_size
+                    f.seek(offset)
+                    yield OFFSET.pack(offset) + f.read(self.block_size)
+        
+        message = self._file_message(relative_path, st)
+        message['size'] = st.st_size
+        client.request(OP_PATCH, message, chunks(),
+                       on_done=self._queue(('updated', relative_path, st.st_size, sent)))
+        return True
+    
+    def _get(self, client: RemoteClient, relative_path: str) -> None:
+        """Fetch a destination-only file back into the source (bidirectional mode)."""
+        destination = self.source / relative_path
+        temp_path = self.copier.temp_path_for(destination)
+        handle = open(temp_path, 'xb')
+        
+        def finished(reply: _Reply) -> None:
+            # Runs on the reader thread: always hand the reply over, or sync() waits forever
+            try:
+                handle.close()
+                if reply.error:
+                    temp_path.unlink(missing_ok=True)
+                else:
+                    os.chmod(temp_path, reply.message['mode'])
+                    mtime_ns = reply.message['mtime_ns']
+                    os.utime(temp_path, ns=(mtime_ns, mtime_ns))
+                    self.copier.commit(temp_path, destination)
+            except OSError as e:
+                temp_path.unlink(missing_ok=True)
+                reply.error = reply.error or str(e)
+            finally:
+                self._completed.put((('fetched', relative_path), reply))
+        
+        client.request(OP_GET, {'path': self._wire_path(relative_path)},
+                       on_data=handle.write, on_done=finished)
+    
+    def _file_message(self, relative_path: str, st: os.stat_result) -> dict:
+        return {
+            'path': self._wire_path(relative_path),
+            'mtime_ns': st.st_mtime_ns,
+            'mode': st.st_mode & 0o7777
+        }
+    
+    def _wire_path(self, relative_path: str) -> str:
+        """Paths travel with '/' separators whatever the local OS."""
+        return relative_path.replace(os.sep, '/')
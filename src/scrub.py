@@ -0,0 +1,190 @@
+"""
+Incremental scrubbing of stored backups.
+
+Re-hashes the files stored in completed backups and compares them with the
+hashes recorded in each backup's manifest (hashes.json), to catch bit rot
+before a restore needs the data. A full archive is usually too large to
+check in one go, so each run works under a time and/or byte budget and
+records when every file was last verified in a state file next to the
+backups. Files never verified come first, then those verified longest ago,
+so successive nightly runs sweep the whole archive.
+"""
+
+import hashlib
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple
+from .backup_manager import BackupManager
+from .hasher import FileHasher
+from .pack import PackReader
+from .throttle import Throttle
+import logging
+
+
+SCRUB_STATE_FILE = '.scrub-state.json'
+# Save progress at least this often so an interrupted run keeps its work
+CHECKPOINT_INTERVAL = 30.0
+
+
+class Scrubber:
+    """Verifies stored backup files against their manifests."""
+    
+    def __init__(self, config: dict):
+        self.config = config
+        scrub_config = config.get('scrub', {})
+        self.max_seconds = scrub_config.get('max_seconds', 0)
+        self.max_bytes = scrub_config.get('max_bytes', 0)
+        self.workers = scrub_config.get('workers', 4)
+        self.throttle = Throttle.from_config(config, 'scrub')
+        self.hasher = FileHasher.from_config(config, throttle=self.throttle)
+        self.manager = BackupManager(config)
+        self.logger = logging.getLogger(__name__)
+    
+    def scrub(self, backup_dir: Path, max_seconds: Optional[float] = None,
+              max_bytes: Optional[int] = None) -> dict:
+        """
+        Verify as many stored files as the budget allows, oldest-checked first.
+        
+        Args:
+            backup_dir: Directory holding the full_*/incr_* backups
+            max_seconds: Stop starting new files after this long (0 = no limit)
+            max_bytes: Stop once this many bytes have been checked (0 = no limit)
+        
+        Returns:
+            dict: Counts of verified, corrupt, missing and unverifiable
+                files, bytes checked, and files left for later runs
+        """
+        max_seconds = self.max_seconds if max_seconds is None else max_seconds
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        self.throttle.apply_priority()
+        self.throttle.reset_stats()
+        
+        state_file = backup_dir / SCRUB_STATE_FILE
+        state = self._load_state(state_file)
+        queue, unverifiable = self._plan(backup_dir, state)
+        
+        stats = {'verified': 0, 'corrupt': 0, 'missing': 0,
+                 'unverifiable': unverifiable, 'bytes': 0, 'corrupt_files': []}
+        start = time.monotonic()
+        last_checkpoint = start
+        planned_bytes = 0
+        in_flight = deque()
+        submitted = 0
+        
+        def collect(future, key: str) -> None:
+            result, size = future.result()
+            state[key] = [time.time(), result == 'ok']
+            if result == 'ok':
+                stats['verified'] += 1
+                stats['bytes'] += size
+            elif result == 'missing':
+                stats['missing'] += 1
+            else:
+                stats['corrupt'] += 1
+                stats['corrupt_files'].append(key)
+                self.logger.error(f"Scrub: {key} does not match its manifest hash")
+        
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, self.workers)) as pool:
+                for key, backup_path, relative_path, entry, pack in queue:
+                    if max_seconds and time.monotonic() - start >= max_seconds:
+                        break
+                    if max_bytes and planned_bytes >= max_bytes:
+                        break
+                    planned_bytes += entry.get('size') or 0
+                    
+                    in_flight.append((pool.submit(self._verify, backup_path, relative_path,
+                                                  entry['hash'], pack), key))
+                    submitted += 1
+                    # Bounded window, so the budget checks above stay meaningful
+                    while len(in_flight) >= self.workers * 2:
+                        collect(*in_flight.popleft())
+                    
+                    if time.monotonic() - last_checkpoint >= CHECKPOINT_INTERVAL:
+                        self._save_state(state_file, state)
+                        last_checkpoint = time.monotonic()
+                
+                while in_flight:
+                    collect(*in_flight.popleft())
+        finally:
+            self._save_state(state_file, state)
+        
+        stats['remaining'] = len(queue) - submitted
+        stats.update(self.throttle.stats())
+        return stats
+    
+    def _plan(self, backup_dir: Path, state: dict) -> Tuple[List[tuple], int]:
+        """
+        List every stored file with a manifest hash, least recently verified first.
+        
+        Also drops state for files that no longer exist (e.g. pruned backups).
+        
+        Returns:
+            (queue of (key, backup path, relative path, manifest entry,
+             PackReader if the file is packed else None),
+             number of stored files without a manifest hash)
+        """
+        queue = []
+        unverifiable = 0
+        # Oldest first, so each delta chain applies onto its parent's manifest
+        manifests = {}
+        for backup_path in reversed(self.manager.list_backups(backup_dir)):
+            manifest = manifests[backup_path] = self.manager.load_manifest(backup_path, manifests)
+            pack = PackReader(backup_path)
+            for relative_path in self.manager.list_files(backup_path):
+                entry = manifest.get(relative_path)
+                if not entry or not entry.get('hash'):
+                    unverifiable += 1
+                    continue
+                key = f"{backup_path.name}/{relative_path}"
+                queue.append((key, backup_path, relative_path, entry,
+                              pack if relative_path in pack else None))
+        
+        keys = {item[0] for item in queue}
+        for key in list(state):
+            if key not in keys:
+                del state[key]
+        
+        # Never verified (0) first, then oldest; the key keeps ties in a stable order
+        queue.sort(key=lambda item: (state.get(item[0], [0])[0], item[0]))
+        return queue, unverifiable
+    
+    def _verify(self, backup_path: Path, relative_path: str, expected: str,
+                pack: Optional[PackReader]) -> Tuple[str, int]:
+        """Hash one stored file. Returns ('ok' | 'corrupt' | 'missing', size)."""
+        try:
+            if pack is not None:
+                data = pack.read(relative_path)
+                self.throttle.io(len(data))
+                actual = hashlib.new(self.hasher.algorithm, data).hexdigest()
+                size = len(data)
+            else:
+                path = backup_path / relative_path
+                size = path.stat().st_size
+                actual = self.hasher.hash_file(path)
+        except (OSError, KeyError):
+            return 'missing', 0
+        if actual is None:
+            return 'missing', 0
+        return ('ok' if actual == expected else 'corrupt'), size
+    
+    def _load_state(self, state_file: Path) -> dict:
+        """Read when each file was last verified: key -> [timestamp, ok]."""
+        try:
+            with open(state_file, 'r') as f:
+                return json.load(f).get('files', {})
+        except (OSError, ValueError, AttributeError):
+            return {}
+    
+    def _save_state(self, state_file: Path, state: dict) -> None:
+        """Write the scrub state atomically."""
+        temp_file = state_file.with_name(f"{state_file.name}.tmp")
+        with open(temp_file, 'w') as f:
+            json.dump({'version': 1, 'files': state}, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, state_file)
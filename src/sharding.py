@@ -0,0 +1,152 @@
+"""
+Multi-process sharded synchronization.
+
+A single SyncEngine is bound by the GIL on per-file work (path handling,
+filtering, stat bookkeeping, hashing small files). ShardedSyncEngine
+splits the tree into balanced shards and runs one SyncEngine per shard in
+a process pool, then merges the statistics.
+
+Shards are built from scan units: (relative directory, recursive) pairs.
+A recursive unit covers a whole subtree; a non-recursive unit covers only
+the files directly inside a directory whose subtree was too large and got
+split further. Every file of the source and destination belongs to
+exactly one unit, so each shard can decide copies, copy-backs and orphan
+deletions for its own files without seeing the others.
+"""
+
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Tuple
+from .file_scanner import FileScanner
+from .scheduling import latency_stats
+from .sync_engine import SyncEngine
+from .throttle import split_config
+import logging
+
+
+Unit = Tuple[str, bool]
+
+
+def plan_shards(scanner: FileScanner, roots: List[Path], shards: int) -> List[List[Unit]]:
+    """
+    Partition the union of the given trees into balanced shards.
+    
+    A quick pre-scan (no stat calls) counts files per directory. Subtrees
+    no larger than total/shards become single units; larger ones are split
+    into their own files plus their children. Units are then assigned
+    largest-first to the least loaded shard.
+    
+    Args:
+        scanner: Scanner whose filters define which files count
+        roots: Directory trees to cover (source and destination)
+        shards: Number of shards wanted
+    
+    Returns:
+        List of shards, each a list of (relative directory, recursive) units
+    """
+    direct: Dict[str, int] = defaultdict(int)
+    children: Dict[str, set] = defaultdict(set)
+    
+    for root in roots:
+        if not root.exists():
+            continue
+        for _, rel_dir, dirs, filenames in scanner.walk(root):
+            direct[rel_dir] += len(filenames)
+            for d in dirs:
+                children[rel_dir].add(os.path.join(rel_dir, d) if rel_dir else d)
+    
+    totals: Dict[str, int] = {}
+    
+    def subtree_total(rel_dir: str) -> int:
+        # Iterative post-order so deep trees don't hit the recursion limit
+        stack = [(rel_dir, False)]
+        while stack:
+            current, expanded = stack.pop()
+            if expanded:
+                totals[current] = direct[current] + sum(totals[c] for c in children[current])
+            else:
+                stack.append((current, True))
+                stack.extend((c, False) for c in children[current])
+        return totals[rel_dir]
+    
+    target = max(1, subtree_total('') // max(1, shards))
+    
+    units: List[Tuple[int, Unit]] = []
+    pending = ['']
+    while pending:
+        rel_dir = pending.pop()
+        if totals[rel_dir] <= target or not children[rel_dir]:
+            units.append((totals[rel_dir], (rel_dir, True)))
+        else:
+            units.append((direct[rel_dir], (rel_dir, False)))
+            pending.extend(children[rel_dir])
+    
+    loads = [0] * shards
+    plan: List[List[Unit]] = [[] for _ in range(shards)]
+    for count, unit in sorted(units, key=lambda item: item[0], reverse=True):
+        lightest = loads.index(min(loads))
+        plan[lightest].append(unit)
+        loads[lightest] += count
+    
+    return [shard for shard in plan if shard]
+
+
+def _sync_shard(source: str, destination: str, config: dict,
+                units: List[Unit]) -> Tuple[dict, List[float], List[float]]:
+    """Process pool entry point: sync one shard (stats and completion latencies)."""
+    engine = SyncEngine(source, destination, config, units=units)
+    stats = engine.sync()
+    return stats, engine.latencies, engine.priority_latencies
+
+
+class ShardedSyncEngine:
+    """Runs a SyncEngine per shard of the tree in a process pool."""
+    
+    def __init__(self, source: str, destination: str, config: dict, shards: int = 0):
+        self.source = Path(source)
+        self.destination = Path(destination)
+        self.config = config
+        self.shards = shards or os.cpu_count() or 1
+        self.scanner = FileScanner(config.get('filters', {}))
+        self.logger = logging.getLogger(__name__)
+    
+    def sync(self) -> dict:
+        """
+        Perform a sharded synchronization.
+        
+        Returns:
+            dict: Statistics summed over all shards
+        """
+        plan = plan_shards(self.scanner, [self.source, self.destination], self.shards)
+        self.logger.info(f"Syncing in {len(plan)} shards")
+        
+        # Each shard gets its share of the throttle limits
+        shard_config = split_config(self.config, 'sync', len(plan))
+        
+        stats = defaultdict(int)
+        latencies, priority_latencies = [], []
+        with ProcessPoolExecutor(max_workers=len(plan)) as pool:
+            futures = [
+                pool.submit(_sync_shard, str(self.source), str(self.destination), shard_config, units)
+                for units in plan
+            ]
+            for future in futures:
+                shard_stats, shard_latencies, shard_priority = future.result()
+                for key, value in shard_stats.items():
+                    # Percentiles don't add up; they are recomputed below
+                    if 'latency_' in key:
+                        continue
+                    if isinstance(value, list):
+                        # Paths, e.g. stalled_paths
+                        stats[key] = sorted((stats[key] or []) + value)
+                    else:
+                        stats[key] += value
+                latencies.extend(shard_latencies)
+                priority_latencies.extend(shard_priority)
+        
+        stats['shards'] = len(plan)
+        stats.update(latency_stats(latencies))
+        stats.update(latency_stats(priority_latencies, 'priority_latency'))
+        return dict(stats)
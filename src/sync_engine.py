@@ -6,128 +6,444 @@ Handles bidirectional sync between source and destination directories.
 
 import os
 import shutil
+import time
 from pathlib import Path
-from typing import List, Tuple, Optional
+from typing import Callable, Iterable, List, Tuple, Optional
+from .copier import FileCopier
+from .dedup import Candidate, DuplicateFinder, DuplicateGroups
 from .file_scanner import FileScanner
+from .file_table import FileRecord, FileTable
+from .hash_cache import HashCache
 from .hasher import FileHasher
+from .profiling import phase, profiled
+from .scheduling import (ORDERS, in_disk_order, latency_stats, priority_band, readahead,
+                         schedule)
+from .throttle import Throttle
+from .watchdog import RetryQueue, Stalled, Watchdog
 import logging
 
 
 class SyncEngine:
     """Main synchronization engine."""
     
-    def __init__(self, source: str, destination: str, config: dict):
+    def __init__(self, source: str, destination: str, config: dict,
+                 units: Optional[List[Tuple[str, bool]]] = None,
+                 throttle: Optional[Throttle] = None):
         self.source = Path(source)
         self.destination = Path(destination)
         self.config = config
-        self.scanner = FileScanner(config.get('filters', {}))
-        self.hasher = FileHasher()
+        # Restricts the sync to part of the tree (see sharding.plan_shards)
+        self.units = units
+        # Shards scan part of a tree, so they don't cache its listings
+        use_listings = config.get('sync', {}).get('listing_cache', False) and units is None
+        self.scanner = FileScanner(config.get('filters', {}), cache_listings=use_listings)
+        # Shared when several engines draw on one set of limits (see fanout)
+        self.throttle = throttle or Throttle.from_config(config, 'sync')
+        self.hasher = FileHasher.from_config(config, throttle=self.throttle)
+        self.copier = FileCopier(config, self.hasher)
+        # Deadlines for copies and hashes on mounts that may hang
+        self.watchdog = Watchdog.from_config(config)
         self.logger = logging.getLogger(__name__)
         
-    def sync(self) -> dict:
+        # Shards run concurrently on one tree and would race on its cache file
+        use_cache = config.get('sync', {}).get('hash_cache', False) and units is None
+        self.source_cache = HashCache.for_tree(self.source) if use_cache else None
+        self.dest_cache = HashCache.for_tree(self.destination) if use_cache else None
+        
+        # Identical source files become reflinks of the first copy
+        use_dedup = config.get('sync', {}).get('dedup', False)
+        self.dedup = DuplicateFinder.from_config(config, self.hasher) if use_dedup else None
+        
+        # Order of copies, and paths to make fresh before everything else
+        self.order = config.get('sync', {}).get('order', 'walk')
+        self.priority_globs = config.get('sync', {}).get('priority_globs') or []
+        if self.order not in ORDERS:
+            raise ValueError(f"Unknown sync order: {self.order}")
+        # Seconds from the start of the sync to each copy being committed
+        self.latencies: List[float] = []
+        self.priority_latencies: List[float] = []
+        self._start = 0.0
+        
+    @profiled('sync')
+    def sync(self, changed: Optional[Iterable[str]] = None) -> dict:
         """
         Perform synchronization between source and destination.
         
+        Args:
+            changed: Optional change feed for the source: the relative paths
+                changed since the last sync. With sync.listing_cache on, other
+                source directories are not read or stat'd at all
+            
         Returns:
             dict: Statistics about the sync operation
         """
-        stats = {
+        stats = self.begin()
+        self.throttle.apply_priority()
+        self.throttle.reset_stats()
+        
+        # Scan both directories into sorted tables
+        source_table = self.scanner.scan_table(self.source, self.units, changed)
+        dest_table = self.scanner.scan_table(self.destination, self.units)
+        
+        to_copy, dest_only = self.plan(source_table, dest_table, stats)
+        
+        stats = self._copy_files(to_copy, stats)
+        
+        # Handle bidirectional sync
+        if self.config.get('sync', {}).get('mode') == 'bidirectional':
+            stats = self._sync_from_destination(dest_only, stats)
+        
+        # Handle orphaned files in destination
+        if self.config.get('sync', {}).get('delete_orphaned'):
+            stats = self._delete_orphaned_files(dest_only, stats)
+        
+        return self.finish(stats)
+    
+    def begin(self) -> dict:
+        """Reset the per-run state and return zeroed statistics."""
+        self._start = time.monotonic()
+        self.latencies = []
+        self.priority_latencies = []
+        self.copier.reset_stats()
+        self.watchdog.reset_stats()
+        self.scanner.reset_stats()
+        # Temp files older than this run are left from a crash
+        self.scanner.sweep_before = time.time()
+        return {
             'copied': 0,
             'updated': 0,
             'deleted': 0,
             'skipped': 0,
             'errors': 0
         }
+    
+    @profiled('compare')
+    def plan(self, source_table: FileTable, dest_table: FileTable,
+             stats: dict) -> Tuple[List[Tuple[str, FileRecord, str]], List[str]]:
+        """
+        Compare the scanned trees and decide what to copy.
         
-        # Scan both directories
-        source_files = self.scanner.scan(self.source)
-        dest_files = self.scanner.scan(self.destination)
+        Unchanged files are counted as skipped in stats.
         
-        # Process files from source
-        for file_path in source_files:
-            try:
-                relative_path = file_path.relative_to(self.source)
-                dest_path = self.destination / relative_path
-                
-                if not dest_path.exists():
-                    # New file - copy it
-                    self._copy_file(file_path, dest_path)
-                    stats['copied'] += 1
-                    self.logger.info(f"Copied: {relative_path}")
+        Returns:
+            ((relative path, source record, 'copied' or 'updated') for each
+             file to write, relative paths present only in the destination)
+        """
+        # Files only in destination, found by the same merge pass
+        dest_only = []
+        to_copy = []
+        # In physical order, files left to a hash comparison are read after
+        # the merge, in the order their data sits on disk
+        to_hash = []
+        
+        for relative_path, i, j in source_table.merge(dest_table):
+            if i is None:
+                dest_only.append(relative_path)
+                continue
+            
+            source_info = source_table.record(i)
+            dest_info = dest_table.record(j) if j is not None else None
+            if dest_info is not None and self.order == 'physical' and \
+                    not self._metadata_changed(source_info, dest_info):
+                to_hash.append((relative_path, source_info, dest_info))
+                continue
+            self._compare(relative_path, source_info, dest_info, to_copy, stats)
+        
+        if to_hash:
+            def locate(item):
+                return self.source / item[0]
+            
+            for relative_path, source_info, dest_info in readahead(in_disk_order(to_hash, locate),
+                                                                   locate):
+                self._compare(relative_path, source_info, dest_info, to_copy, stats)
+        
+        return to_copy, dest_only
+    
+    def _compare(self, relative_path: str, source_info: FileRecord,
+                 dest_info: Optional[FileRecord], to_copy: list, stats: dict) -> None:
+        """Add a source file to to_copy if the destination lacks it or differs."""
+        file_path = self.source / relative_path
+        try:
+            dest_path = self.destination / relative_path
+            
+            if dest_info is None:
+                # New file - copy it
+                to_copy.append((relative_path, source_info, 'copied'))
+            else:
+                # File exists - check if update needed
+                if self._needs_update(file_path, dest_path, source_info, dest_info):
+                    to_copy.append((relative_path, source_info, 'updated'))
                 else:
-                    # File exists - check if update needed
-                    if self._needs_update(file_path, dest_path):
-                        self._copy_file(file_path, dest_path)
-                        stats['updated'] += 1
-                        self.logger.info(f"Updated: {relative_path}")
-                    else:
-                        stats['skipped'] += 1
+                    stats['skipped'] += 1
+        except Stalled as e:
+            # Left to the copy, which retries files that stall
+            self.logger.warning(f"Comparison stalled, copying instead: {e}")
+            to_copy.append((relative_path, source_info, 'updated'))
+        except Exception as e:
+            self.logger.error(f"Error processing {file_path}: {e}")
+            stats['errors'] += 1
+    
+    def finish(self, stats: dict) -> dict:
+        """Commit outstanding copies, save the caches and complete the statistics."""
+        # Make any batched copies durable before reporting success
+        self.copier.flush()
+        
+        if self.source_cache:
+            with phase('save_cache'):
+                self.source_cache.save()
+                self.dest_cache.save()
+            stats['hash_cache_hits'] = self.source_cache.hits + self.dest_cache.hits
+        
+        # Logical vs physical bytes moved (differ when sparse holes are skipped)
+        stats.update(self.copier.stats)
+        # Achieved vs allowed I/O rates
+        stats.update(self.throttle.stats())
+        # Files given up on by the watchdog
+        stats.update(self.watchdog.stats())
+        # Directories scanned from the listing cache, stale temp files removed
+        stats.update(self.scanner.stats())
+        # Time to freshness
+        stats.update(latency_stats(self.latencies))
+        stats.update(latency_stats(self.priority_latencies, 'priority_latency'))
+        
+        return stats
+    
+    @profiled('copy')
+    def _copy_files(self, to_copy: List[Tuple[str, FileRecord, str]], stats: dict) -> dict:
+        """
+        Copy new and changed files to the destination.
+        
+        Files are copied in the sync.order order, priority globs first;
+        batched copies are flushed as soon as the priority files are done.
+        
+        With sync.dedup, files identical to an earlier one in to_copy are
+        written as reflinks of its copy once that copy is committed.
+        """
+        to_copy = schedule(to_copy, self.order, self.priority_globs,
+                           lambda item: (item[0], item[1].size, item[1].mtime_ns),
+                           lambda item: self.source / item[0])
+        priority = set()
+        if self.priority_globs:
+            priority = {item[0] for item in to_copy
+                        if priority_band(item[0], self.priority_globs) < len(self.priority_globs)}
+        
+        groups = self._find_duplicates(to_copy) if self.dedup else None
+        deferred = []
+        # Leader relative path -> hash of what was actually copied
+        copied_hashes = {}
+        
+        ordered = enumerate(to_copy)
+        if self.order == 'physical':
+            ordered = readahead(ordered, lambda item: self.source / item[1][0])
+        # Files that stall come round again after the rest
+        work = self.watchdog.queue(ordered)
+        for item in work:
+            position, (relative_path, info, action) = item
+            file_path = self.source / relative_path
+            try:
+                if groups and relative_path in groups.leaders:
+                    deferred.append((relative_path, info, action))
+                    continue
+                file_hash = self.watchdog.call(
+                    file_path, info.size, self._copy_file, file_path, self.destination / relative_path,
+                    hashed=bool(groups) and groups.is_leader(relative_path),
+                    on_commit=self._completion(relative_path in priority))
+                if file_hash is not None:
+                    copied_hashes[relative_path] = file_hash
+                stats[action] += 1
+                self.logger.info(f"{action.capitalize()}: {relative_path}")
+            except Stalled as e:
+                self._stalled(work, item, e, stats)
             except Exception as e:
                 self.logger.error(f"Error processing {file_path}: {e}")
                 stats['errors'] += 1
+            finally:
+                # Priority files are scheduled first; don't let them wait for the batch
+                if priority and position == len(priority) - 1:
+                    self.copier.flush()
         
-        # Handle bidirectional sync
-        if self.config.get('sync', {}).get('mode') == 'bidirectional':
-            stats = self._sync_from_destination(dest_files, source_files, stats)
+        if groups is None:
+            return stats
         
-        # Handle orphaned files in destination
-        if self.config.get('sync', {}).get('delete_orphaned'):
-            stats = self._delete_orphaned_files(source_files, dest_files, stats)
+        # The leaders must be in place under their final names to be cloned
+        if deferred:
+            self.copier.flush()
+        work = self.watchdog.queue(deferred)
+        for item in work:
+            relative_path, info, action = item
+            file_path = self.source / relative_path
+            dest_path = self.destination / relative_path
+            on_commit = self._completion(relative_path in priority)
+            try:
+                if not self._link_duplicate(groups, relative_path, copied_hashes, on_commit):
+                    self.watchdog.call(file_path, info.size, self._copy_file,
+                                       file_path, dest_path, on_commit=on_commit)
+                stats[action] += 1
+                self.logger.info(f"{action.capitalize()}: {relative_path}")
+            except Stalled as e:
+                self._stalled(work, item, e, stats)
+            except Exception as e:
+                self.logger.error(f"Error processing {file_path}: {e}")
+                stats['errors'] += 1
         
+        stats['dedup_groups'] = len(set(groups.leaders.values()))
+        stats['dedup_bytes_read'] = groups.bytes_read
         return stats
     
-    def _needs_update(self, source_file: Path, dest_file: Path) -> bool:
+    def _link_duplicate(self, groups: DuplicateGroups, relative_path: str,
+                        copied_hashes: dict, on_commit: Optional[Callable[[], None]] = None) -> bool:
+        """Reflink a duplicate to its leader's copy. Returns False to copy it instead."""
+        leader = groups.leaders[relative_path]
+        # Only clone a leader whose copy matched the group's contents
+        if copied_hashes.get(leader) != groups.hashes[relative_path]:
+            return False
+        try:
+            linked = self.copier.link(self.destination / leader, self.source / relative_path,
+                                      self.destination / relative_path, on_commit=on_commit)
+        except OSError as e:
+            self.logger.warning(f"Could not reflink {relative_path} to {leader}: {e}")
+            return False
+        if linked and self.dest_cache:
+            st = (self.source / relative_path).stat()
+            self.dest_cache.put(relative_path, st.st_size, st.st_mtime_ns,
+                                groups.hashes[relative_path])
+        return linked
+    
+    def _stalled(self, work: RetryQueue, item, error: Stalled, stats: dict) -> None:
+        """Queue a stalled copy for a retry, or count it as an error once out of retries."""
+        if work.stall(item):
+            self.logger.warning(f"Stalled, will retry: {error}")
+        else:
+            self.logger.error(f"Stalled, giving up: {error}")
+            stats['errors'] += 1
+    
+    def _completion(self, priority: bool) -> Callable[[], None]:
+        """Return a commit callback recording the file's time to freshness."""
+        def committed():
+            latency = time.monotonic() - self._start
+            self.latencies.append(latency)
+            if priority:
+                self.priority_latencies.append(latency)
+        return committed
+    
+    @profiled('dedup')
+    def _find_duplicates(self, to_copy: List[Tuple[str, FileRecord, str]]) -> DuplicateGroups:
+        """Group the files to copy by content, using cached hashes where valid."""
+        candidates = []
+        for relative_path, info, _ in to_copy:
+            known = None
+            if self.source_cache:
+                known = self.source_cache.get(relative_path, info.size, info.mtime_ns)
+            candidates.append(Candidate(relative_path, self.source / relative_path,
+                                        info.size, info.mtime_ns, hash=known))
+        
+        groups = self.dedup.find(candidates)
+        if self.source_cache:
+            for candidate in candidates:
+                if candidate.relative_path in groups.computed:
+                    self.source_cache.put(candidate.relative_path, candidate.size,
+                                          candidate.mtime_ns, groups.computed[candidate.relative_path])
+        return groups
+    
+    def _needs_update(self, source_file: Path, dest_file: Path,
+                      source_info: Optional[FileRecord] = None,
+                      dest_info: Optional[FileRecord] = None) -> bool:
         """
         Determine if destination file needs to be updated.
+        
+        Uses the scanned size/mtime records when given instead of re-stating.
         """
+        if source_info is None:
+            source_info = self._stat_record(source_file)
+        if dest_info is None:
+            dest_info = self._stat_record(dest_file)
+        
+        if self._metadata_changed(source_info, dest_info):
+            return True
+        
+        # Finally check hash
+        source_hash = self._content_hash(source_file, source_info)
+        dest_hash = self._content_hash(dest_file, dest_info)
+        
+        return source_hash != dest_hash
+    
+    def _metadata_changed(self, source_info: FileRecord, dest_info: FileRecord) -> bool:
+        """Check whether size or mtime alone show that a file changed."""
         # Check file size first (faster than hashing)
-        if source_file.stat().st_size != dest_file.stat().st_size:
+        if source_info.size != dest_info.size:
             return True
         
         # Check modification time if configured
         if self.config.get('sync', {}).get('check_timestamps', True):
-            source_mtime = source_file.stat().st_mtime
-            dest_mtime = dest_file.stat().st_mtime
+            source_mtime = source_info.mtime_ns
+            dest_mtime = dest_info.mtime_ns
             
             # If destination is newer, we have a conflict!
             # For now, we just use source as source of truth
             if source_mtime > dest_mtime:
                 return True
+        return False
+    
+    def _cache_for(self, path: Path) -> Tuple[Optional[HashCache], str]:
+        """Return the hash cache covering path and path relative to its root."""
+        for root, cache in ((self.source, self.source_cache), (self.destination, self.dest_cache)):
+            try:
+                return cache, str(path.relative_to(root))
+            except ValueError:
+                continue
+        return None, str(path)
+    
+    def _content_hash(self, path: Path, info: FileRecord) -> Optional[str]:
+        """Hash a file, reusing the cached hash while its size and mtime are unchanged."""
+        cache, relative_path = self._cache_for(path) if self.source_cache else (None, '')
+        if cache is None:
+            return self.watchdog.call(path, info.size, self.hasher.hash_file, path)
         
-        # Finally check hash
-        source_hash = self.hasher.hash_file(source_file)
-        dest_hash = self.hasher.hash_file(dest_file)
-        
-        return source_hash != dest_hash
+        file_hash = cache.get(relative_path, info.size, info.mtime_ns)
+        if file_hash is None:
+            file_hash = self.watchdog.call(path, info.size, self.hasher.hash_file, path)
+            cache.put(relative_path, info.size, info.mtime_ns, file_hash)
+        return file_hash
+    
+    def _stat_record(self, path: Path) -> FileRecord:
+        """Stat a file into the record format used by FileTable."""
+        st = path.stat()
+        return FileRecord(st.st_size, st.st_mtime_ns, st.st_ino)
     
-    def _copy_file(self, source: Path, destination: Path) -> None:
-        """Copy file from source to destination."""
-        destination.parent.mkdir(parents=True, exist_ok=True)
+    def _copy_file(self, source: Path, destination: Path, hashed: bool = False,
+                   on_commit: Optional[Callable[[], None]] = None) -> Optional[str]:
+        """
+        Copy file from source to destination.
         
-        # Use configured buffer size
-        buffer_size = self.config.get('sync', {}).get('buffer_size', 65536)
+        on_commit is called once the copy is committed (see FileCopier.copy).
         
-        with open(source, 'rb') as src, open(destination, 'wb') as dst:
-            while True:
-                chunk = src.read(buffer_size)
-                if not chunk:
-                    break
-                dst.write(chunk)
+        Returns:
+            Content hash of the copied data if it was computed (with the
+            hash cache enabled, or when hashed is set), else None
+        """
+        # Written to a temp name and renamed, preserving modification time
+        if not self.source_cache and not hashed:
+            self.copier.copy(source, destination, on_commit)
+            return None
         
-        # Preserve modification time
-        shutil.copystat(source, destination)
+        # Hashed during the copy, so both sides go into the cache without a re-read
+        file_hash = self.copier.copy_hashed(source, destination, on_commit)
+        if self.source_cache:
+            st = source.stat()
+            for path in (source, destination):
+                cache, relative_path = self._cache_for(path)
+                if cache:
+                    cache.put(relative_path, st.st_size, st.st_mtime_ns, file_hash)
+        return file_hash
     
-    def _sync_from_destination(self, dest_files: List[Path], 
-                                source_files: List[Path], stats: dict) -> dict:
+    @profiled('copy_back')
+    def _sync_from_destination(self, dest_only: List[str], stats: dict) -> dict:
         """
         Sync files from destination back to source (bidirectional mode).
-        """
-        dest_relative = {f.relative_to(self.destination) for f in dest_files}
-        source_relative = {f.relative_to(self.source) for f in source_files}
-        
-        # Files only in destination
-        dest_only = dest_relative - source_relative
         
+        Args:
+            dest_only: Relative paths present only in the destination
+        """
         for relative_path in dest_only:
             dest_path = self.destination / relative_path
             source_path = self.source / relative_path
@@ -143,21 +459,22 @@ class SyncEngine:
         
         return stats
     
-    def _delete_orphaned_files(self, source_files: List[Path], 
-                                dest_files: List[Path], stats: dict) -> dict:
-        """Delete files in destination that don't exist in source."""
-        source_relative = {f.relative_to(self.source) for f in source_files}
+    @profiled('delete')
+    def _delete_orphaned_files(self, dest_only: List[str], stats: dict) -> dict:
+        """
+        Delete files in destination that don't exist in source.
         
-        for dest_file in dest_files:
-            relative_path = dest_file.relative_to(self.destination)
-            
-            if relative_path not in source_relative:
-                try:
-                    dest_file.unlink()
-                    stats['deleted'] += 1
-                    self.logger.info(f"Deleted: {relative_path}")
-                except Exception as e:
-                    self.logger.error(f"Failed to delete {relative_path}: {e}")
-                    stats['errors'] += 1
+        Args:
+            dest_only: Relative paths present only in the destination
+        """
+        for relative_path in dest_only:
+            dest_file = self.destination / relative_path
+            try:
+                dest_file.unlink()
+                stats['deleted'] += 1
+                self.logger.info(f"Deleted: {relative_path}")
+            except Exception as e:
+                self.logger.error(f"Failed to delete {relative_path}: {e}")
+                stats['errors'] += 1
         
         return stats
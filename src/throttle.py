@@ -0,0 +1,311 @@
+"""
+I/O throttling and priority for background jobs.
+
+Syncs and backups share disks with production workloads, so their reads
+and writes (both count) can be limited with token buckets on bytes/s and
+IOPS. Limits come from the 'throttle' config section, can be overridden
+per job ('sync.throttle', 'backup.throttle') and can change by time of day:
+    
+    throttle:
+      bytes_per_sec: 0          # 0 = unlimited
+      iops: 0
+      windows:
+        - start: "09:00"
+          end: "18:00"
+          days: [mon, tue, wed, thu, fri]
+          bytes_per_sec: 20971520
+          iops: 200
+      nice: 10                  # os.nice() increment for the process
+      ioprio: idle              # idle | best-effort (Linux ioprio_set)
+      fadvise: true             # drop copied/hashed files from the page cache
+
+The first window matching the current local time wins; outside every
+window the top-level limits apply. A throttle can have a parent whose
+limits apply on top of its own, so jobs running together in one process
+also share a global budget (see jobs).
+"""
+
+import copy
+import ctypes
+import ctypes.util
+import os
+import platform
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional
+from . import watchdog
+import logging
+
+
+IOPRIO_CLASSES = {'best-effort': 2, 'idle': 3}
+IOPRIO_CLASS_SHIFT = 13
+IOPRIO_WHO_PROCESS = 1
+# ioprio_set has no libc wrapper; syscall numbers per architecture
+_IOPRIO_SET_SYSCALL = {'x86_64': 251, 'i686': 289, 'i386': 289, 'aarch64': 30, 'armv7l': 314,
+                       'ppc64le': 273, 's390x': 282}
+DAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+# How often the active time window is re-evaluated
+WINDOW_CHECK_INTERVAL = 1.0
+
+_priority_applied = False
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket allowing rate units per second.
+    
+    The bucket holds at most one second of tokens. A caller may take more
+    tokens than are available; the balance goes negative and the caller
+    sleeps until it is repaid, so large requests are throttled correctly.
+    """
+    
+    def __init__(self, rate: float = 0):
+        self._lock = threading.Lock()
+        self.rate = rate
+        self._tokens = float(rate)
+        self._updated = time.monotonic()
+    
+    def set_rate(self, rate: float) -> None:
+        """Change the rate (0 = unlimited), keeping any debt already owed."""
+        with self._lock:
+            # Coming from unlimited there is no balance to carry over
+            self._tokens = min(self._tokens, rate) if self.rate else float(rate)
+            self.rate = rate
+            self._updated = time.monotonic()
+    
+    def consume(self, amount: float) -> float:
+        """
+        Take amount tokens, sleeping until the bucket allows it.
+        
+        Returns:
+            Seconds spent waiting
+        """
+        with self._lock:
+            if not self.rate:
+                return 0.0
+            now = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+def _parse_time(value: str) -> int:
+    """Convert 'HH:MM' into minutes after midnight."""
+    hours, minutes = str(value).split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+def throttle_settings(config: dict, job: Optional[str] = None) -> dict:
+    """Merge the global throttle section with a job's own overrides."""
+    settings = dict(config.get('throttle') or {})
+    if job:
+        settings.update(config.get(job, {}).get('throttle') or {})
+    return settings
+
+
+def split_config(config: dict, job: str, parts: int) -> dict:
+    """
+    Return a copy of config whose throttle limits for job are divided by parts.
+    
+    Used when a job runs in several processes, each with its own buckets,
+    so that together they stay within the configured limits.
+    """
+    settings = throttle_settings(config, job)
+    if parts <= 1 or not settings:
+        return config
+    
+    def divide(limits: dict) -> None:
+        for key in ('bytes_per_sec', 'iops'):
+            if limits.get(key):
+                limits[key] = max(1, limits[key] // parts)
+    
+    settings = copy.deepcopy(settings)
+    divide(settings)
+    for window in settings.get('windows') or []:
+        divide(window)
+    
+    config = dict(config)
+    config[job] = dict(config.get(job, {}), throttle=settings)
+    return config
+
+
+class Throttle:
+    """Applies byte and IOPS limits, process priority and cache hints to one job."""
+    
+    def __init__(self, bytes_per_sec: int = 0, iops: int = 0,
+                 windows: Optional[List[dict]] = None, nice: int = 0,
+                 ioprio: Optional[str] = None, fadvise: bool = False,
+                 parent: Optional['Throttle'] = None):
+        self.bytes_per_sec = bytes_per_sec or 0
+        self.iops = iops or 0
+        self.windows = [self._parse_window(w) for w in windows or []]
+        self.nice = nice or 0
+        self.ioprio = ioprio
+        self.fadvise = fadvise and hasattr(os, 'posix_fadvise')
+        # Budget shared with other jobs, charged for the same I/O
+        self.parent = parent
+        self.logger = logging.getLogger(__name__)
+        
+        if ioprio is not None and ioprio not in IOPRIO_CLASSES:
+            raise ValueError(f"Unknown I/O priority class: {ioprio}")
+        
+        self._bytes = TokenBucket()
+        self._ops = TokenBucket()
+        self._lock = threading.Lock()
+        self._next_window_check = 0.0
+        self.reset_stats()
+    
+    @classmethod
+    def from_config(cls, config: dict, job: Optional[str] = None) -> 'Throttle':
+        """Create a throttle from the throttle section, with job overrides applied."""
+        settings = throttle_settings(config, job)
+        return cls(
+            bytes_per_sec=settings.get('bytes_per_sec', 0),
+            iops=settings.get('iops', 0),
+            windows=settings.get('windows'),
+            nice=settings.get('nice', 0),
+            ioprio=settings.get('ioprio'),
+            fadvise=settings.get('fadvise', False)
+        )
+    
+    @property
+    def enabled(self) -> bool:
+        """Whether any byte or IOPS limit is configured."""
+        return bool(self.bytes_per_sec or self.iops or self.windows)
+    
+    def reset_stats(self) -> None:
+        """Start measuring rates afresh (called at the start of a job)."""
+        with self._lock:
+            self._started = time.monotonic()
+            self._bytes_done = 0
+            self._ops_done = 0
+            self._waited = 0.0
+    
+    def io(self, nbytes: int) -> None:
+        """
+        Account for one read or write of nbytes, sleeping if over the limit.
+        
+        Copies call this for both the read and the write, so limits cover
+        all bytes moved to or from disk by the job. This is also how a
+        watched operation shows the watchdog that it is making progress.
+        """
+        watchdog.progress(nbytes)
+        self._charge(nbytes)
+    
+    def _charge(self, nbytes: int) -> None:
+        """Take one operation of nbytes from this throttle's buckets and its parent's."""
+        waited = 0.0
+        if self.enabled:
+            now = time.monotonic()
+            if now >= self._next_window_check:
+                self._next_window_check = now + WINDOW_CHECK_INTERVAL
+                self._apply_limits(datetime.now())
+            waited = self._bytes.consume(nbytes) + self._ops.consume(1)
+        
+        with self._lock:
+            self._bytes_done += nbytes
+            self._ops_done += 1
+            self._waited += waited
+        
+        if self.parent is not None:
+            self.parent._charge(nbytes)
+    
+    def drop_cache(self, fd: int) -> None:
+        """
+        Advise the kernel that a file's cached pages won't be needed again.
+        
+        Only clean pages are dropped; pages still dirty are left to writeback.
+        """
+        if not self.fadvise:
+            return
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        except OSError:
+            pass
+    
+    def apply_priority(self) -> None:
+        """
+        Lower this process's CPU and I/O priority as configured.
+        
+        Applied once per process, since os.nice() is cumulative.
+        """
+        global _priority_applied
+        if _priority_applied or not (self.nice or self.ioprio):
+            return
+        _priority_applied = True
+        
+        if self.nice:
+            try:
+                os.nice(self.nice)
+            except OSError as e:
+                self.logger.warning(f"Could not change nice level: {e}")
+        
+        if self.ioprio and not _ioprio_set(IOPRIO_CLASSES[self.ioprio]):
+            self.logger.warning(f"I/O priority '{self.ioprio}' not supported on this system")
+    
+    def limits(self, now: datetime) -> tuple:
+        """Return the (bytes_per_sec, iops) limits in force at local time now."""
+        minute = now.hour * 60 + now.minute
+        day = DAYS[now.weekday()]
+        for window in self.windows:
+            if window['days'] and day not in window['days']:
+                continue
+            start, end = window['start'], window['end']
+            inside = start <= minute < end if start <= end else (minute >= start or minute < end)
+            if inside:
+                return window['bytes_per_sec'], window['iops']
+        return self.bytes_per_sec, self.iops
+    
+    def stats(self) -> dict:
+        """Return achieved and allowed rates since reset_stats()."""
+        with self._lock:
+            elapsed = max(time.monotonic() - self._started, 1e-9)
+            return {
+                'io_bytes': self._bytes_done,
+                'rate_bytes_per_sec': int(self._bytes_done / elapsed),
+                'rate_iops': int(self._ops_done / elapsed),
+                'limit_bytes_per_sec': int(self._bytes.rate),
+                'limit_iops': int(self._ops.rate),
+                'throttled_seconds': round(self._waited, 3)
+            }
+    
+    def _apply_limits(self, now: datetime) -> None:
+        """Point the buckets at the limits for the current time window."""
+        bytes_per_sec, iops = self.limits(now)
+        if bytes_per_sec != self._bytes.rate:
+            self._bytes.set_rate(bytes_per_sec)
+        if iops != self._ops.rate:
+            self._ops.set_rate(iops)
+    
+    @staticmethod
+    def _parse_window(window: dict) -> dict:
+        """Validate one time window from the config."""
+        days = [str(d).lower()[:3] for d in window.get('days') or []]
+        for day in days:
+            if day not in DAYS:
+                raise ValueError(f"Unknown day in throttle window: {day}")
+        return {
+            'start': _parse_time(window.get('start', '00:00')),
+            'end': _parse_time(window.get('end', '24:00')),
+            'days': days,
+            'bytes_per_sec': window.get('bytes_per_sec', 0) or 0,
+            'iops': window.get('iops', 0) or 0
+        }
+
+
+def _ioprio_set(ioprio_class: int, level: int = 7) -> bool:
+    """Set the I/O scheduling class of this process. Returns False if unsupported."""
+    number = _IOPRIO_SET_SYSCALL.get(platform.machine())
+    if number is None:
+        return False
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    except OSError:
+        return False
+    value = (ioprio_class << IOPRIO_CLASS_SHIFT) | (level if ioprio_class == 2 else 0)
+    return libc.syscall(number, IOPRIO_WHO_PROCESS, 0, value) == 0
@@ -0,0 +1,263 @@
+"""
+Deadlines for file operations on mounts that can hang.
+
+A read from a hung NFS or SMB mount blocks forever and cannot be
+interrupted, so one bad file could stall a whole run without an error.
+With a watchdog configured, each watched copy or hash runs on a worker
+thread while the calling thread checks its progress (the bytes it reads
+and writes, as reported to Throttle.io) against:
+    
+    file_timeout    seconds allowed per file
+    bytes_per_sec   slowest acceptable rate; adds size / bytes_per_sec
+                    to the time allowed per file
+    stall_timeout   seconds allowed without any progress at all
+
+An operation that misses a deadline is abandoned: the caller gets Stalled
+and moves on while the blocked worker is left behind, and a fresh worker
+takes its place. If the blocked read ever returns, the abandoned operation
+fails at its next I/O instead of writing anything more. Callers iterate
+their work through a RetryQueue, which offers stalled files again once
+everything else is done.
+"""
+
+import contextlib
+import queue
+import threading
+import time
+from typing import Callable, Iterable, Optional
+
+
+DEFAULT_RETRIES = 1
+
+_local = threading.local()
+
+
+class Stalled(Exception):
+    """Raised when a watched operation misses its deadline."""
+
+
+class _Operation:
+    """Progress of one watched operation."""
+    
+    __slots__ = ('path', 'started', 'last_progress', 'bytes', 'abandoned', 'finished', '_lock')
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.started = self.last_progress = time.monotonic()
+        self.bytes = 0
+        self.abandoned = False
+        self.finished = False
+        self._lock = threading.Lock()
+    
+    def advance(self, nbytes: int) -> None:
+        """Record progress, or stop an operation that has been given up on."""
+        if self.abandoned:
+            raise Stalled(f"Abandoned after missing its deadline: {self.path}")
+        self.bytes += nbytes
+        self.last_progress = time.monotonic()
+    
+    def finish(self) -> None:
+        with self._lock:
+            self.finished = True
+    
+    def abandon(self) -> bool:
+        """Give up on the operation. Returns False if it finished meanwhile."""
+        with self._lock:
+            if not self.finished:
+                self.abandoned = True
+            return self.abandoned
+
+
+def progress(nbytes: int) -> None:
+    """Report nbytes of I/O by the calling thread's watched operation, if any."""
+    operation = getattr(_local, 'operation', None)
+    if operation is not None:
+        operation.advance(nbytes)
+
+
+def current() -> Optional[_Operation]:
+    """The watched operation running on the calling thread, if any."""
+    return getattr(_local, 'operation', None)
+
+
+@contextlib.contextmanager
+def attached(operation: Optional[_Operation]):
+    """Count the calling thread's I/O towards operation (for helper threads)."""
+    previous = current()
+    _local.operation = operation
+    try:
+        yield
+    finally:
+        _local.operation = previous
+
+
+class _Job:
+    """A call handed to a worker thread."""
+    
+    def __init__(self, operation: _Operation, func: Callable, args: tuple, kwargs: dict):
+        self.operation = operation
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+    
+    def run(self) -> None:
+        try:
+            with attached(self.operation):
+                self.result = self.func(*self.args, **self.kwargs)
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.operation.finish()
+            self.done.set()
+
+
+class _Worker:
+    """Daemon thread running watched calls one at a time."""
+    
+    def __init__(self):
+        self.jobs = queue.SimpleQueue()
+        threading.Thread(target=self._run, name='filesync-watched', daemon=True).start()
+    
+    def _run(self) -> None:
+        while True:
+            job = self.jobs.get()
+            job.run()
+            if job.operation.abandoned:
+                # Already replaced by a fresh worker
+                return
+
+
+class RetryQueue:
+    """Iterates over items, then over the ones reported stalled, up to retries times."""
+    
+    def __init__(self, items: Iterable, retries: int):
+        self.items = items
+        self.retries = retries
+        self._stalled = []
+        self._round = 0
+    
+    def __iter__(self):
+        yield from self.items
+        while self._stalled and self._round < self.retries:
+            self._round += 1
+            batch, self._stalled = self._stalled, []
+            yield from batch
+    
+    def stall(self, item) -> bool:
+        """Queue a stalled item for another try. Returns False once it is out of tries."""
+        if self._round >= self.retries:
+            return False
+        self._stalled.append(item)
+        return True
+
+
+class Watchdog:
+    """Runs file operations under per-file, per-byte and no-progress deadlines."""
+    
+    def __init__(self, file_timeout: float = 0.0, bytes_per_sec: int = 0,
+                 stall_timeout: float = 0.0, retries: int = DEFAULT_RETRIES):
+        """
+        Args:
+            file_timeout: Seconds allowed per file (0 = no limit)
+            bytes_per_sec: Slowest acceptable rate (0 = no limit)
+            stall_timeout: Seconds allowed without progress (0 = no limit)
+            retries: Times a stalled file is tried again at the end
+        """
+        self.file_timeout = file_timeout
+        self.bytes_per_sec = bytes_per_sec
+        self.stall_timeout = stall_timeout
+        self.retries = retries
+        self._idle = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self.reset_stats()
+    
+    @classmethod
+    def from_config(cls, config: dict) -> 'Watchdog':
+        """Create a watchdog from the watchdog section of the config."""
+        settings = config.get('watchdog', {})
+        return cls(file_timeout=settings.get('file_timeout', 0),
+                   bytes_per_sec=settings.get('bytes_per_sec', 0),
+                   stall_timeout=settings.get('stall_timeout', 0),
+                   retries=settings.get('retries', DEFAULT_RETRIES))
+    
+    @property
+    def enabled(self) -> bool:
+        """Whether any deadline is configured."""
+        return bool(self.file_timeout or self.bytes_per_sec or self.stall_timeout)
+    
+    def reset_stats(self) -> None:
+        """Forget the stalls of a previous job."""
+        with self._lock:
+            self.stalled = []
+            self.seconds_lost = 0.0
+    
+    def stats(self) -> dict:
+        """
+        Stalls so far: how many, which paths, and the seconds spent on them
+        before they were given up on. Empty if the watchdog is off.
+        """
+        if not self.enabled:
+            return {}
+        with self._lock:
+            return {
+                'stalled': len(self.stalled),
+                'stalled_paths': sorted(set(self.stalled)),
+                'stall_seconds': round(self.seconds_lost, 3)
+            }
+    
+    def queue(self, items: Iterable) -> RetryQueue:
+        """Wrap work items so stalled ones can be retried after the rest."""
+        return RetryQueue(items, self.retries if self.enabled else 0)
+    
+    def deadline(self, size: int) -> Optional[float]:
+        """Seconds allowed for an operation on size bytes, or None for no limit."""
+        if not (self.file_timeout or self.bytes_per_sec):
+            return None
+        allowed = self.file_timeout
+        if self.bytes_per_sec:
+            allowed += size / self.bytes_per_sec
+        return allowed
+    
+    def call(self, path, size: int, func: Callable, *args, **kwargs):
+        """
+        Call func(*args, **kwargs) under the deadlines for a file of size bytes.
+        
+        Raises:
+            Stalled: The call missed a deadline and was abandoned
+        """
+        if not self.enabled:
+            return func(*args, **kwargs)
+        
+        operation = _Operation(str(path))
+        job = _Job(operation, func, args, kwargs)
+        try:
+            worker = self._idle.get_nowait()
+        except queue.Empty:
+            worker = _Worker()
+        worker.jobs.put(job)
+        
+        allowed = self.deadline(size)
+        while True:
+            now = time.monotonic()
+            remaining = []
+            if allowed is not None:
+                remaining.append(operation.started + allowed - now)
+            if self.stall_timeout:
+                remaining.append(operation.last_progress + self.stall_timeout - now)
+            wait = min(remaining)
+            if wait <= 0 and operation.abandon():
+                with self._lock:
+                    self.stalled.append(operation.path)
+                    self.seconds_lost += now - operation.started
+                raise Stalled(f"{operation.path}: no progress within the deadline "
+                              f"({operation.bytes} bytes in {now - operation.started:.1f}s)")
+            if job.done.wait(max(wait, 0.01)):
+                break
+        
+        self._idle.put(worker)
+        if job.error is not None:
+            raise job.error
+        return job.result
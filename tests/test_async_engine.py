@@ -0,0 +1,151 @@
+"""Tests for the asyncio sync and backup engines."""
+
+import asyncio
+import pytest
+from pathlib import Path
+import tempfile
+from src.async_engine import AsyncBackupManager, AsyncSyncEngine
+from src.config_manager import ConfigManager
+from src.journal import is_incomplete
+from src.utils import TEMP_PREFIX
+
+
+def make_config(**sync):
+    config = ConfigManager().config
+    config['sync'] = dict(config['sync'], mode='mirror', **sync)
+    config['backup'] = dict(config['backup'], type='full')
+    return config
+
+
+def make_tree(root: Path, count: int) -> None:
+    for i in range(count):
+        (root / f"file{i:02d}.txt").write_text(f"contents {i}" * 100)
+
+
+def test_events_report_each_file():
+    """Test that events() yields a plan, every copy and the final statistics."""
+    with tempfile.TemporaryDirectory() as source_dir, \
+         tempfile.TemporaryDirectory() as dest_dir:
+        make_tree(Path(source_dir), 10)
+        engine = AsyncSyncEngine(source_dir, dest_dir, make_config(), concurrency=3)
+        
+        async def collect():
+            return [event async for event in engine.events()]
+        
+        events = asyncio.run(collect())
+        
+        assert events[0].kind == 'planned' and events[0].total == 10
+        assert sorted(e.path for e in events if e.kind == 'copied') == \
+            [f"file{i:02d}.txt" for i in range(10)]
+        assert events[-1].kind == 'done'
+        assert events[-1].done == 10
+        assert events[-1].stats['copied'] == 10
+        for i in range(10):
+            assert (Path(dest_dir) / f"file{i:02d}.txt").read_text() == f"contents {i}" * 100
+
+
+def test_sync_dedup_applies():
+    """Test that sync.dedup groups duplicates as the blocking engine does."""
+    config = make_config(dedup=True)
+    config['dedup'] = {'min_size': 1}
+    with tempfile.TemporaryDirectory() as source_dir, \
+         tempfile.TemporaryDirectory() as dest_dir:
+        source = Path(source_dir)
+        for name in ('one.bin', 'two.bin', 'three.bin'):
+            (source / name).write_bytes(b'asset' * 2000)
+        (source / 'unique.bin').write_bytes(b'unique' * 2000)
+        engine = AsyncSyncEngine(source_dir, dest_dir, config, concurrency=3)
+        
+        stats = asyncio.run(engine.sync())
+        
+        assert stats['copied'] == 4
+        assert stats['errors'] == 0
+        assert stats['dedup_groups'] == 1
+        for name in ('one.bin', 'two.bin', 'three.bin'):
+            assert (Path(dest_dir) / name).read_bytes() == b'asset' * 2000
+        if engine.engine.copier.reflink_supported:
+            assert stats['deduped'] == 2
+        else:
+            assert stats['deduped'] == 0
+
+def test_cancelled_sync_leaves_complete_files():
+    """Test that cancelling a sync commits the copies in flight and stops there."""
+    with tempfile.TemporaryDirectory() as source_dir, \
+         tempfile.TemporaryDirectory() as dest_dir:
+        make_tree(Path(source_dir), 20)
+        config = make_config(durability='batch', durability_batch_size=1000)
+        engine = AsyncSyncEngine(source_dir, dest_dir, config, concurrency=1)
+        
+        async def run_until_first_copy():
+            events = []
+            async for event in engine.events():
+                events.append(event)
+                if event.kind == 'copied':
+                    engine.cancel()
+            return events
+        
+        events = asyncio.run(run_until_first_copy())
+        
+        assert events[-1].kind == 'cancelled'
+        copied = [p for p in Path(dest_dir).iterdir()]
+        assert 1 <= len(copied) < 20
+        for path in copied:
+            assert not path.name.startswith(TEMP_PREFIX)
+            assert path.read_text() == (Path(source_dir) / path.name).read_text()
+        
+        # The next run picks up the rest
+        stats = asyncio.run(AsyncSyncEngine(source_dir, dest_dir, config).sync())
+        assert stats['copied'] == 20 - len(copied)
+
+
+def test_jobs_share_a_limiter():
+    """Test that several syncs and a backup run together in one loop."""
+    with tempfile.TemporaryDirectory() as source_dir, \
+         tempfile.TemporaryDirectory() as first, \
+         tempfile.TemporaryDirectory() as second, \
+         tempfile.TemporaryDirectory() as backup_dir:
+        make_tree(Path(source_dir), 8)
+        config = make_config()
+        
+        async def run_all():
+            limiter = asyncio.Semaphore(2)
+            return await asyncio.gather(
+                AsyncSyncEngine(source_dir, first, config, limiter=limiter).sync(),
+                AsyncSyncEngine(source_dir, second, config, limiter=limiter).sync(),
+                AsyncBackupManager(config, limiter=limiter).create_backup(Path(source_dir),
+                                                                          Path(backup_dir)))
+        
+        first_stats, second_stats, metadata = asyncio.run(run_all())
+        
+        assert first_stats['copied'] == second_stats['copied'] == 8
+        assert metadata['files_copied'] == 8
+        assert len(list(Path(second).iterdir())) == 8
+
+
+def test_cancelled_backup_resumes():
+    """Test that a cancelled backup is left incomplete and the next run finishes it."""
+    with tempfile.TemporaryDirectory() as source_dir, \
+         tempfile.TemporaryDirectory() as backup_dir:
+        make_tree(Path(source_dir), 20)
+        config = make_config(durability='none')
+        manager = AsyncBackupManager(config)
+        
+        async def run_until_first_copy():
+            kinds = []
+            with pytest.raises(asyncio.CancelledError):
+                await manager.create_backup(Path(source_dir), Path(backup_dir),
+                                            on_event=lambda e: (kinds.append(e.kind),
+                                                                e.kind == 'copied' and manager.cancel()))
+            return kinds
+        
+        kinds = asyncio.run(run_until_first_copy())
+        
+        assert kinds[-1] == 'cancelled'
+        backups = list(Path(backup_dir).iterdir())
+        assert len(backups) == 1 and is_incomplete(backups[0])
+        
+        metadata = asyncio.run(AsyncBackupManager(config).create_backup(Path(source_dir),
+                                                                        Path(backup_dir)))
+        assert not is_incomplete(backups[0])
+        assert len([p for p in backups[0].iterdir() if p.name.startswith('file')]) == 20
+        assert metadata['files_copied'] == 20
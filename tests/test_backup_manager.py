@@ -0,0 +1,241 @@
+"""Tests for backup manager."""
+
+import datetime
+import hashlib
+import os
+import pytest
+from pathlib import Path
+import tempfile
+from src.backup_manager import BackupManager
+from src.config_manager import ConfigManager
+from src.journal import is_incomplete
+
+
+def make_config(backup_type='incremental'):
+    """Build a config for backups that never batches renames."""
+    config = ConfigManager().config
+    config['sync'] = dict(config['sync'], durability='none')
+    config['backup'] = dict(config['backup'], type=backup_type)
+    return config
+
+
+def interrupt_after(manager, count):
+    """Make the manager's copier fail after count successful copies."""
+    real_copy = manager.copier.copy
+    calls = []
+    
+    def copy(source, destination, on_commit=None, **kwargs):
+        if len(calls) >= count:
+            raise KeyboardInterrupt
+        calls.append(source)
+        return real_copy(source, destination, on_commit=on_commit, **kwargs)
+    
+    manager.copier.copy = copy
+    return calls
+
+
+@pytest.mark.parametrize('backup_type', ['full', 'incremental'])
+def test_interrupted_backup_resumes(backup_type):
+    """Test that a rerun resumes an interrupted backup without recopying."""
+    with tempfile.TemporaryDirectory() as source_dir, \
+         tempfile.TemporaryDirectory() as backup_dir:
+        
+        source = Path(source_dir)
+        for i in range(5):
+            (source / f'file{i}.txt').write_text(f'content {i}')
+        
+        manager = BackupManager(make_config(backup_type))
+        interrupt_after(manager, 2)
+        with pytest.raises(KeyboardInterrupt):
+            manager.create_backup(source, Path(backup_dir))
+        
+        [partial] = list(Path(backup_dir).iterdir())
+        assert is_incomplete(partial)
+        assert manager._find_last_backup(Path(backup_dir)) is None
+        
+        manager = BackupManager(make_config(backup_type))
+        calls = interrupt_after(manager, 100)
+        result = manager.create_backup(source, Path(backup_dir))
+        
+        assert len(calls) == 3
+        assert result['files_copied'] == 5
+        assert [partial] == list(Path(backup_dir).iterdir())
+        assert not is_incomplete(partial)
+        assert manager._find_last_backup(Path(backup_dir)) == partial
+        assert sorted(p.name for p in partial.glob('*.txt')) == [f'file{i}.txt' for i in range(5)]
+
+
+
+def test_resume_discards_partial_copies():
+    """Test that temp files left by an interrupted backup are never restored."""
+    with tempfile.TemporaryDirectory() as source_dir, \
+         tempfile.TemporaryDirectory() as backup_dir, \
+         tempfile.TemporaryDirectory() as restore_dir:
+        
+        source = Path(source_dir)
+        for i in range(3):
+            (source / f'file{i}.txt').write_text(f'content {i}')
+        
+        manager = BackupManager(make_config('full'))
+        interrupt_after(manager, 1)
+        with pytest.raises(KeyboardInterrupt):
+            manager.create_backup(source, Path(backup_dir))
+        
+        [partial] = list(Path(backup_dir).iterdir())
+        stale = partial / '.filesync-tmp-file2.txt.abc123'
+        stale.write_text('cont')
+        assert stale not in list(manager._loose_files(partial))
+        
+        manager = BackupManager(make_config('full'))
+        manager.create_backup(source, Path(backup_dir))
+        assert not stale.exists()
+        
+        manager.restore(partial, Path(restore_dir))
+        assert sorted(p.name for p in Path(restore_dir).iterdir()) == [f'file{i}.txt' for i in range(3)]
+
+@pytest.mark.parametrize('backup_type', ['full', 'incremental'])
+def test_small_files_are_packed_and_restored(backup_type):
+    """Test that small files go into packs and restore with their mode and mtime."""
+    with tempfile.TemporaryDirectory() as source_dir, \
+         tempfile.TemporaryDirectory() as backup_dir, \
+         tempfile.TemporaryDirectory() as restore_dir:
+        
+        source = Path(source_dir)
+        (source / 'sub').mkdir()
+        for i in range(20):
+            (source / 'sub' / f'small{i}.txt').write_text(f'small {i}')
+        (source / 'large.bin').write_bytes(b'x' * 5000)
+        os.chmod(source / 'sub' / 'small3.txt', 0o640)
+        os.utime(source / 'sub' / 'small3.txt', ns=(1_000_000_000, 1_000_000_000))
+        
+        config = make_config(backup_type)
+        config['backup'].update(pack_threshold=1024, pack_size=64)
+        manager = BackupManager(config)
+        result = manager.create_backup(source, Path(backup_dir))
+        
+        [backup] = list(Path(backup_dir).iterdir())
+        assert result['files_copied'] == 21
+        assert result['files_packed'] == 20
+        assert not (backup / 'sub').exists()
+        assert (backup / 'large.bin').exists()
+        assert len(manager.list_files(backup)) == 21
+        
+        restored = manager.restore(backup, Path(restore_dir))
+        
+        assert restored == dict(restored, restored=21, errors=0)
+        small = Path(restore_dir) / 'sub' / 'small3.txt'
+        assert small.read_text() == 'small 3'
+        assert small.stat().st_mode & 0o777 == 0o640
+        assert small.stat().st_mtime_ns == 1_000_000_000
+        assert (Path(restore_dir) / 'large.bin').read_bytes() == b'x' * 5000
+        assert not (Path(restore_dir) / '.filesync-packs').exists()
+
+
+def test_incremental_uses_manifest_as_hash_cache():
+    """Test that files unchanged since the last backup are skipped without being read."""
+    with tempfile.TemporaryDirectory() as source_dir, \
+         tempfile.TemporaryDirectory() as backup_dir:
+        
+        source = Path(source_dir)
+        (source / 'same.txt').write_text('same')
+        (source / 'changed.txt').write_text('old')
+        
+        BackupManager(make_config('full')).create_backup(source, Path(backup_dir))
+        (source / 'changed.txt').write_text('new contents')
+        
+        manager = BackupManager(make_config('incremental'))
+        manager.hasher.hash_file = lambda path: pytest.fail(f're-hashed {path}')
+        result = manager.create_backup(source, Path(backup_dir))
+        
+        assert result['files_copied'] == 1
+        assert result['files_skipped'] == 1
+        
+        hashes = manager._load_hashes(Path(backup_dir) / f"incr_{result['timestamp']}")
+        assert hashes['changed.txt']['hash'] == hashlib.md5(b'new contents').hexdigest()
+        assert hashes['same.txt']['hash'] == hashlib.md5(b'same').hexdigest()
+
+
+class Clock(datetime.datetime):
+    """Hands out one second later on every call, so backup names differ."""
+    tick = datetime.datetime(2024, 1, 1)
+    
+    @classmethod
+    def now(cls, tz=None):
+        cls.tick += datetime.timedelta(seconds=1)
+        return cls.tick
+
+
+def test_consolidate_merges_chain_into_synthetic_full(monkeypatch):
+    """Test that consolidation rebuilds the latest state from the chain alone."""
+    monkeypatch.setattr('src.backup_manager.datetime', Clock)
+    with tempfile.TemporaryDirectory() as source_dir, \
+         tempfile.TemporaryDirectory() as backup_dir, \
+         tempfile.TemporaryDirectory() as restore_dir:
+        
+        source, backups = Path(source_dir), Path(backup_dir)
+        config = make_config('full')
+        config['backup']['pack_threshold'] = 100
+        (source / 'big.bin').write_bytes(b'b' * 500)
+        (source / 'small.txt').write_text('small')
+        (source / 'gone.txt').write_text('deleted later')
+        BackupManager(config).create_backup(source, backups)
+        
+        config['backup']['type'] = 'incremental'
+        (source / 'gone.txt').unlink()
+        (source / 'small.txt').write_text('small, changed')
+        (source / 'new.bin').write_bytes(b'n' * 300)
+        BackupManager(config).create_backup(source, backups)
+        os.utime(source / 'new.bin', ns=(2_000_000_000, 2_000_000_000))
+        BackupManager(config).create_backup(source, backups)
+        chain = BackupManager(config).list_backups(backups)
+        
+        manager = BackupManager(config)
+        # Never reads the source
+        manager.hasher.hash_file = lambda path: pytest.fail(f'hashed {path}')
+        result = manager.consolidate(backups, retire=True)
+        
+        synthetic = backups / f"full_{result['timestamp']}"
+        assert result['errors'] == 0
+        assert result['files_copied'] == 3
+        assert result['files_linked'] == 2 and result['files_packed'] == 1
+        assert result['consolidated'] == [b.name for b in reversed(chain)]
+        assert manager.list_backups(backups) == [synthetic]
+        assert manager.load_manifest(synthetic).keys() == {'big.bin', 'small.txt', 'new.bin'}
+        
+        manager.restore(synthetic, Path(restore_dir))
+        for name in ('big.bin', 'small.txt', 'new.bin'):
+            assert (Path(restore_dir) / name).read_bytes() == (source / name).read_bytes()
+        assert not (Path(restore_dir) / 'gone.txt').exists()
+        
+        # The next incremental builds on the synthetic full
+        result = BackupManager(config).create_backup(source, backups)
+        assert result['base_backup'] == str(synthetic)
+        assert result['files_copied'] == 0
+
+
+def test_retention_keeps_chains_of_retained_incrementals(monkeypatch):
+    """Test that retention never removes a base that a kept incremental needs."""
+    monkeypatch.setattr('src.backup_manager.datetime', Clock)
+    with tempfile.TemporaryDirectory() as source_dir, \
+         tempfile.TemporaryDirectory() as backup_dir:
+        source, backups = Path(source_dir), Path(backup_dir)
+        config = make_config()
+        config['backup']['retain_versions'] = 2
+        (source / 'base.txt').write_text('stored only in the first backup')
+        for i in range(4):
+            (source / f'file{i}.txt').write_text(f'version {i}')
+            BackupManager(config).create_backup(source, backups)
+        
+        manager = BackupManager(config)
+        assert len(manager.list_backups(backups)) == 4
+        newest = manager.list_backups(backups)[0]
+        assert set(manager.locate_files(newest)) == {'base.txt', 'file0.txt', 'file1.txt',
+                                                     'file2.txt', 'file3.txt'}
+        
+        synthetic = backups / f"full_{manager.consolidate(backups)['timestamp']}"
+        assert manager.load_manifest(synthetic) == manager.load_manifest(newest)
+        
+        # Once two backups are kept on the synthetic full, the old chain ages out
+        BackupManager(config).create_backup(source, backups)
+        assert manager.list_backups(backups)[1] == synthetic
+        assert len(manager.list_backups(backups)) == 2
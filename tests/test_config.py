@@ -37,3 +37,52 @@ def test_validate_config():
     # Test with invalid sync mode
     manager.config['sync']['mode'] = 'invalid_mode'
     assert manager.validate() == False
+
+
+@pytest.mark.parametrize('key,value,valid', [
+    ('gzip_level', 0, True), ('gzip_level', 9, True), ('gzip_level', 10, False),
+    ('zstd_level', -5, True), ('zstd_level', 22, True), ('zstd_level', 23, False),
+])
+def test_validate_export_levels(key, value, valid):
+    """Test that compression levels are checked against each format's range."""
+    manager = ConfigManager()
+    manager.config['export'][key] = value
+    assert manager.validate() == valid
+
+
+def test_load_config_uses_cache_until_file_changes():
+    """Test that the parsed config is cached and refreshed when the file changes."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        config_path = Path(tmpdir) / 'config.yaml'
+        cache_dir = Path(tmpdir) / 'cache'
+        config_path.write_text("sync:\n  mode: mirror\n")
+        
+        manager = ConfigManager(config_path, cache_dir=cache_dir)
+        assert manager.get('sync.mode') == 'mirror'
+        assert manager.get('sync.buffer_size') == 65536
+        assert len(list(cache_dir.iterdir())) == 1
+        
+        cached = ConfigManager(config_path, cache_dir=cache_dir)
+        assert cached.config == manager.config
+        
+        config_path.write_text("sync:\n  mode: bidirectional\n  shards: 4\n")
+        changed = ConfigManager(config_path, cache_dir=cache_dir)
+        assert changed.get('sync.mode') == 'bidirectional'
+        assert changed.get('sync.shards') == 4
+        
+        # Merging a file must never leak into the defaults
+        assert ConfigManager.DEFAULT_CONFIG['sync']['mode'] == 'bidirectional'
+        assert ConfigManager.DEFAULT_CONFIG['sync']['shards'] == 1
+
+
+def test_invalid_config_is_not_cached():
+    """Test that a config failing validation is parsed again every time."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        config_path = Path(tmpdir) / 'config.yaml'
+        cache_dir = Path(tmpdir) / 'cache'
+        config_path.write_text("sync:\n  mode: sideways\n")
+        
+        manager = ConfigManager(config_path, cache_dir=cache_dir)
+        assert manager.get('sync.mode') == 'sideways'
+        assert not manager.validate()
+        assert not cache_dir.exists()
@@ -0,0 +1,199 @@
+"""Tests for the atomic file copier."""
+
+import hashlib
+import os
+import pytest
+from pathlib import Path
+import tempfile
+from src.copier import FileCopier
+from src.hasher import FileHasher
+from src.utils import is_temp_file, is_sparse
+
+
+@pytest.mark.parametrize('durability', ['none', 'batch', 'per-file'])
+def test_copy_durability_modes(durability):
+    """Test that every durability mode produces a complete copy."""
+    copier = FileCopier({'sync': {'durability': durability}})
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        source = Path(tmpdir) / 'source.txt'
+        source.write_text('payload')
+        dest = Path(tmpdir) / 'out' / 'dest.txt'
+        
+        assert copier.copy(source, dest) == len('payload')
+        copier.flush()
+        
+        assert dest.read_text() == 'payload'
+        assert dest.stat().st_mtime == source.stat().st_mtime
+        assert not any(is_temp_file(p.name) for p in dest.parent.iterdir())
+
+
+def test_batch_defers_rename_until_flush():
+    """Test that batched copies only appear under their final name once flushed."""
+    copier = FileCopier({'sync': {'durability': 'batch', 'durability_batch_size': 10}})
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        source = Path(tmpdir) / 'source.txt'
+        source.write_text('new')
+        dest = Path(tmpdir) / 'dest.txt'
+        dest.write_text('old contents')
+        
+        copier.copy(source, dest)
+        assert dest.read_text() == 'old contents'
+        
+        copier.flush()
+        assert dest.read_text() == 'new'
+
+
+def test_failed_batch_sync_discards_batch(monkeypatch):
+    """Test that a batch whose data cannot be synced is removed, not leaked."""
+    copier = FileCopier({'sync': {'durability': 'batch', 'durability_batch_size': 10}})
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        source = Path(tmpdir) / 'source.txt'
+        source.write_text('new')
+        out = Path(tmpdir) / 'out'
+        copier.copy(source, out / 'a.txt')
+        copier.copy(source, out / 'b.txt')
+        
+        def failing_sync(paths, allow_syncfs=True):
+            raise OSError(5, 'Input/output error')
+        
+        monkeypatch.setattr(copier, '_sync_data', failing_sync)
+        with pytest.raises(OSError):
+            copier.flush()
+        assert list(out.iterdir()) == []
+        
+        # Nothing is left to retry
+        monkeypatch.undo()
+        copier.flush()
+        assert list(out.iterdir()) == []
+
+
+def test_invalid_durability_mode():
+    """Test that unknown durability modes are rejected."""
+    with pytest.raises(ValueError):
+        FileCopier({'sync': {'durability': 'sometimes'}})
+
+
+def make_sparse_file(path, size, data_offset, data):
+    """Create a file that is all hole except for data at data_offset."""
+    with open(path, 'wb') as f:
+        f.truncate(size)
+        f.seek(data_offset)
+        f.write(data)
+
+
+def test_sparse_copy_skips_holes():
+    """Test that sparse files are copied extent by extent with holes preserved."""
+    copier = FileCopier({'sync': {'durability': 'none'}})
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        source = Path(tmpdir) / 'disk.img'
+        size = 64 * 1024 * 1024
+        make_sparse_file(source, size, 8 * 1024 * 1024, b'x' * 4096)
+        if not is_sparse(source.stat()):
+            pytest.skip('filesystem does not support sparse files')
+        
+        dest = Path(tmpdir) / 'copy.img'
+        written = copier.copy(source, dest)
+        
+        assert written < size
+        assert copier.stats['bytes_logical'] == size
+        assert copier.stats['bytes_physical'] == written
+        assert dest.stat().st_size == size
+        assert is_sparse(dest.stat())
+        assert dest.read_bytes() == source.read_bytes()
+        
+        hasher = FileHasher(mmap_threshold=0)
+        assert hasher.hash_file(dest) == hashlib.md5(source.read_bytes()).hexdigest()
+
+
+@pytest.mark.parametrize('range_hash', [False, True])
+def test_parallel_ranged_copy(range_hash):
+    """Test that large files copied as concurrent ranges match, with an optional tree hash."""
+    config = {'sync': {'durability': 'none', 'buffer_size': 4096,
+                       'parallel_copy_threshold': 1, 'parallel_copy_workers': 4,
+                       'parallel_copy_range': 10000, 'range_hash': range_hash}}
+    copier = FileCopier(config)
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        source = Path(tmpdir) / 'large.bin'
+        data = os.urandom(95000)
+        source.write_bytes(data)
+        dest = Path(tmpdir) / 'copy' / 'large.bin'
+        
+        assert copier.copy(source, dest) == len(data)
+        assert dest.read_bytes() == data
+        
+        tree_hash = copier.copy_tree_hashed(source, dest)
+        if range_hash:
+            assert tree_hash == copier.hasher.tree_hash(dest, 10000)
+        else:
+            assert tree_hash is None
+
+
+def test_hashed_large_copy_reads_source_once():
+    """Test that a large copy that must yield the content hash doesn't read the source twice."""
+    config = {'sync': {'durability': 'none', 'buffer_size': 4096,
+                       'parallel_copy_threshold': 1, 'parallel_copy_range': 10000}}
+    copier = FileCopier(config)
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        source = Path(tmpdir) / 'large.bin'
+        data = os.urandom(95000)
+        source.write_bytes(data)
+        
+        copier.throttle.reset_stats()
+        digest = copier.copy_hashed(source, Path(tmpdir) / 'copy.bin')
+        assert digest == hashlib.md5(data).hexdigest()
+        # One read and one write of every byte
+        assert copier.throttle.stats()['io_bytes'] == 2 * len(data)
+
+
+def test_copy_hashed_matches_hash_file():
+    """Test that the hash computed while copying equals a separate hash of the source."""
+    copier = FileCopier({'sync': {'durability': 'none'}})
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        source = Path(tmpdir) / 'source.bin'
+        source.write_bytes(os.urandom(300000))
+        
+        digest = copier.copy_hashed(source, Path(tmpdir) / 'dest.bin')
+        
+        assert digest == hashlib.md5(source.read_bytes()).hexdigest()
+        assert digest == copier.hasher.hash_file(source)
+
+
+def test_copy_hashed_sparse_file_includes_holes():
+    """Test that holes are hashed as zeros when copying sparse files."""
+    copier = FileCopier({'sync': {'durability': 'none'}})
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        source = Path(tmpdir) / 'sparse.img'
+        make_sparse_file(source, 16 * 1024 * 1024, 8 * 1024 * 1024, b'x' * 4096)
+        
+        digest = copier.copy_hashed(source, Path(tmpdir) / 'copy.img')
+        
+        assert digest == hashlib.md5(source.read_bytes()).hexdigest()
+
+
+def test_verify_rejects_corrupted_copy(monkeypatch):
+    """Test that verify mode checks copies and keeps the old destination on a mismatch."""
+    copier = FileCopier({'sync': {'durability': 'none', 'verify': True}})
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        source = Path(tmpdir) / 'source.txt'
+        source.write_text('payload')
+        dest = Path(tmpdir) / 'dest.txt'
+        
+        copier.copy(source, dest)
+        assert copier.stats['verified'] == 1
+        
+        source.write_text('new payload')
+        monkeypatch.setattr(copier.hasher, 'hash_file_uncached', lambda path: 'bad')
+        with pytest.raises(OSError, match='Verification failed'):
+            copier.copy(source, dest)
+        
+        assert dest.read_text() == 'payload'
+        assert not any(is_temp_file(p.name) for p in Path(tmpdir).iterdir())
@@ -0,0 +1,118 @@
+"""Tests for destination-side dedup."""
+
+import os
+import pytest
+from pathlib import Path
+import tempfile
+from src.backup_manager import BackupManager
+from src.config_manager import ConfigManager
+from src.dedup import Candidate, DuplicateFinder
+from src.hasher import FileHasher
+from src.sync_engine import SyncEngine
+
+
+def candidates_for(root, names):
+    """Build candidates for files below root."""
+    result = []
+    for name in names:
+        st = (root / name).stat()
+        result.append(Candidate(name, root / name, st.st_size, st.st_mtime_ns))
+    return result
+
+
+def test_finder_groups_by_size_sample_and_full_hash():
+    """Test that only files with identical contents are grouped."""
+    finder = DuplicateFinder(FileHasher(), min_size=1, sample_size=16)
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        root = Path(tmpdir)
+        body = b'a' * 16 + b'b' * 64 + b'c' * 16
+        (root / 'one').write_bytes(body)
+        (root / 'two').write_bytes(body)
+        # Same size and same ends, different middle
+        (root / 'middle').write_bytes(b'a' * 16 + b'x' * 64 + b'c' * 16)
+        # Same size, different start: never fully read
+        (root / 'start').write_bytes(b'z' * 16 + b'b' * 64 + b'c' * 16)
+        (root / 'other').write_bytes(b'short')
+        
+        groups = finder.find(candidates_for(root, ['one', 'two', 'middle', 'start', 'other']))
+        
+        assert groups.leaders == {'two': 'one'}
+        assert groups.is_leader('one')
+        assert set(groups.computed) == {'one', 'two', 'middle'}
+
+
+def test_finder_uses_known_hashes_without_reading():
+    """Test that a warm cache finds duplicates without any reads."""
+    finder = DuplicateFinder(FileHasher(), min_size=1)
+    missing = Path('/nonexistent')
+    candidates = [Candidate('a', missing / 'a', 10, 1, hash='h1'),
+                  Candidate('b', missing / 'b', 10, 2, hash='h1'),
+                  Candidate('c', missing / 'c', 10, 3, hash='h2')]
+    
+    groups = finder.find(candidates)
+    
+    assert groups.leaders == {'b': 'a'}
+    assert groups.bytes_read == 0
+    assert not groups.computed
+
+
+def test_full_backup_hardlinks_duplicates():
+    """Test that a full backup stores identical files once and restores their mtimes."""
+    config = ConfigManager().config
+    config['backup'] = dict(config['backup'], type='full', dedup=True)
+    config['dedup'] = {'min_size': 1}
+    
+    with tempfile.TemporaryDirectory() as source_dir, \
+         tempfile.TemporaryDirectory() as backup_dir, \
+         tempfile.TemporaryDirectory() as restore_dir:
+        source = Path(source_dir)
+        (source / 'lib').mkdir()
+        (source / 'a.js').write_bytes(b'vendored' * 1000)
+        (source / 'lib' / 'a.js').write_bytes(b'vendored' * 1000)
+        (source / 'b.js').write_bytes(b'different' * 1000)
+        os.utime(source / 'lib' / 'a.js', ns=(1_000_000_000, 1_000_000_000))
+        
+        result = BackupManager(config).create_backup(source, Path(backup_dir))
+        
+        assert result['files_copied'] == 3
+        assert result['files_deduped'] == 1
+        assert result['bytes_deduped'] == 8000
+        backup_path = Path(backup_dir) / f"full_{result['timestamp']}"
+        assert (backup_path / 'a.js').stat().st_ino == (backup_path / 'lib' / 'a.js').stat().st_ino
+        
+        restored = BackupManager(config).restore(backup_path, Path(restore_dir))
+        
+        assert restored['restored'] == 3
+        restore_root = Path(restore_dir)
+        assert (restore_root / 'lib' / 'a.js').read_bytes() == b'vendored' * 1000
+        assert (restore_root / 'lib' / 'a.js').stat().st_mtime_ns == 1_000_000_000
+        assert (restore_root / 'a.js').stat().st_mtime_ns == (source / 'a.js').stat().st_mtime_ns
+
+
+def test_sync_dedup_reflinks_or_copies():
+    """Test that duplicates reach the destination as reflinks where supported."""
+    config = ConfigManager().config
+    config['sync'] = dict(config['sync'], dedup=True, mode='mirror')
+    config['dedup'] = {'min_size': 1}
+    
+    with tempfile.TemporaryDirectory() as source_dir, \
+         tempfile.TemporaryDirectory() as dest_dir:
+        source = Path(source_dir)
+        for name in ('one.bin', 'two.bin', 'three.bin'):
+            (source / name).write_bytes(b'asset' * 2000)
+        (source / 'unique.bin').write_bytes(b'unique' * 2000)
+        
+        engine = SyncEngine(source_dir, dest_dir, config)
+        stats = engine.sync()
+        
+        assert stats['copied'] == 4
+        assert stats['errors'] == 0
+        assert stats['dedup_groups'] == 1
+        for name in ('one.bin', 'two.bin', 'three.bin'):
+            assert (Path(dest_dir) / name).read_bytes() == b'asset' * 2000
+        if engine.copier.reflink_supported:
+            assert stats['deduped'] == 2
+            assert stats['bytes_deduped'] == 20000
+        else:
+            assert stats['deduped'] == 0
@@ -0,0 +1,106 @@
+"""Tests for streaming tar export."""
+
+import io
+import tarfile
+import zlib
+import pytest
+from pathlib import Path
+import tempfile
+from click.testing import CliRunner
+from src.backup_manager import BackupManager
+from src.cli import cli
+from src.config_manager import ConfigManager
+from src.export import BackupExporter, BlockCompressor
+
+
+def make_config(backup_type='full'):
+    config = ConfigManager().config
+    config['sync'] = dict(config['sync'], durability='none')
+    config['backup'] = dict(config['backup'], type=backup_type, pack_threshold=100)
+    config['export'] = dict(config['export'], block_size=1024, workers=3)
+    return config
+
+
+def make_chain(source: Path, backups: Path) -> Path:
+    """Back up a full and then an incremental, returning the incremental."""
+    (source / 'sub').mkdir()
+    (source / 'sub' / 'big.bin').write_bytes(bytes(range(256)) * 20)
+    (source / 'small.txt').write_text('small')
+    (source / 'gone.txt').write_text('deleted later')
+    BackupManager(make_config('full')).create_backup(source, backups)
+    
+    (source / 'gone.txt').unlink()
+    (source / 'new.txt').write_text('new file')
+    result = BackupManager(make_config('incremental')).create_backup(source, backups)
+    return backups / f"incr_{result['timestamp']}"
+
+
+def gzip_members(data: bytes) -> int:
+    """Count the gzip members in a multi-member stream."""
+    members = 0
+    while data:
+        decompressor = zlib.decompressobj(wbits=31)
+        decompressor.decompress(data)
+        data = decompressor.unused_data
+        members += 1
+    return members
+
+
+def test_block_compressor_writes_members_in_order():
+    """Test that blocks compressed in parallel decompress to the original stream."""
+    out = io.BytesIO()
+    payload = b''.join(b'%06d' % i for i in range(10000))
+    compressor = BlockCompressor(out, zlib.compress, workers=4, block_size=4096)
+    for i in range(0, len(payload), 1000):
+        compressor.write(payload[i:i + 1000])
+    compressor.close()
+    
+    data = out.getvalue()
+    restored = b''
+    while data:
+        decompressor = zlib.decompressobj()
+        restored += decompressor.decompress(data)
+        data = decompressor.unused_data
+    assert restored == payload
+
+
+def test_export_resolves_incremental_chain():
+    """Test that an incremental exports as the complete tree, compressed in several members."""
+    with tempfile.TemporaryDirectory() as source_dir, \
+         tempfile.TemporaryDirectory() as backup_dir:
+        source = Path(source_dir)
+        incremental = make_chain(source, Path(backup_dir))
+        
+        out = io.BytesIO()
+        result = BackupExporter(make_config()).export(incremental, out, 'tar.gz')
+        
+        assert result['files'] == 3 and result['missing'] == 0
+        assert gzip_members(out.getvalue()) > 1
+        with tarfile.open(fileobj=io.BytesIO(out.getvalue()), mode='r:gz') as tar:
+            assert tar.getnames() == ['new.txt', 'small.txt', 'sub/big.bin']
+            for name in tar.getnames():
+                assert tar.extractfile(name).read() == (source / name).read_bytes()
+            assert tar.getmember('small.txt').mtime == int((source / 'small.txt').stat().st_mtime)
+
+
+def test_cli_export_to_stdout_is_a_clean_stream(monkeypatch):
+    """Test that export -o - writes nothing but the archive to stdout."""
+    runner = CliRunner()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # Keeps the default sync.log out of the working tree
+        monkeypatch.chdir(tmpdir)
+        root = Path(tmpdir)
+        (root / 'src').mkdir()
+        (root / 'backups').mkdir()
+        incremental = make_chain(root / 'src', root / 'backups')
+        
+        result = runner.invoke(cli, ['export', str(incremental), '-o', '-'])
+        
+        assert result.exit_code == 0, result.stderr
+        with tarfile.open(fileobj=io.BytesIO(result.stdout_bytes), mode='r:') as tar:
+            assert tar.getnames() == ['new.txt', 'small.txt', 'sub/big.bin']
+        
+        result = runner.invoke(cli, ['export', str(incremental), '-o', str(root / 'out.tar.gz')])
+        assert result.exit_code == 0, result.stderr
+        with tarfile.open(root / 'out.tar.gz', mode='r:gz') as tar:
+            assert len(tar.getnames()) == 3
@@ -0,0 +1,99 @@
+"""Tests for single-read fan-out to several destinations."""
+
+import os
+import pytest
+from pathlib import Path
+import tempfile
+from src.config_manager import ConfigManager
+from src.fanout import FanoutSyncEngine
+from src.hasher import FileHasher
+
+
+def make_config(**sync):
+    config = ConfigManager().config
+    config['sync'] = dict(config['sync'], mode='mirror', **sync)
+    # Small blocks so files take many reads
+    config['fanout'] = {'workers': 2, 'buffers': 2, 'block_size': 4096}
+    return config
+
+
+def test_fanout_reads_each_file_once():
+    """Test that each destination gets what it needs from one read of the source."""
+    with tempfile.TemporaryDirectory() as source_dir, \
+         tempfile.TemporaryDirectory() as first, \
+         tempfile.TemporaryDirectory() as second:
+        source = Path(source_dir)
+        (source / 'sub').mkdir()
+        (source / 'a.bin').write_bytes(os.urandom(300000))
+        (source / 'sub' / 'b.txt').write_text('bbb')
+        # Already up to date in the second destination
+        (Path(second) / 'sub').mkdir()
+        (Path(second) / 'sub' / 'b.txt').write_text('bbb')
+        os.utime(Path(second) / 'sub' / 'b.txt', ns=(0, (source / 'sub' / 'b.txt').stat().st_mtime_ns))
+        
+        engine = FanoutSyncEngine(source_dir, [first, second], make_config())
+        stats = engine.sync()
+        
+        assert stats['bytes_read'] == 300003
+        assert stats['copied'] == 3
+        assert stats['skipped'] == 1
+        assert stats['destinations'][first]['copied'] == 2
+        assert stats['destinations'][second]['copied'] == 1
+        assert stats['destinations'][second]['skipped'] == 1
+        hasher = FileHasher()
+        for dest in (first, second):
+            assert hasher.hash_file(Path(dest) / 'a.bin') == hasher.hash_file(source / 'a.bin')
+            assert (Path(dest) / 'a.bin').stat().st_mtime_ns == (source / 'a.bin').stat().st_mtime_ns
+
+
+def test_fanout_failure_stays_with_its_destination():
+    """Test that one failing destination doesn't stop the others."""
+    with tempfile.TemporaryDirectory() as source_dir, \
+         tempfile.TemporaryDirectory() as good, \
+         tempfile.TemporaryDirectory() as bad:
+        (Path(source_dir) / 'file.txt').write_text('content')
+        
+        engine = FanoutSyncEngine(source_dir, [good, bad], make_config())
+        failing = engine.engines[1].copier
+        
+        def no_temp(destination):
+            raise OSError(28, 'No space left on device')
+        
+        failing.temp_path_for = no_temp
+        stats = engine.sync()
+        
+        assert stats['destinations'][good]['copied'] == 1
+        assert stats['destinations'][good]['errors'] == 0
+        assert stats['destinations'][bad]['copied'] == 0
+        assert stats['destinations'][bad]['errors'] == 1
+        assert (Path(good) / 'file.txt').read_text() == 'content'
+        assert not (Path(bad) / 'file.txt').exists()
+
+
+def test_fanout_commit_failure_stays_with_its_destination():
+    """Test that a destination whose rename fails is dropped without its temp file."""
+    with tempfile.TemporaryDirectory() as source_dir, \
+         tempfile.TemporaryDirectory() as good, \
+         tempfile.TemporaryDirectory() as bad:
+        (Path(source_dir) / 'file.txt').write_text('content')
+        (Path(source_dir) / 'other.txt').write_text('other')
+        
+        engine = FanoutSyncEngine(source_dir, [good, bad], make_config(durability='none'))
+        
+        def no_rename(temp_path, destination, on_commit=None):
+            raise OSError(13, 'Permission denied')
+        
+        engine.engines[1].copier.commit = no_rename
+        stats = engine.sync()
+        
+        assert stats['destinations'][good]['copied'] == 2
+        assert stats['destinations'][bad]['copied'] == 0
+        assert stats['destinations'][bad]['errors'] == 2
+        assert (Path(good) / 'file.txt').read_text() == 'content'
+        assert os.listdir(bad) == []
+
+
+def test_fanout_rejects_repeated_destination():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with pytest.raises(ValueError):
+            FanoutSyncEngine(tmpdir, ['/tmp/x', '/tmp/x'], make_config())
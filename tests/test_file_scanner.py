@@ -4,6 +4,7 @@ import pytest
 from pathlib import Path
 import tempfile
 import os
+import time
 from src.file_scanner import FileScanner
 
 
@@ -56,3 +57,58 @@ def test_count_files():
         
         count = scanner.count_files(Path(tmpdir))
         assert count == 5
+
+
+def age_tree(root: Path, seconds: int = 60) -> None:
+    """Backdate every directory so its listing can be cached."""
+    past = time.time() - seconds
+    for path in [root, *(p for p in root.rglob('*') if p.is_dir())]:
+        os.utime(path, (past, past))
+
+
+def test_listing_cache_reads_only_changed_directories():
+    """Test that a rescan lists only directories whose mtime moved."""
+    with tempfile.TemporaryDirectory() as tmpdir, \
+         tempfile.TemporaryDirectory() as cache_dir:
+        root = Path(tmpdir)
+        for name in ('a', 'b', 'b/c'):
+            (root / name).mkdir()
+            (root / name / 'file.txt').write_text(name)
+        age_tree(root)
+        scanner = FileScanner({}, cache_listings=True, cache_dir=Path(cache_dir))
+        
+        first = scanner.scan_table(root)
+        assert scanner.stats() == {'listings_reused': 0, 'listings_read': 4}
+        
+        scanner.reset_stats()
+        (root / 'b' / 'new.txt').write_text('new')
+        os.utime(root / 'b', (time.time() - 30, time.time() - 30))
+        (root / 'a' / 'file.txt').write_text('edited')
+        second = scanner.scan_table(root)
+        
+        # Only b was listed again, but the edit in a was still seen
+        assert scanner.stats() == {'listings_reused': 3, 'listings_read': 1}
+        assert len(second) == len(first) + 1
+        sizes = {second.relative_path(i): second.sizes[i] for i in range(len(second))}
+        assert sizes['b/new.txt'] == 3
+        assert sizes['a/file.txt'] == len('edited')
+
+
+def test_change_feed_skips_unchanged_directories():
+    """Test that with a change feed, unreported directories come from the cache."""
+    with tempfile.TemporaryDirectory() as tmpdir, \
+         tempfile.TemporaryDirectory() as cache_dir:
+        root = Path(tmpdir)
+        for name in ('a', 'b'):
+            (root / name).mkdir()
+            (root / name / 'file.txt').write_text(name)
+        age_tree(root)
+        scanner = FileScanner({}, cache_listings=True, cache_dir=Path(cache_dir))
+        scanner.scan_table(root)
+        
+        # Neither edit moves a directory mtime; only the reported one is seen
+        (root / 'a' / 'file.txt').write_text('edited a')
+        (root / 'b' / 'file.txt').write_text('edited b')
+        table = scanner.scan_table(root, changed=['b/file.txt'])
+        sizes = {table.relative_path(i): table.sizes[i] for i in range(len(table))}
+        assert sizes == {'a/file.txt': 1, 'b/file.txt': len('edited b')}
@@ -0,0 +1,60 @@
+"""Tests for the compact file table."""
+
+import pytest
+from pathlib import Path
+import tempfile
+import os
+from src.file_scanner import FileScanner
+from src.file_table import FileTable
+
+
+def make_tree(root, paths):
+    """Create files at the given relative paths."""
+    for relative in paths:
+        path = Path(root) / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(relative)
+
+
+def test_scan_table_matches_scan():
+    """Test that scan_table finds the same files as scan, in sorted order."""
+    scanner = FileScanner({'exclude': ['*.tmp'], 'include': ['*']})
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        make_tree(tmpdir, ['b.txt', 'a.txt', 'x.tmp', 'sub/z.txt', 'sub/deep/y.txt', 'sub-dir/w.txt'])
+        
+        table = scanner.scan_table(Path(tmpdir))
+        assert sorted(table.paths()) == sorted(scanner.scan(Path(tmpdir)))
+        
+        keys = [table.key(i) for i in range(len(table))]
+        assert keys == sorted(keys)
+        assert table.sizes[keys.index(('', 'a.txt'))] == len('a.txt')
+
+
+def test_merge_tables():
+    """Test the sorted merge of two tables."""
+    scanner = FileScanner({'exclude': [], 'include': ['*']})
+    
+    with tempfile.TemporaryDirectory() as left_dir, \
+         tempfile.TemporaryDirectory() as right_dir:
+        make_tree(left_dir, ['common.txt', 'left.txt', 'd/both.txt', 'd/only_left.txt'])
+        make_tree(right_dir, ['common.txt', 'right.txt', 'd/both.txt', 'e/only_right.txt'])
+        
+        left = scanner.scan_table(Path(left_dir))
+        right = scanner.scan_table(Path(right_dir))
+        
+        merged = {path: (i is not None, j is not None) for path, i, j in left.merge(right)}
+        assert merged == {
+            'common.txt': (True, True),
+            'left.txt': (True, False),
+            'right.txt': (False, True),
+            os.path.join('d', 'both.txt'): (True, True),
+            os.path.join('d', 'only_left.txt'): (True, False),
+            os.path.join('e', 'only_right.txt'): (False, True),
+        }
+
+
+def test_merge_empty_table():
+    """Test merging against an empty table."""
+    empty = FileTable(Path('.'))
+    assert list(empty.merge(empty)) == []
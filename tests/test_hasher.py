@@ -1,9 +1,10 @@
 """Tests for file hasher module."""
 
+import hashlib
 import pytest
 from pathlib import Path
 import tempfile
-from src.hasher import FileHasher
+from src.hasher import FileHasher, MIN_BLOCK_SIZE, MAX_BLOCK_SIZE
 
 
 def test_hash_file():
@@ -52,3 +53,31 @@ def test_compare_hashes():
     assert hasher.compare_hashes('abc123', 'abc123') == True
     assert hasher.compare_hashes('abc123', 'def456') == False
     assert hasher.compare_hashes(None, 'abc123') == False
+
+
+def test_mmap_and_readinto_hashes_match():
+    """Test that the mmap and readinto read paths agree."""
+    readinto = FileHasher(buffer_size=4096, mmap_threshold=0)
+    mapped = FileHasher(buffer_size=4096, mmap_threshold=1)
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / 'data.bin'
+        data = bytes(range(256)) * 1000
+        path.write_bytes(data)
+        
+        expected = hashlib.md5(data).hexdigest()
+        assert readinto.hash_file(path) == expected
+        assert mapped.hash_file(path) == expected
+        assert readinto.hash_file(path, buffer_size=1000) == expected
+
+
+def test_auto_block_size():
+    """Test that the auto-tuned block size is sane and cached."""
+    hasher = FileHasher(buffer_size='auto')
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        block_size = hasher.block_size_for(Path(tmpdir))
+        assert MIN_BLOCK_SIZE <= block_size <= MAX_BLOCK_SIZE
+        assert hasher.block_size_for(Path(tmpdir)) == block_size
+    
+    assert FileHasher(buffer_size=8192).block_size_for(Path('.')) == 8192
@@ -0,0 +1,128 @@
+"""Tests for the multi-job scheduler."""
+
+import pytest
+import threading
+import time
+from pathlib import Path
+import tempfile
+from src.config_manager import ConfigManager
+from src.jobs import JobScheduler
+from src.throttle import Throttle
+
+
+def make_config(jobs, **scheduler):
+    config = ConfigManager().config
+    config['sync'] = dict(config['sync'], mode='mirror', durability='none')
+    config['scheduler'] = dict(config['scheduler'], **scheduler)
+    config['jobs'] = jobs
+    return config
+
+
+def test_jobs_run_and_report_throughput():
+    """Test that sync and backup jobs all run and report per-job and total I/O."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        root = Path(tmpdir)
+        (root / 'src').mkdir()
+        for i in range(5):
+            (root / 'src' / f'file{i}.txt').write_text(f'contents {i}' * 100)
+        config = make_config([
+            {'name': 'mirror', 'source': str(root / 'src'), 'destination': str(root / 'mirror')},
+            {'name': 'both', 'source': str(root / 'src'),
+             'destination': [str(root / 'a'), str(root / 'b')], 'heavy': False},
+            {'name': 'nightly', 'type': 'backup', 'source': str(root / 'src'),
+             'destination': str(root / 'backups'), 'config': {'backup': {'type': 'full'}}},
+            {'name': 'broken', 'source': str(root / 'src'), 'destination': str(root / 'x'),
+             'config': {'sync': {'order': 'bogus'}}},
+        ], workers=3)
+        
+        summary = JobScheduler(config).run()
+        
+        results = {result['name']: result for result in summary['jobs']}
+        assert [r['name'] for r in summary['jobs']] == ['mirror', 'both', 'nightly', 'broken']
+        assert results['mirror']['stats']['copied'] == 5
+        assert results['both']['stats']['copied'] == 10
+        assert results['nightly']['stats']['files_copied'] == 5
+        assert len(list((root / 'a').iterdir())) == 5
+        # Every job's I/O is charged to the shared budget too
+        assert summary['io_bytes'] == sum(r['io_bytes'] for r in summary['jobs'])
+        assert results['mirror']['io_bytes'] > 0
+        # The overrides applied to that job alone
+        assert config['backup']['type'] == 'incremental'
+        # A failing job is reported without stopping the others
+        assert summary['failed'] == 1
+        assert results['broken']['status'] == 'failed'
+        assert 'bogus' in results['broken']['error']
+
+
+def test_priority_order_and_device_exclusion():
+    """Test that jobs start by priority and heavy jobs on one device never overlap."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        root = str(tmpdir)
+        jobs = [{'name': name, 'source': root, 'destination': root, 'priority': priority,
+                 'heavy': heavy}
+                for name, priority, heavy in [('low', 0, True), ('high', 5, True),
+                                              ('light', 1, False)]]
+        scheduler = JobScheduler(make_config(jobs, workers=2))
+        
+        lock = threading.Lock()
+        started, active, overlaps = [], set(), []
+        
+        def execute(job, config):
+            with lock:
+                started.append(job.name)
+                overlaps.extend((job.name, other) for other in active)
+                active.add(job.name)
+            time.sleep(0.1)
+            with lock:
+                active.discard(job.name)
+            return {'errors': 0}
+        
+        scheduler._execute = execute
+        summary = scheduler.run()
+        
+        # 'low' had to wait for 'high' (same device); 'light' ran alongside
+        assert started == ['high', 'light', 'low']
+        assert ('light', 'high') in overlaps
+        assert not {('low', 'high'), ('high', 'low')} & set(overlaps)
+        assert summary['failed'] == 0
+
+
+def test_parent_throttle_limits_all_children():
+    """Test that I/O through unlimited throttles is held to their parent's budget."""
+    budget = Throttle(bytes_per_sec=64 * 1024)
+    children = [Throttle(parent=budget) for _ in range(2)]
+    
+    start = time.monotonic()
+    for _ in range(3):
+        for child in children:
+            child.io(16 * 1024)
+    elapsed = time.monotonic() - start
+    
+    # 96K against 64K/s with a one second burst
+    assert elapsed > 0.3
+    assert budget.stats()['io_bytes'] == 96 * 1024
+    assert children[0].stats()['io_bytes'] == 48 * 1024
+
+
+
+def test_jobs_must_agree_on_process_priority():
+    """Test that jobs setting different nice levels are not run in one process."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        config = make_config([
+            {'name': 'quiet', 'source': tmpdir, 'destination': tmpdir,
+             'config': {'sync': {'throttle': {'nice': 10}}}},
+            {'name': 'normal', 'source': tmpdir, 'destination': tmpdir},
+        ])
+        
+        with pytest.raises(ValueError):
+            JobScheduler(config).run()
+
+
+def test_job_priority_is_validated():
+    """Test that a job priority must be an integer."""
+    manager = ConfigManager()
+    manager.config['jobs'] = [{'name': 'home', 'source': '/home', 'destination': '/mnt',
+                               'priority': 'high'}]
+    assert not manager.validate()
+    with pytest.raises(ValueError):
+        JobScheduler(manager.config)
@@ -0,0 +1,88 @@
+"""Tests for delta-encoded backup manifests."""
+
+import json
+import pytest
+from pathlib import Path
+import tempfile
+from src.backup_manager import BackupManager
+from src.config_manager import ConfigManager
+from src.manifest import (DELTA_FILE, MANIFEST_FILE, is_checkpoint, load_manifest,
+                          save_manifest)
+
+
+def entry(content, mtime=1):
+    """Build a manifest entry."""
+    return {'hash': content, 'size': len(content), 'mtime_ns': mtime}
+
+
+def make_chain(root, states, interval):
+    """Save one backup per manifest state, each based on the previous one."""
+    paths = []
+    for i, state in enumerate(states):
+        path = root / f"incr_20240101_00000{i}"
+        path.mkdir()
+        (path / 'metadata.json').write_text('{}')
+        parent = paths[-1] if paths else None
+        save_manifest(path, state, parent, load_manifest(parent) if parent else None, interval)
+        paths.append(path)
+    return paths
+
+
+def test_deltas_store_only_changes_and_checkpoint_periodically():
+    """Test that incrementals store deltas and every Nth backup a checkpoint."""
+    states = [
+        {'a': entry('a'), 'b': entry('b'), 'c': entry('c')},
+        {'a': entry('a'), 'b': entry('B', 2), 'c': entry('c'), 'd': entry('d')},
+        {'a': entry('a'), 'b': entry('B', 2), 'd': entry('d')},
+        {'a': entry('A', 3), 'b': entry('B', 2), 'd': entry('d')},
+    ]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        paths = make_chain(Path(tmpdir), states, interval=2)
+        
+        assert [is_checkpoint(p) for p in paths] == [True, False, True, False]
+        
+        with open(paths[1] / DELTA_FILE) as f:
+            delta = json.load(f)
+        assert delta['added'] == {'d': entry('d')}
+        assert delta['changed'] == {'b': entry('B', 2)}
+        assert delta['removed'] == []
+        
+        for path, state in zip(paths, states):
+            assert load_manifest(path) == state
+
+
+def test_loaded_parents_end_the_delta_walk():
+    """Test that a chain stops at a manifest already loaded instead of re-reading it."""
+    states = [{'a': entry('a')}, {'a': entry('a'), 'b': entry('b')},
+              {'b': entry('b')}, {'b': entry('b'), 'c': entry('c')}]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        paths = make_chain(Path(tmpdir), states, interval=10)
+        
+        loaded = {}
+        for path, state in zip(paths, states):
+            loaded[path] = load_manifest(path, loaded)
+            assert loaded[path] == state
+        
+        # Only the last delta is read: the rest comes from loaded
+        (paths[0] / MANIFEST_FILE).unlink()
+        (paths[1] / DELTA_FILE).unlink()
+        assert load_manifest(paths[3], {paths[2]: states[2]}) == states[3]
+        assert states[2] == {'b': entry('b')}
+
+def test_cleanup_checkpoints_backups_that_depend_on_removed_ones():
+    """Test that retention keeps the remaining manifests loadable."""
+    states = [{'a': entry('a')}, {'a': entry('a'), 'b': entry('b')},
+              {'b': entry('b')}, {'b': entry('b'), 'c': entry('c')}]
+    config = ConfigManager().config
+    config['backup'] = dict(config['backup'], retain_versions=2)
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        paths = make_chain(Path(tmpdir), states, interval=10)
+        
+        BackupManager(config)._cleanup_old_backups(Path(tmpdir))
+        
+        assert not paths[0].exists() and not paths[1].exists()
+        assert is_checkpoint(paths[2])
+        assert not (paths[2] / DELTA_FILE).exists()
+        assert load_manifest(paths[2]) == states[2]
+        assert load_manifest(paths[3]) == states[3]
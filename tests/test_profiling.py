@@ -0,0 +1,77 @@
+"""Tests for the built-in profiler."""
+
+import pytest
+from pathlib import Path
+import tempfile
+from click.testing import CliRunner
+from src import profiling
+from src.cli import cli
+from src.profiling import Profiler, phase, profiled
+
+
+def test_phase_markers_are_noops_without_profiler():
+    """Test that markers do no bookkeeping when profiling is off."""
+    calls = []
+    
+    @profiled('work')
+    def work():
+        calls.append(1)
+        return 42
+    
+    assert profiling._active is None
+    assert phase('anything') is phase('other')
+    assert work() == 42
+    assert calls == [1]
+
+
+@pytest.mark.parametrize('mode', ['sample', 'cprofile'])
+def test_profiler_attributes_nested_phases(mode):
+    """Test that nested phases get their own time, memory and folded stacks."""
+    @profiled('inner')
+    def inner():
+        data = bytearray(4 * 1024 * 1024)
+        return len(data)
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        profiler = Profiler(Path(tmpdir), mode=mode, interval=0.001)
+        profiler.start()
+        try:
+            with phase('outer'):
+                for _ in range(3):
+                    inner()
+        finally:
+            written = profiler.stop()
+        
+        assert profiling._active is None
+        outer = profiler.phases[('outer',)]
+        nested = profiler.phases[('outer', 'inner')]
+        assert outer.calls == 1 and nested.calls == 3
+        assert outer.seconds >= nested.seconds
+        assert nested.peak_memory >= 4 * 1024 * 1024
+        assert outer.peak_memory >= nested.peak_memory
+        
+        names = {p.name for p in written}
+        assert {'summary.txt', 'phases.folded'} <= names
+        assert 'profile.pstats' in names if mode == 'cprofile' else True
+        folded = (Path(tmpdir) / 'phases.folded').read_text().splitlines()
+        assert any(line.startswith('outer;inner ') for line in folded)
+        assert 'outer' in (Path(tmpdir) / 'summary.txt').read_text()
+
+
+def test_cli_profile_option_writes_reports(monkeypatch):
+    """Test that --profile profiles a sync and reports its phases."""
+    runner = CliRunner()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # Keeps the default sync.log out of the working tree
+        monkeypatch.chdir(tmpdir)
+        root = Path(tmpdir)
+        (root / 'src').mkdir()
+        (root / 'src' / 'file.txt').write_text('content')
+        
+        result = runner.invoke(cli, ['--profile', '--profile-dir', str(root / 'prof'),
+                                     'sync', str(root / 'src'), str(root / 'dst')])
+        
+        assert result.exit_code == 0, result.output
+        folded = (root / 'prof' / 'phases.folded').read_text()
+        assert 'sync;scan' in folded
+        assert 'sync;copy' in folded
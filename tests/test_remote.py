@@ -0,0 +1,192 @@
+"""Tests for remote sync over the loopback protocol."""
+
+import os
+import pytest
+import socket
+from pathlib import Path
+import tempfile
+from src.config_manager import ConfigManager
+from src.remote import (OP_DELETE, OP_ERROR, OP_HELLO, OP_OK, RemoteSyncEngine, SyncServer,
+                        parse_remote, recv_frame, send_frame, send_json)
+
+
+def make_config(**sync_options):
+    """Build a config with small remote blocks so deltas are exercised."""
+    config = ConfigManager().config
+    config['sync'] = dict(config['sync'], **sync_options)
+    config['remote'] = {'window': 4, 'block_size': 1024}
+    return config
+
+
+@pytest.fixture
+def served_dir():
+    """Serve a temporary directory on 127.0.0.1 with an ephemeral port."""
+    with tempfile.TemporaryDirectory() as root:
+        server = SyncServer(Path(root), make_config(), port=0)
+        server.start()
+        yield Path(root), server.address
+        server.shutdown()
+
+
+def test_parse_remote():
+    """Test remote URL parsing."""
+    assert parse_remote('filesync://example.com:9000')[1] == ('example.com', 9000)
+    assert parse_remote('filesync+unix:///run/filesync.sock')[1] == '/run/filesync.sock'
+    assert parse_remote('/local/path') is None
+
+
+def test_remote_sync_copies_and_patches(served_dir):
+    """Test new files, block deltas and orphan deletion against a local server."""
+    remote_root, address = served_dir
+    
+    with tempfile.TemporaryDirectory() as source_dir:
+        source = Path(source_dir)
+        (source / 'sub').mkdir()
+        (source / 'sub' / 'new.txt').write_text('new file')
+        big = bytearray(os.urandom(10 * 1024))
+        (source / 'big.bin').write_bytes(big)
+        (remote_root / 'orphan.txt').write_text('orphan')
+        
+        config = make_config(mode='mirror', delete_orphaned=True)
+        stats = RemoteSyncEngine(source_dir, address, config, api_key='').sync()
+        assert stats['copied'] == 2
+        assert stats['deleted'] == 1
+        assert (remote_root / 'sub' / 'new.txt').read_text() == 'new file'
+        assert not (remote_root / 'orphan.txt').exists()
+        
+        # Change one block: only that block should be sent
+        big[5000] ^= 0xFF
+        (source / 'big.bin').write_bytes(big)
+        stats = RemoteSyncEngine(source_dir, address, config, api_key='').sync()
+        assert stats['updated'] == 1
+        assert stats['skipped'] == 1
+        assert stats['bytes_physical'] == 1024
+        assert (remote_root / 'big.bin').read_bytes() == bytes(big)
+
+
+def test_remote_bidirectional(served_dir):
+    """Test that destination-only files are fetched back into the source."""
+    remote_root, address = served_dir
+    
+    with tempfile.TemporaryDirectory() as source_dir:
+        (remote_root / 'deep').mkdir()
+        (remote_root / 'deep' / 'remote.txt').write_text('from remote')
+        
+        stats = RemoteSyncEngine(source_dir, address, make_config(mode='bidirectional'),
+                                 api_key='').sync()
+        assert stats['copied'] == 1
+        assert (Path(source_dir) / 'deep' / 'remote.txt').read_text() == 'from remote'
+
+
+def test_remote_fetch_failure_is_reported(served_dir):
+    """Test that a fetched file that cannot be committed counts as an error."""
+    remote_root, address = served_dir
+    
+    with tempfile.TemporaryDirectory() as source_dir:
+        (remote_root / 'remote.txt').write_text('from remote')
+        
+        engine = RemoteSyncEngine(source_dir, address, make_config(mode='bidirectional'),
+                                  api_key='')
+        
+        def no_rename(temp_path, destination, on_commit=None):
+            raise OSError(13, 'Permission denied')
+        
+        engine.copier.commit = no_rename
+        stats = engine.sync()
+        assert stats['copied'] == 0
+        assert stats['errors'] == 1
+        assert os.listdir(source_dir) == []
+
+
+def test_remote_fetch_that_cannot_start_is_reported(served_dir):
+    """Test that a fetch failing before its request is sent doesn't stop the sync."""
+    remote_root, address = served_dir
+    
+    with tempfile.TemporaryDirectory() as source_dir:
+        (remote_root / 'a.txt').write_text('a')
+        (remote_root / 'b.txt').write_text('b')
+        
+        engine = RemoteSyncEngine(source_dir, address, make_config(mode='bidirectional'),
+                                  api_key='')
+        temp_path_for = engine.copier.temp_path_for
+        
+        def read_only(destination):
+            if destination.name == 'a.txt':
+                raise OSError(30, 'Read-only file system')
+            return temp_path_for(destination)
+        
+        engine.copier.temp_path_for = read_only
+        stats = engine.sync()
+        assert stats['errors'] == 1
+        assert stats['copied'] == 1
+        assert (Path(source_dir) / 'b.txt').read_text() == 'b'
+
+
+def test_server_needs_api_key_off_loopback():
+    """Test that an unauthenticated server only listens on loopback."""
+    with tempfile.TemporaryDirectory() as root:
+        with pytest.raises(ValueError):
+            SyncServer(Path(root), make_config(), host='0.0.0.0', port=0)
+        server = SyncServer(Path(root), make_config(), host='0.0.0.0', port=0, api_key='secret')
+        server.start()
+        server.shutdown()
+
+
+def test_remote_symlinks_are_replaced_not_followed(served_dir):
+    """Test that updating or deleting a symlink in the served root leaves its target alone."""
+    remote_root, address = served_dir
+    
+    with tempfile.TemporaryDirectory() as source_dir:
+        (remote_root / 'target.txt').write_text('target')
+        (remote_root / 'link.txt').symlink_to('target.txt')
+        (remote_root / 'orphan.txt').symlink_to('target.txt')
+        (Path(source_dir) / 'target.txt').write_text('target')
+        (Path(source_dir) / 'link.txt').write_text('changed content')
+        
+        config = make_config(mode='mirror', delete_orphaned=True)
+        stats = RemoteSyncEngine(source_dir, address, config, api_key='').sync()
+        assert stats['errors'] == 0
+        assert (remote_root / 'target.txt').read_text() == 'target'
+        assert not (remote_root / 'link.txt').is_symlink()
+        assert (remote_root / 'link.txt').read_text() == 'changed content'
+        assert not os.path.lexists(remote_root / 'orphan.txt')
+
+
+def test_malformed_requests_get_error_replies(served_dir):
+    """Test that bad JSON and missing fields are answered with ERROR, keeping the connection."""
+    remote_root, address = served_dir
+    family, target = parse_remote(address)
+    
+    with socket.socket(family, socket.SOCK_STREAM) as sock:
+        sock.connect(target)
+        send_json(sock, OP_HELLO, 1, {})
+        assert recv_frame(sock)[0] == OP_OK
+        
+        send_frame(sock, OP_DELETE, 2, b'not json')
+        assert recv_frame(sock)[:2] == (OP_ERROR, 2)
+        send_json(sock, OP_DELETE, 3, {})
+        assert recv_frame(sock)[:2] == (OP_ERROR, 3)
+        send_json(sock, OP_DELETE, 4, {'path': 'missing.txt'})
+        assert recv_frame(sock)[:2] == (OP_ERROR, 4)
+
+
+def test_remote_unix_socket_with_api_key():
+    """Test a Unix socket server that requires an API key."""
+    with tempfile.TemporaryDirectory() as root, \
+         tempfile.TemporaryDirectory() as source_dir, \
+         tempfile.TemporaryDirectory() as socket_dir:
+        server = SyncServer(Path(root), make_config(), unix_socket=os.path.join(socket_dir, 'sock'),
+                            api_key='secret')
+        server.start()
+        try:
+            (Path(source_dir) / 'file.txt').write_text('content')
+            with pytest.raises(OSError):
+                RemoteSyncEngine(source_dir, server.address, make_config(), api_key='wrong').sync()
+            
+            stats = RemoteSyncEngine(source_dir, server.address, make_config(),
+                                     api_key='secret').sync()
+            assert stats['copied'] == 1
+            assert stats['errors'] == 0
+            assert (Path(root) / 'file.txt').read_text() == 'content'
+        finally:
+            server.shutdown()
@@ -0,0 +1,126 @@
+"""Tests for copy scheduling and freshness reporting."""
+
+import os
+import pytest
+from pathlib import Path
+import tempfile
+from src.config_manager import ConfigManager
+from src import scheduling
+from src.scheduling import latency_stats, readahead, schedule
+from src.sync_engine import SyncEngine
+from src.utils import disk_positions
+
+
+ITEMS = [('a/big.iso', 5000, 1), ('b/old.txt', 10, 2), ('c/new.cfg', 20, 9), ('etc/app.conf', 30, 3)]
+
+
+def describe(item):
+    return item
+
+
+@pytest.mark.parametrize('order, globs, expected', [
+    ('walk', [], ['a/big.iso', 'b/old.txt', 'c/new.cfg', 'etc/app.conf']),
+    ('mtime_desc', [], ['c/new.cfg', 'etc/app.conf', 'b/old.txt', 'a/big.iso']),
+    ('size_asc', [], ['b/old.txt', 'c/new.cfg', 'etc/app.conf', 'a/big.iso']),
+    ('priority_globs', ['etc/*', '*.cfg'], ['etc/app.conf', 'c/new.cfg', 'a/big.iso', 'b/old.txt']),
+    ('size_asc', ['*.iso'], ['a/big.iso', 'b/old.txt', 'c/new.cfg', 'etc/app.conf']),
+])
+def test_schedule_orders(order, globs, expected):
+    """Test each order, with priority globs taking precedence."""
+    assert [item[0] for item in schedule(ITEMS, order, globs, describe)] == expected
+
+
+def test_schedule_rejects_unknown_order():
+    with pytest.raises(ValueError):
+        schedule(ITEMS, 'random', [], describe)
+
+
+def test_physical_order_follows_disk_positions(monkeypatch):
+    """Test that physical order sorts by disk position within each priority band."""
+    positions = {'a/big.iso': (0, 300), 'b/old.txt': (0, 100), 'c/new.cfg': (1, 5), 'etc/app.conf': (0, 200)}
+    monkeypatch.setattr(scheduling, 'disk_positions', lambda paths: [positions[p] for p in paths])
+    
+    ordered = schedule(ITEMS, 'physical', [], describe, locate=lambda item: item[0])
+    assert [item[0] for item in ordered] == ['b/old.txt', 'etc/app.conf', 'a/big.iso', 'c/new.cfg']
+    ordered = schedule(ITEMS, 'physical', ['*.iso'], describe, locate=lambda item: item[0])
+    assert [item[0] for item in ordered] == ['a/big.iso', 'b/old.txt', 'etc/app.conf', 'c/new.cfg']
+    with pytest.raises(ValueError):
+        schedule(ITEMS, 'physical', [], describe)
+
+
+def test_disk_positions_and_readahead():
+    """Test extent lookups (or the inode fallback) and that readahead keeps every item."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        paths = [Path(tmpdir) / name for name in ('one', 'two', 'empty')]
+        paths[0].write_bytes(os.urandom(8192))
+        paths[1].write_bytes(os.urandom(8192))
+        paths[2].touch()
+        os.sync()
+        
+        positions = disk_positions(paths + [Path(tmpdir) / 'missing'])
+        for kind, position in positions[:2]:
+            assert kind == 1 or position > 0
+        assert positions[2] in ((0, 0), (1, paths[2].stat().st_ino))
+        assert positions[3] == (1, 0)
+        
+        assert list(readahead(paths, lambda path: path, window=1)) == paths
+
+
+def test_latency_stats():
+    """Test the percentile summary."""
+    stats = latency_stats([i / 100 for i in range(1, 101)])
+    
+    assert stats == {'latency_p50': 0.51, 'latency_p90': 0.91, 'latency_p99': 1.0, 'latency_max': 1.0}
+    assert latency_stats([]) == {}
+
+
+def test_sync_copies_priority_files_first_and_reports_latency():
+    """Test that the engine follows the order and commits priority files early."""
+    config = ConfigManager().config
+    config['sync'] = dict(config['sync'], mode='mirror', order='size_asc',
+                          priority_globs=['conf/*'], durability='batch')
+    
+    with tempfile.TemporaryDirectory() as source_dir, \
+         tempfile.TemporaryDirectory() as dest_dir:
+        source = Path(source_dir)
+        (source / 'conf').mkdir()
+        (source / 'conf' / 'app.yaml').write_bytes(b'x' * 300)
+        (source / 'large.bin').write_bytes(b'x' * 200)
+        (source / 'small.txt').write_bytes(b'x' * 100)
+        
+        engine = SyncEngine(source_dir, dest_dir, config)
+        copied = []
+        original_copy = engine.copier.copy
+        
+        def recording_copy(src, dst, *args, **kwargs):
+            # The priority file must already be visible once the rest start
+            copied.append((src.name, (Path(dest_dir) / 'conf' / 'app.yaml').exists()))
+            return original_copy(src, dst, *args, **kwargs)
+        
+        engine.copier.copy = recording_copy
+        stats = engine.sync()
+        
+        assert copied == [('app.yaml', False), ('small.txt', True), ('large.bin', True)]
+        assert stats['copied'] == 3
+        assert stats['latency_max'] >= stats['latency_p50'] >= 0
+        assert stats['priority_latency_max'] <= stats['latency_max']
+
+
+def test_sync_in_physical_order():
+    """Test that a physical-order sync copies and compares every file."""
+    config = ConfigManager().config
+    config['sync'] = dict(config['sync'], mode='mirror', order='physical', check_timestamps=False)
+    
+    with tempfile.TemporaryDirectory() as source_dir, \
+         tempfile.TemporaryDirectory() as dest_dir:
+        for i in range(10):
+            (Path(source_dir) / f"file{i}.bin").write_bytes(os.urandom(1000))
+        
+        assert SyncEngine(source_dir, dest_dir, config).sync()['copied'] == 10
+        # Same sizes, different contents: only a hash comparison tells them apart
+        (Path(source_dir) / 'file3.bin').write_bytes(os.urandom(1000))
+        stats = SyncEngine(source_dir, dest_dir, config).sync()
+        
+        assert stats['updated'] == 1
+        assert stats['skipped'] == 9
+        assert (Path(dest_dir) / 'file3.bin').read_bytes() == (Path(source_dir) / 'file3.bin').read_bytes()
@@ -0,0 +1,63 @@
+"""Tests for backup scrubbing."""
+
+import json
+import pytest
+from pathlib import Path
+import tempfile
+from src.backup_manager import BackupManager
+from src.config_manager import ConfigManager
+from src.scrub import Scrubber, SCRUB_STATE_FILE
+
+
+def make_backup(source, backup_dir, pack_threshold=0):
+    """Create a full backup of source and return its path."""
+    config = ConfigManager().config
+    config['sync'] = dict(config['sync'], durability='none')
+    config['backup'] = dict(config['backup'], type='full', pack_threshold=pack_threshold)
+    manager = BackupManager(config)
+    result = manager.create_backup(source, backup_dir)
+    return config, backup_dir / f"full_{result['timestamp']}"
+
+
+def test_scrub_detects_corruption():
+    """Test that loose and packed files are checked and corruption is reported."""
+    with tempfile.TemporaryDirectory() as source_dir, \
+         tempfile.TemporaryDirectory() as backup_dir:
+        source = Path(source_dir)
+        (source / 'big.bin').write_bytes(b'b' * 4000)
+        (source / 'small.txt').write_text('small')
+        config, backup = make_backup(source, Path(backup_dir), pack_threshold=1000)
+        
+        result = Scrubber(config).scrub(Path(backup_dir))
+        assert result['verified'] == 2
+        assert result['corrupt'] == 0
+        assert result['remaining'] == 0
+        
+        (backup / 'big.bin').write_bytes(b'B' * 4000)
+        result = Scrubber(config).scrub(Path(backup_dir))
+        
+        assert result['corrupt'] == 1
+        assert result['corrupt_files'] == [f"{backup.name}/big.bin"]
+
+
+def test_scrub_budget_resumes_with_least_recently_verified():
+    """Test that budgeted runs continue with files not yet verified."""
+    with tempfile.TemporaryDirectory() as source_dir, \
+         tempfile.TemporaryDirectory() as backup_dir:
+        source = Path(source_dir)
+        for i in range(6):
+            (source / f'file{i}.txt').write_text('x' * 100)
+        config, backup = make_backup(source, Path(backup_dir))
+        config['scrub'] = dict(config['scrub'], workers=1)
+        
+        first = Scrubber(config).scrub(Path(backup_dir), max_bytes=300)
+        assert first['verified'] == 3
+        assert first['remaining'] == 3
+        
+        second = Scrubber(config).scrub(Path(backup_dir), max_bytes=300)
+        assert second['verified'] == 3
+        
+        with open(Path(backup_dir) / SCRUB_STATE_FILE) as f:
+            state = json.load(f)['files']
+        assert len(state) == 6
+        assert all(ok for _, ok in state.values())
@@ -0,0 +1,57 @@
+"""Tests for sharded synchronization."""
+
+import pytest
+from pathlib import Path
+import tempfile
+from src.config_manager import ConfigManager
+from src.file_scanner import FileScanner
+from src.sharding import ShardedSyncEngine, plan_shards
+
+
+def make_tree(root, paths):
+    """Create files at the given relative paths."""
+    for relative in paths:
+        path = Path(root) / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(relative)
+
+
+def test_plan_covers_every_file_once():
+    """Test that shard units partition the union of both trees."""
+    scanner = FileScanner({'exclude': [], 'include': ['*']})
+    source_files = [f'big/part{p}/f{i}.txt' for p in range(4) for i in range(10)]
+    source_files += ['top.txt', 'big/loose.txt', 'small/one.txt']
+    dest_files = ['big/part1/f0.txt', 'dest_only/x.txt', 'big/dest_sub/y.txt']
+    
+    with tempfile.TemporaryDirectory() as source_dir, \
+         tempfile.TemporaryDirectory() as dest_dir:
+        make_tree(source_dir, source_files)
+        make_tree(dest_dir, dest_files)
+        
+        plan = plan_shards(scanner, [Path(source_dir), Path(dest_dir)], 4)
+        assert 1 < len(plan) <= 4
+        
+        seen = []
+        for units in plan:
+            seen += scanner.scan_table(Path(source_dir), units)
+            seen += scanner.scan_table(Path(dest_dir), units)
+        assert sorted(seen) == sorted(str(Path(p)) for p in source_files + dest_files)
+
+
+def test_sharded_sync():
+    """Test that a sharded sync copies, copies back and deletes like a single engine."""
+    config = ConfigManager().config
+    config['sync'] = dict(config['sync'], mode='mirror', delete_orphaned=True)
+    
+    with tempfile.TemporaryDirectory() as source_dir, \
+         tempfile.TemporaryDirectory() as dest_dir:
+        make_tree(source_dir, [f'd{d}/f{i}.txt' for d in range(3) for i in range(5)])
+        make_tree(dest_dir, ['d1/orphan.txt', 'gone/orphan.txt'])
+        
+        stats = ShardedSyncEngine(source_dir, dest_dir, config, shards=3).sync()
+        
+        assert stats['copied'] == 15
+        assert stats['deleted'] == 2
+        assert stats['errors'] == 0
+        assert not (Path(dest_dir) / 'gone' / 'orphan.txt').exists()
+        assert (Path(dest_dir) / 'd2' / 'f4.txt').read_text() == 'd2/f4.txt'
@@ -1,10 +1,13 @@
 """Tests for sync engine."""
 
+import os
 import pytest
+import time
 from pathlib import Path
 import tempfile
 from src.sync_engine import SyncEngine
 from src.config_manager import ConfigManager
+from src.utils import TEMP_PREFIX
 
 
 def test_sync_new_files():
@@ -55,3 +58,85 @@ def test_sync_modified_files():
         
         assert stats['updated'] >= 1
         assert (dest_path / 'file.txt').read_text() == 'modified content'
+
+
+def test_sync_orphans_and_bidirectional():
+    """Test that destination-only files are copied back or deleted."""
+    config = ConfigManager().config
+    config['sync'] = dict(config['sync'], mode='mirror', delete_orphaned=True)
+    
+    with tempfile.TemporaryDirectory() as source_dir, \
+         tempfile.TemporaryDirectory() as dest_dir:
+        
+        source_path = Path(source_dir)
+        dest_path = Path(dest_dir)
+        (source_path / 'keep.txt').write_text('keep')
+        (dest_path / 'sub').mkdir()
+        (dest_path / 'sub' / 'orphan.txt').write_text('orphan')
+        
+        stats = SyncEngine(source_dir, dest_dir, config).sync()
+        assert stats['deleted'] == 1
+        assert not (dest_path / 'sub' / 'orphan.txt').exists()
+        
+        (dest_path / 'extra.txt').write_text('extra')
+        config['sync'] = dict(config['sync'], mode='bidirectional', delete_orphaned=False)
+        SyncEngine(source_dir, dest_dir, config).sync()
+        assert (source_path / 'extra.txt').read_text() == 'extra'
+
+
+def test_hash_cache_avoids_rehashing(monkeypatch):
+    """Test that unchanged same-size files are compared through the hash cache."""
+    config = ConfigManager().config
+    config['sync'] = dict(config['sync'], hash_cache=True, mode='mirror')
+    
+    with tempfile.TemporaryDirectory() as source_dir, \
+         tempfile.TemporaryDirectory() as dest_dir, \
+         tempfile.TemporaryDirectory() as cache_dir:
+        monkeypatch.setenv('XDG_CACHE_HOME', cache_dir)
+        (Path(source_dir) / 'file.txt').write_text('content')
+        
+        assert SyncEngine(source_dir, dest_dir, config).sync()['copied'] == 1
+        
+        # The copy filled the cache for both sides, so nothing is read again
+        engine = SyncEngine(source_dir, dest_dir, config)
+        monkeypatch.setattr(engine.hasher, 'hash_file', lambda path: pytest.fail('re-hashed'))
+        stats = engine.sync()
+        
+        assert stats['skipped'] == 1
+        assert stats['hash_cache_hits'] == 2
+
+
+def test_hash_cache_default_matches_shipped_config():
+    """Test that the hash cache is off with or without the shipped config.yaml."""
+    with tempfile.TemporaryDirectory() as source_dir, \
+         tempfile.TemporaryDirectory() as dest_dir, \
+         tempfile.TemporaryDirectory() as cache_dir:
+        shipped = ConfigManager(Path(__file__).parent.parent / 'config.yaml', cache_dir=Path(cache_dir))
+        assert shipped.get('sync.hash_cache') == ConfigManager().get('sync.hash_cache') == False
+        
+        engine = SyncEngine(source_dir, dest_dir, ConfigManager().config)
+        assert engine.source_cache is None
+        assert engine.dest_cache is None
+
+
+def test_sync_removes_stale_temp_files():
+    """Test that temp files left by an interrupted run are removed by the next sync."""
+    config = ConfigManager().config
+    config['sync'] = dict(config['sync'], mode='mirror')
+    
+    with tempfile.TemporaryDirectory() as source_dir, \
+         tempfile.TemporaryDirectory() as dest_dir:
+        (Path(source_dir) / 'file.txt').write_text('content')
+        stale = Path(dest_dir) / f"{TEMP_PREFIX}1-0-file.txt"
+        stale.write_text('cont')
+        
+        engine = SyncEngine(source_dir, dest_dir, config)
+        # Anything created since the run started may belong to a copy in flight
+        engine.begin()
+        engine.scanner.sweep_before = time.time() - 3600
+        engine.scanner.scan_table(Path(dest_dir))
+        assert stale.exists()
+        
+        stats = SyncEngine(source_dir, dest_dir, config).sync()
+        assert stats['temp_files_removed'] == 1
+        assert sorted(os.listdir(dest_dir)) == ['file.txt']
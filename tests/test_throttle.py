@@ -0,0 +1,85 @@
+"""Tests for I/O throttling."""
+
+import time
+from datetime import datetime
+from pathlib import Path
+import tempfile
+from src.copier import FileCopier
+from src.throttle import Throttle, TokenBucket, split_config, throttle_settings
+
+
+def test_token_bucket_limits_rate():
+    """Test that consuming past the burst sleeps for the debt."""
+    bucket = TokenBucket(10000)
+    
+    assert bucket.consume(10000) == 0.0
+    start = time.monotonic()
+    waited = bucket.consume(2000)
+    
+    assert waited > 0.1
+    assert time.monotonic() - start >= waited * 0.9
+
+
+def test_unlimited_bucket_never_waits():
+    """Test that a zero rate means unlimited."""
+    bucket = TokenBucket(0)
+    assert bucket.consume(10 ** 12) == 0.0
+
+
+def test_time_windows_override_limits():
+    """Test that the first matching window (including across midnight) wins."""
+    throttle = Throttle(bytes_per_sec=1000, iops=10, windows=[
+        {'start': '09:00', 'end': '18:00', 'days': ['mon', 'tue', 'wed', 'thu', 'fri'],
+         'bytes_per_sec': 100, 'iops': 5},
+        {'start': '22:00', 'end': '06:00', 'bytes_per_sec': 0, 'iops': 0},
+    ])
+    
+    # 2024-01-08 is a Monday
+    assert throttle.limits(datetime(2024, 1, 8, 10, 30)) == (100, 5)
+    assert throttle.limits(datetime(2024, 1, 13, 10, 30)) == (1000, 10)
+    assert throttle.limits(datetime(2024, 1, 8, 23, 0)) == (0, 0)
+    assert throttle.limits(datetime(2024, 1, 8, 5, 59)) == (0, 0)
+    assert throttle.limits(datetime(2024, 1, 8, 19, 0)) == (1000, 10)
+
+
+def test_job_overrides_and_split():
+    """Test per-job overrides and dividing limits between processes."""
+    config = {
+        'throttle': {'bytes_per_sec': 1000, 'iops': 100},
+        'sync': {'throttle': {'iops': 40, 'windows': [{'start': '00:00', 'end': '12:00',
+                                                       'bytes_per_sec': 400}]}}
+    }
+    
+    assert throttle_settings(config, 'sync')['iops'] == 40
+    assert throttle_settings(config, 'backup')['iops'] == 100
+    
+    split = throttle_settings(split_config(config, 'sync', 4), 'sync')
+    assert split['bytes_per_sec'] == 250
+    assert split['iops'] == 10
+    assert split['windows'][0]['bytes_per_sec'] == 100
+    # The original config is left untouched
+    assert config['sync']['throttle']['iops'] == 40
+
+
+def test_copier_reports_rates():
+    """Test that copies are throttled and their rates reported."""
+    config = {'sync': {'durability': 'none', 'buffer_size': 4096},
+              'throttle': {'bytes_per_sec': 64 * 1024}}
+    throttle = Throttle.from_config(config)
+    copier = FileCopier(config, throttle=throttle)
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        source = Path(tmpdir) / 'source.bin'
+        source.write_bytes(b'x' * 48 * 1024)
+        
+        start = time.monotonic()
+        copier.copy(source, Path(tmpdir) / 'dest.bin')
+        elapsed = time.monotonic() - start
+        
+        stats = throttle.stats()
+        # 48K read + 48K written against 64K/s with a one second burst
+        assert elapsed > 0.3
+        assert stats['limit_bytes_per_sec'] == 64 * 1024
+        assert stats['rate_iops'] > 0
+        assert stats['throttled_seconds'] > 0
+        assert copier.hasher.throttle is throttle
@@ -0,0 +1,98 @@
+"""Tests for the stall watchdog."""
+
+import threading
+import time
+import pytest
+from pathlib import Path
+import tempfile
+from src import watchdog
+from src.config_manager import ConfigManager
+from src.sync_engine import SyncEngine
+from src.watchdog import RetryQueue, Stalled, Watchdog
+
+
+def test_blocked_call_is_abandoned():
+    """Test that a call without progress raises Stalled and the next call still runs."""
+    dog = Watchdog(stall_timeout=0.1)
+    release = threading.Event()
+    try:
+        started = time.monotonic()
+        with pytest.raises(Stalled):
+            dog.call('/mnt/hung/file', 100, release.wait)
+        assert time.monotonic() - started < 2
+        assert dog.call('/mnt/ok/file', 100, lambda: 'done') == 'done'
+    finally:
+        release.set()
+    
+    stats = dog.stats()
+    assert stats['stalled'] == 1
+    assert stats['stalled_paths'] == ['/mnt/hung/file']
+    assert stats['stall_seconds'] >= 0.1
+
+
+def test_deadlines_follow_progress_and_size():
+    """Test that progress resets the stall timer but not the per-file deadline."""
+    def slow_copy(seconds):
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            watchdog.progress(4096)
+            time.sleep(0.02)
+        return 'copied'
+    
+    # Steady progress never trips the stall timeout
+    assert Watchdog(stall_timeout=0.1).call('a', 0, slow_copy, 0.3) == 'copied'
+    # A small file gets little time; a large one gets more per byte
+    dog = Watchdog(file_timeout=0.05, bytes_per_sec=1000)
+    with pytest.raises(Stalled):
+        dog.call('small', 100, slow_copy, 0.5)
+    assert dog.call('large', 1000, slow_copy, 0.3) == 'copied'
+
+
+def test_retry_queue_offers_stalled_items_again():
+    """Test that stalled items come back once per retry, after the others."""
+    work = RetryQueue(['a', 'b', 'c'], retries=1)
+    seen = []
+    for item in work:
+        seen.append(item)
+        if item == 'b':
+            work.stall(item)
+    assert seen == ['a', 'b', 'c', 'b']
+    assert not work.stall('b')
+
+
+def test_sync_retries_stalled_files():
+    """Test that a sync skips past a hung file, retries it and reports the stall."""
+    with tempfile.TemporaryDirectory() as source_dir, \
+         tempfile.TemporaryDirectory() as dest_dir:
+        for name in ('flaky.txt', 'hung.txt', 'ok.txt'):
+            (Path(source_dir) / name).write_text(name)
+        config = ConfigManager().config
+        config['sync'] = dict(config['sync'], mode='mirror')
+        config['watchdog'] = {'stall_timeout': 0.1, 'retries': 1}
+        engine = SyncEngine(source_dir, dest_dir, config)
+        
+        release = threading.Event()
+        attempts = []
+        real_copy = engine.copier.copy
+        
+        def copy(source, destination, on_commit=None, **kwargs):
+            attempts.append(source.name)
+            # flaky.txt hangs once, hung.txt every time
+            if source.name == 'hung.txt' or attempts == ['flaky.txt']:
+                release.wait()
+            return real_copy(source, destination, on_commit=on_commit, **kwargs)
+        
+        engine.copier.copy = copy
+        try:
+            stats = engine.sync()
+        finally:
+            release.set()
+        
+        assert attempts == ['flaky.txt', 'hung.txt', 'ok.txt', 'flaky.txt', 'hung.txt']
+        assert stats['copied'] == 2
+        assert stats['errors'] == 1
+        assert stats['stalled'] == 3
+        assert stats['stalled_paths'] == [str(Path(source_dir) / 'flaky.txt'),
+                                          str(Path(source_dir) / 'hung.txt')]
+        assert (Path(dest_dir) / 'flaky.txt').read_text() == 'flaky.txt'
+        assert not (Path(dest_dir) / 'hung.txt').exists()